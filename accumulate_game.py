@@ -6,6 +6,17 @@ import numpy as np
 from collections import defaultdict
 import glob
 
+from dangerous_shot import merge_shots_strength
+from shot_danger import shot_danger_scorer, load_shot_index
+from feature_schema import has_accumulated_data, save_accumulated_data
+from schedule_sync import game_data_exists
+import instrumentation
+from instrumentation import count, progress, stage
+
+
+def data_folder():
+    return os.path.join(os.path.dirname(__file__), "data")
+
 
 def shift_distribution(player_shifts, player_totals, timestamp):
     timestamp_shifts = []
@@ -31,20 +42,47 @@ def shift_distribution(player_shifts, player_totals, timestamp):
     return player_shifts, player_totals, timestamp_shifts
 
 
-def accumulate(season_year, game_id):
-    data_directory_exists = os.path.isdir(
-        os.path.join(os.path.dirname(__file__), "data")
+def game_shot_danger(live_df, pbp_df, shot_scorer):
+    # danger of every shot and goal in the live data scored in one call, 0 for the other rows
+    # shots the feed gives no coordinates for have nan shot_x, shot_y (0, 0 in live data saved before), the scorer
+    #  looks both up at center ice
+    is_shot = live_df["event"].isin(["Shot", "Missed Shot", "Goal"]).to_numpy()
+    shots_df = live_df.loc[
+        is_shot, ["gameId", "playId", "event", "timestamp", "shot_x", "shot_y"]
+    ].copy()
+    shots_df["side"] = np.where(
+        (live_df.loc[is_shot, "home_shot"] == 1).to_numpy(), "home", "away"
     )
+    shots_df["shooter_id"] = -1
+    shots_df["goalie_id"] = -1
+
+    home_danger = np.zeros(len(live_df))
+    away_danger = np.zeros(len(live_df))
+    if not len(shots_df):
+        return home_danger, away_danger
+
+    shots_df = merge_shots_strength(shots_df, pbp_df)
+    danger = shot_scorer(shots_df)
+
+    positions = pd.Series(np.arange(len(live_df)), index=live_df["playId"].to_numpy())
+    shot_positions = positions.loc[shots_df["playId"].to_numpy()].to_numpy()
+    is_home = shots_df["side"].to_numpy() == "home"
+    home_danger[shot_positions[is_home]] = danger[is_home]
+    away_danger[shot_positions[~is_home]] = danger[~is_home]
+    return home_danger, away_danger
+
+
+def accumulate(season_year, game_id, shot_scorer=None):
+    data_directory_exists = os.path.isdir(data_folder())
     season_year_directory_exists = os.path.isdir(
-        os.path.join(os.path.dirname(__file__), "data", season_year)
+        os.path.join(data_folder(), season_year)
     )
     game_directory_exists = os.path.isdir(
-        os.path.join(os.path.dirname(__file__), "data", season_year, game_id)
+        os.path.join(data_folder(), season_year, game_id)
     )
     live_data_exists = os.path.isfile(
         os.path.join(
-            os.path.dirname(__file__),
-            "data",
+            data_folder(),
             season_year,
             game_id,
             "live_data.csv",
@@ -52,8 +90,7 @@ def accumulate(season_year, game_id):
     )
     pbp_data_exists = os.path.isfile(
         os.path.join(
-            os.path.dirname(__file__),
-            "data",
+            data_folder(),
             season_year,
             game_id,
             "pbp_data.csv",
@@ -61,8 +98,7 @@ def accumulate(season_year, game_id):
     )
     away_shifts_data_exists = os.path.isfile(
         os.path.join(
-            os.path.dirname(__file__),
-            "data",
+            data_folder(),
             season_year,
             game_id,
             "away_shifts_data.csv",
@@ -70,8 +106,7 @@ def accumulate(season_year, game_id):
     )
     home_shifts_data_exists = os.path.isfile(
         os.path.join(
-            os.path.dirname(__file__),
-            "data",
+            data_folder(),
             season_year,
             game_id,
             "home_shifts_data.csv",
@@ -90,8 +125,7 @@ def accumulate(season_year, game_id):
 
     live_df = pd.read_csv(
         os.path.join(
-            os.path.dirname(__file__),
-            "data",
+            data_folder(),
             season_year,
             game_id,
             "live_data.csv",
@@ -100,8 +134,7 @@ def accumulate(season_year, game_id):
 
     pbp_df = pd.read_csv(
         os.path.join(
-            os.path.dirname(__file__),
-            "data",
+            data_folder(),
             season_year,
             game_id,
             "pbp_data.csv",
@@ -110,8 +143,7 @@ def accumulate(season_year, game_id):
 
     home_shifts_df = pd.read_csv(
         os.path.join(
-            os.path.dirname(__file__),
-            "data",
+            data_folder(),
             season_year,
             game_id,
             "home_shifts_data.csv",
@@ -120,8 +152,7 @@ def accumulate(season_year, game_id):
 
     away_shifts_df = pd.read_csv(
         os.path.join(
-            os.path.dirname(__file__),
-            "data",
+            data_folder(),
             season_year,
             game_id,
             "away_shifts_data.csv",
@@ -154,8 +185,11 @@ def accumulate(season_year, game_id):
         "goalie_change": [],  # -1 away goalie change, 0 neither or even, 1 home goalie change
         "toi_skew_differential": [],
         "last_goal": [],  # -1 for away, 0 none, 1 home
-        # hope is to add in the danger of shots by where they are taken and how often they go in
     }
+    if shot_scorer is not None:
+        # expected goals from the danger of shots by where they are taken and how often they go in
+        accumulate_dict["xg_differential"] = []
+        accumulate_dict["xg_total"] = []
 
     live_to_pbp_event = {
         "Game Official": "GEND",
@@ -192,8 +226,14 @@ def accumulate(season_year, game_id):
     start = time.time()
     skipped_rows = 0
 
+    if shot_scorer is not None:
+        # running sums over every live row, so the first shot and shots of skipped rows are counted too
+        home_danger, away_danger = game_shot_danger(live_df, pbp_df, shot_scorer)
+        running_xg_differential = np.cumsum(home_danger - away_danger)
+        running_xg_total = np.cumsum(home_danger + away_danger)
+
     # go through the live_data and use that as the main data, reach out to others as needed
-    for _, row in live_df.iterrows():
+    for row_ind, (_, row) in enumerate(live_df.iterrows()):
         # record gameId, playId
         gameId = row["gameId"]
         playId = row["playId"]
@@ -382,13 +422,20 @@ def accumulate(season_year, game_id):
             else:
                 accumulate_dict["last_goal"].append(accumulate_dict["last_goal"][-1])
 
+        if shot_scorer is not None:
+            accumulate_dict["xg_differential"].append(running_xg_differential[row_ind])
+            accumulate_dict["xg_total"].append(running_xg_total[row_ind])
+
         assert all(
             len(vals) == len(accumulate_dict["gameId"])
             for vals in accumulate_dict.values()
         )
 
     end = time.time()
-    print(f"Finished playId {game_id} in {end-start:.2f} seconds.")
+    instrumentation.add_time("game.accumulate", end - start, game_id=game_id)
+    count("rows.accumulate", len(accumulate_dict["gameId"]))
+    count("skipped_rows.accumulate", skipped_rows)
+    progress(f"Finished gameId {game_id} in {end-start:.2f} seconds.", game_id=game_id)
 
     # add in home_win with 1 for true and 0 for false and same length as the rest of the columns
     if live_df["home_win"].to_list()[-1]:
@@ -402,22 +449,26 @@ def accumulate(season_year, game_id):
 
 
 def save_accumulation(accumulate_dict, season_year, game_id):
-    # save this in the same folder as the other game dfs
+    # save this in the same folder as the other game dfs, stored with the feature schema dtypes
     accumulate_df = pd.DataFrame(accumulate_dict)
-    filename = os.path.join("data", season_year, game_id, "accumulated_data.csv")
-    accumulate_df.to_csv(filename, index=False)
+    save_accumulated_data(accumulate_df, os.path.join("data", season_year, game_id))
 
 
-def accumulate_season(season_year):
+def accumulate_season(season_year, shot_scorer=None):
+    # shot_scorer takes a DataFrame of a game's shots (see dangerous_shot.merge_shots_strength) and returns the
+    #  probability each one is a goal, when given the expected goals columns are added
     assert os.path.isdir("data")
     assert os.path.isdir(os.path.join("data", season_year))
     game_folders = glob.glob(os.path.join("data", season_year, "*"))
     for game_folder in game_folders:
         game_id = Path(game_folder).stem
-        if os.path.isfile(os.path.join(game_folder, "accumulated_data.csv")):
-            print(f"Accumulated data for {game_id} has been found. Continuing.")
+        # season files and folders of games only partly saved (e.g. the shots dangerous_shot.py fetched) are skipped
+        if not game_data_exists(season_year, game_id):
             continue
-        accumulate_dict = accumulate(season_year, game_id)
+        if has_accumulated_data(game_folder):
+            count("cache_hits.accumulate")
+            continue
+        accumulate_dict = accumulate(season_year, game_id, shot_scorer=shot_scorer)
         save_accumulation(accumulate_dict, season_year, game_id)
 
 
@@ -425,8 +476,10 @@ if __name__ == "__main__":
     season_year = "20202021"
     game_id = "2019020010"
 
-    start = time.time()
-    accumulate_season(season_year)
-    end = time.time()
+    # set to add expected goals columns from the shot index built by shot_danger.py
+    use_shot_danger = False
+    shot_scorer = shot_danger_scorer(load_shot_index()) if use_shot_danger else None
 
-    print(f"This took {end-start:.2f} seconds")
+    with stage("accumulate", season=season_year):
+        accumulate_season(season_year, shot_scorer=shot_scorer)
+    instrumentation.finish()
@@ -0,0 +1,524 @@
+import os
+import re
+import sys
+import json
+import time
+import shutil
+import resource
+import subprocess
+import multiprocessing
+from glob import glob
+from datetime import datetime
+from urllib.parse import unquote
+from concurrent.futures import ProcessPoolExecutor
+
+# end to end benchmark of the pipeline on a fixed corpus served by fixture_server.py
+# every stage runs in a fresh process so its peak RSS is its own, only the stage itself is timed (reading its inputs
+#  and writing its outputs for the next stage are not), and every run is appended to benchmarks/history.jsonl
+# a stage regresses when its rows per second drop, or its peak RSS grows, by more than threshold against the median
+#  of the last baseline_runs runs on the same corpus
+# intermediate files go to data/benchmark-{corpus} and benchmarks/work (the player identity index too), the real data
+#  and model folders are untouched
+# the corpus is not committed, record it first (see fixture_server.py), e.g. for the default corpus
+#  python fixture_server.py --corpus default --record-games 2021020001 2021020002 2021020003 2021020004 2021020005
+
+stages = [
+    "fetch",
+    "parse_live_feed",
+    "parse_pbp",
+    "parse_shifts",
+    "accumulate",
+    "load_data",
+    "train",
+    "predict",
+    "plot",
+]
+
+
+def benchmarks_folder():
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmarks")
+
+
+def work_folder(corpus):
+    return os.path.join(benchmarks_folder(), "work", corpus)
+
+
+def benchmark_season(corpus):
+    # accumulate and the game index only use the season as a folder name
+    return f"benchmark-{corpus}"
+
+
+def corpus_game_ids(corpus):
+    from fixture_server import fixtures_folder
+
+    filenames = glob(os.path.join(fixtures_folder(), corpus, "statsapi", "*"))
+    game_ids = []
+    for filename in filenames:
+        match = re.fullmatch(
+            r"/game/(\d+)/feed/live", unquote(os.path.basename(filename))
+        )
+        if match is not None:
+            game_ids.append(match.group(1))
+    return sorted(game_ids)
+
+
+def read_fixture(corpus, url):
+    # the document the fixture server would answer url with
+    from fixture_server import fixtures_folder, fixture_filename
+    from nhl_requests import base_urls
+
+    for base, base_url in base_urls.items():
+        if url.startswith(base_url):
+            filename = fixture_filename(
+                os.path.join(fixtures_folder(), corpus), base, url[len(base_url) :]
+            )
+            with open(filename, "rb") as rf:
+                return rf.read()
+    raise ValueError(f"{url} is not under any of the base urls {base_urls}.")
+
+
+def game_folder(corpus, game_id):
+    return os.path.join("data", benchmark_season(corpus), game_id)
+
+
+# every stage is (prepare, run, finish): prepare(corpus, game_ids) -> inputs, run(inputs) -> (rows, outputs) is the
+#  timed part, finish(corpus, outputs) saves what later stages need
+# prepare also imports the modules run uses so import time is not counted
+
+
+def _prepare_fetch(corpus, game_ids):
+    import bs4
+    import nhl_requests
+
+    return game_ids
+
+
+def _run_fetch(game_ids):
+    from nhl_requests import (
+        nhl_live_feed_request,
+        nhl_pbp_request,
+        nhl_home_shifts_request,
+        nhl_away_shifts_request,
+    )
+
+    documents = 0
+    for game_id in game_ids:
+        for request in [
+            nhl_live_feed_request,
+            nhl_pbp_request,
+            nhl_home_shifts_request,
+            nhl_away_shifts_request,
+        ]:
+            assert request(game_id) is not None
+            documents += 1
+    return documents, None
+
+
+def _prepare_parse_live_feed(corpus, game_ids):
+    import pandas
+    from nhl_requests import endpoint_url
+
+    return [
+        json.loads(read_fixture(corpus, endpoint_url("live_feed", game_id=game_id)))
+        for game_id in game_ids
+    ]
+
+
+def _run_parse_live_feed(live_jsons):
+    from nhl_requests import parse_nhl_live_feed
+
+    live_dfs = [parse_nhl_live_feed(live_json) for live_json in live_jsons]
+    return sum(len(df) for df in live_dfs), list(zip(live_jsons, live_dfs))
+
+
+def _finish_parse_live_feed(corpus, outputs):
+    from game_index import summarize_game, update_game_index
+
+    summaries = {}
+    for live_json, live_df in outputs:
+        game_id = str(live_json["gameData"]["game"]["pk"])
+        os.makedirs(game_folder(corpus, game_id), exist_ok=True)
+        live_df.to_csv(
+            os.path.join(game_folder(corpus, game_id), "live_data.csv"), index=False
+        )
+        summaries[game_id] = summarize_game(
+            live_df,
+            live_json["gameData"]["game"].get("type", "R"),
+            live_json["gameData"]["teams"]["home"]["name"],
+            live_json["gameData"]["teams"]["away"]["name"],
+        )
+    update_game_index(benchmark_season(corpus), summaries)
+
+
+def _prepare_reports(corpus, game_ids, names):
+    import bs4
+    import pandas
+    from nhl_requests import report_url
+
+    return [
+        (game_id, [read_fixture(corpus, report_url(name, game_id)) for name in names])
+        for game_id in game_ids
+    ]
+
+
+def _prepare_parse_pbp(corpus, game_ids):
+    return _prepare_reports(corpus, game_ids, ["pbp_report"])
+
+
+def _run_parse_pbp(reports):
+    from bs4 import BeautifulSoup
+    from nhl_requests import parse_nhl_pbp
+
+    outputs = []
+    for game_id, (content,) in reports:
+        soup = BeautifulSoup(content, "html.parser")
+        outputs.append((game_id, parse_nhl_pbp(soup, int(game_id))))
+    return sum(len(df) for _, df in outputs), outputs
+
+
+def _finish_parse_pbp(corpus, outputs):
+    for game_id, pbp_df in outputs:
+        pbp_df.to_csv(
+            os.path.join(game_folder(corpus, game_id), "pbp_data.csv"), index=False
+        )
+
+
+def _prepare_parse_shifts(corpus, game_ids):
+    from fixture_server import season_of
+    from player_identity import load_identity_index
+
+    # the rosters are fetched here the first time, not while the shifts are parsed
+    for season_year in sorted({season_of(game_id) for game_id in game_ids}):
+        load_identity_index(season_year)
+    return _prepare_reports(
+        corpus, game_ids, ["home_shifts_report", "away_shifts_report"]
+    )
+
+
+def _run_parse_shifts(reports):
+    from bs4 import BeautifulSoup
+    from nhl_requests import parse_nhl_shifts
+
+    outputs = []
+    for game_id, (home_content, away_content) in reports:
+        home_df = parse_nhl_shifts(
+            BeautifulSoup(home_content, "html.parser"), int(game_id)
+        )
+        away_df = parse_nhl_shifts(
+            BeautifulSoup(away_content, "html.parser"), int(game_id)
+        )
+        outputs.append((game_id, home_df, away_df))
+    return sum(len(h) + len(a) for _, h, a in outputs), outputs
+
+
+def _finish_parse_shifts(corpus, outputs):
+    for game_id, home_df, away_df in outputs:
+        home_df.to_csv(
+            os.path.join(game_folder(corpus, game_id), "home_shifts_data.csv"),
+            index=False,
+        )
+        away_df.to_csv(
+            os.path.join(game_folder(corpus, game_id), "away_shifts_data.csv"),
+            index=False,
+        )
+
+
+def _prepare_accumulate(corpus, game_ids):
+    import accumulate_game
+
+    return [(benchmark_season(corpus), game_id) for game_id in game_ids]
+
+
+def _run_accumulate(games):
+    from accumulate_game import accumulate
+
+    outputs = [
+        (season_year, game_id, accumulate(season_year, game_id))
+        for season_year, game_id in games
+    ]
+    return sum(len(d["gameId"]) for _, _, d in outputs), outputs
+
+
+def _finish_accumulate(corpus, outputs):
+    from accumulate_game import save_accumulation
+
+    for season_year, game_id, accumulate_dict in outputs:
+        save_accumulation(accumulate_dict, season_year, game_id)
+
+
+def _prepare_load_data(corpus, game_ids):
+    import train
+
+    return [game_folder(corpus, game_id) for game_id in game_ids]
+
+
+def _run_load_data(folders):
+    from train import load_data
+
+    accumulated_dict = load_data(folders)
+    return len(accumulated_dict["winner"]), None
+
+
+def _prepare_train(corpus, game_ids):
+    from train import load_data, feature_arrays
+
+    return feature_arrays(load_data(_prepare_load_data(corpus, game_ids)))
+
+
+def _run_train(inputs):
+    from sklearn.ensemble import RandomForestClassifier
+
+    X, y, _, columns = inputs
+    # same classifier as train.train, fixed seed so runs are comparable
+    clf = RandomForestClassifier(random_state=645)
+    clf.fit(X, y)
+    clf.feature_columns = columns
+    return len(y), clf
+
+
+def _finish_train(corpus, clf):
+    import joblib
+
+    joblib.dump(clf, os.path.join(work_folder(corpus), "model.joblib"))
+
+
+def _prepare_predict(corpus, game_ids):
+    import joblib
+    from visualize import load_data
+
+    clf = joblib.load(os.path.join(work_folder(corpus), "model.joblib"))
+    return clf, [load_data(game_folder(corpus, game_id)) for game_id in game_ids]
+
+
+def _run_predict(inputs):
+    from visualize import predict_probabilities
+
+    clf, games_data = inputs
+    probabilities = [predict_probabilities(clf, game_data) for game_data in games_data]
+    return sum(len(p) for p in probabilities), None
+
+
+def _prepare_plot(corpus, game_ids):
+    import joblib
+    import matplotlib.pyplot as plt
+    from visualize import load_game_chart, predict_probabilities
+
+    plt.switch_backend("Agg")
+    clf = joblib.load(os.path.join(work_folder(corpus), "model.joblib"))
+    charts = []
+    for game_id in game_ids:
+        chart_data = load_game_chart(benchmark_season(corpus), game_id)
+        chart_data["probabilities"] = predict_probabilities(
+            clf, chart_data["game_data"]
+        )
+        chart_data["filename"] = os.path.join(work_folder(corpus), f"{game_id}.png")
+        charts.append(chart_data)
+    return charts
+
+
+def _run_plot(charts):
+    from visualize import render_probabilities
+
+    for chart_data in charts:
+        render_probabilities(
+            [chart_data["filename"]],
+            chart_data["probabilities"],
+            chart_data["time_remaining"],
+            chart_data["home_goal_times"],
+            chart_data["away_goal_times"],
+            chart_data["home_team_name"],
+            chart_data["away_team_name"],
+            chart_data["home_final_goals"],
+            chart_data["away_final_goals"],
+        )
+    return len(charts), None
+
+
+def _stage_functions(stage):
+    module = sys.modules[__name__]
+    return (
+        getattr(module, f"_prepare_{stage}"),
+        getattr(module, f"_run_{stage}"),
+        getattr(module, f"_finish_{stage}", None),
+    )
+
+
+def _peak_rss_mb():
+    # ru_maxrss is in kilobytes on linux and bytes on macos
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024**2 if sys.platform == "darwin" else 1024)
+
+
+def run_stage(stage, corpus, latency=0.0):
+    # runs in its own process, the fixture server answers the stages that still go to the network
+    from fixture_server import start_fixture_server, use_fixture_server
+    from player_identity import set_identity_folder
+
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    server = start_fixture_server(corpus=corpus, latency=latency)
+    use_fixture_server(server)
+    set_identity_folder(os.path.join(work_folder(corpus), "players"))
+
+    prepare, run, finish = _stage_functions(stage)
+    game_ids = corpus_game_ids(corpus)
+    inputs = prepare(corpus, game_ids)
+
+    start = time.perf_counter()
+    rows, outputs = run(inputs)
+    seconds = time.perf_counter() - start
+
+    if finish is not None:
+        finish(corpus, outputs)
+    server.shutdown()
+
+    return {
+        "seconds": seconds,
+        "rows": int(rows),
+        "rows_per_second": rows / seconds if seconds > 0 else None,
+        "peak_rss_mb": _peak_rss_mb(),
+        "requests": server.stats["requests"],
+        "bytes": server.stats["bytes"],
+    }
+
+
+def history_filename():
+    return os.path.join(benchmarks_folder(), "history.jsonl")
+
+
+def load_history(corpus=None):
+    if not os.path.isfile(history_filename()):
+        return []
+    with open(history_filename(), "r") as jsonl_file:
+        runs = [json.loads(line) for line in jsonl_file if line.strip()]
+    return [r for r in runs if corpus is None or r["corpus"] == corpus]
+
+
+def find_regressions(run, history, threshold=0.2, baseline_runs=5):
+    import numpy as np
+
+    regressions = []
+    for stage, result in run["stages"].items():
+        previous = [r["stages"][stage] for r in history if stage in r["stages"]][
+            -baseline_runs:
+        ]
+        if not previous:
+            continue
+        baseline_rss = np.median([p["peak_rss_mb"] for p in previous])
+        # rows_per_second is None for a stage too fast to time, it is left out of the rate comparison
+        previous_rates = [
+            p["rows_per_second"] for p in previous if p["rows_per_second"] is not None
+        ]
+        baseline_rate = np.median(previous_rates) if previous_rates else None
+        if (
+            result["rows_per_second"] is not None
+            and baseline_rate is not None
+            and result["rows_per_second"] < baseline_rate * (1 - threshold)
+        ):
+            regressions.append(
+                f'{stage}: {result["rows_per_second"]:.1f} rows/s against a baseline of {baseline_rate:.1f}'
+            )
+        if result["peak_rss_mb"] > baseline_rss * (1 + threshold):
+            regressions.append(
+                f'{stage}: peak RSS {result["peak_rss_mb"]:.1f} MB against a baseline of {baseline_rss:.1f} MB'
+            )
+    return regressions
+
+
+def rate_text(rows_per_second):
+    return f"{rows_per_second:10.1f}" if rows_per_second is not None else f"{'n/a':>10}"
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmark(
+    corpus="default",
+    selected_stages=None,
+    latency=0.0,
+    threshold=0.2,
+    baseline_runs=5,
+    save=True,
+):
+    # stages depend on the outputs of the ones before, a subset only makes sense after a full run on the corpus
+    selected_stages = stages if selected_stages is None else selected_stages
+    assert all(stage in stages for stage in selected_stages)
+    assert corpus_game_ids(corpus), (
+        f"No live feeds in fixtures/{corpus}, record the corpus first with "
+        f"python fixture_server.py --corpus {corpus} --record-games <gameId> ..."
+    )
+
+    if selected_stages[0] == stages[0]:
+        shutil.rmtree(
+            os.path.join(
+                os.path.dirname(os.path.abspath(__file__)),
+                "data",
+                benchmark_season(corpus),
+            ),
+            ignore_errors=True,
+        )
+    os.makedirs(work_folder(corpus), exist_ok=True)
+
+    run = {
+        "time": datetime.now().isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "corpus": corpus,
+        "games": len(corpus_game_ids(corpus)),
+        "latency": latency,
+        "stages": {},
+    }
+    spawn = multiprocessing.get_context("spawn")
+    for stage in selected_stages:
+        with ProcessPoolExecutor(max_workers=1, mp_context=spawn) as executor:
+            result = executor.submit(run_stage, stage, corpus, latency).result()
+        run["stages"][stage] = result
+        print(
+            f'{stage:>16}: {result["seconds"]:8.3f} s {result["rows"]:8d} rows {rate_text(result["rows_per_second"])} rows/s '
+            f'{result["peak_rss_mb"]:8.1f} MB peak RSS'
+        )
+
+    regressions = find_regressions(
+        run, load_history(corpus), threshold=threshold, baseline_runs=baseline_runs
+    )
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+
+    if save:
+        os.makedirs(benchmarks_folder(), exist_ok=True)
+        with open(history_filename(), "a") as jsonl_file:
+            jsonl_file.write(json.dumps(run) + "\n")
+
+    return run, regressions
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--corpus", type=str, default="default")
+    parser.add_argument("--stages", nargs="+", choices=stages, default=None)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--threshold", type=float, default=0.2)
+    parser.add_argument("--baseline-runs", type=int, default=5)
+    parser.add_argument("--no-save", action="store_true")
+
+    args = parser.parse_args()
+
+    _, regressions = run_benchmark(
+        corpus=args.corpus,
+        selected_stages=args.stages,
+        latency=args.latency,
+        threshold=args.threshold,
+        baseline_runs=args.baseline_runs,
+        save=not args.no_save,
+    )
+    sys.exit(1 if regressions else 0)
@@ -0,0 +1,215 @@
+import os
+import json
+import time
+import numpy as np
+import pandas as pd
+
+from instrumentation import progress
+from dangerous_shot import load_season_shots
+from shot_danger import indexed_shots, load_shot_index, radius_goal_rate
+
+# beta-binomial shooter and goalie models from the plan in dangerous_shot.py
+# prior: beta fitted from the empirical mean and variance of league wide goal rates within a radius of every shot
+#   https://stats.stackexchange.com/questions/12232/calculating-the-parameters-of-a-beta-distribution-using-the-mean-and-variance
+#   the prior mean of a player is the average local rate of the shots they took (or faced), so a player who shoots
+#   from the slot is not rewarded for location alone, and the concentration is shared by the league
+# likelihood: goals out of shots for the player, posterior is beta(alpha + goals, beta + shots - goals)
+#   https://www.bayesrulesbook.com/chapter-3.html
+# local rates come from the strength partitioned shot index, which takes care of weighting by man advantage
+# state only holds sums, so new games are added without refitting and the parameter tables are derived from it
+# state = {"prior": {"n", "rate_sum", "rate_sq_sum"}, "shooter": stats, "goalie": stats}
+#   stats is a DataFrame indexed by player id with shots, goals and expected_goals (sum of local rates)
+
+roles = {"shooter": "shooter_id", "goalie": "goalie_id"}
+
+
+def beta_from_moments(mean, var):
+    # alpha, beta of the beta distribution with the given mean and variance
+    var = min(var, mean * (1 - mean) * (1 - 1e-6))
+    concentration = mean * (1 - mean) / var - 1
+    return mean * concentration, (1 - mean) * concentration
+
+
+def _grouped_stats(player_ids, is_goal, local_rate):
+    # shots, goals and expected goals per player in one grouped pass, shots without a player (-1) are dropped
+    keep = player_ids >= 0
+    ids, inverse = np.unique(player_ids[keep], return_inverse=True)
+    return pd.DataFrame(
+        {
+            "shots": np.bincount(inverse, minlength=len(ids)),
+            "goals": np.bincount(inverse, weights=is_goal[keep], minlength=len(ids)),
+            "expected_goals": np.bincount(
+                inverse, weights=local_rate[keep], minlength=len(ids)
+            ),
+        },
+        index=pd.Index(ids, name="player_id"),
+    )
+
+
+def shot_local_rates(shot_index, shots_df, radius=10.0, in_index=False):
+    # league goal rate around every shot, leave the shot itself out when it is part of the index
+    _, _, rate = radius_goal_rate(
+        shot_index,
+        shots_df["shot_x"],
+        shots_df["shot_y"],
+        shots_df["strength"],
+        radius=radius,
+        is_goal=shots_df["is_goal"] if in_index else None,
+        indexed=indexed_shots(shots_df) if in_index else None,
+    )
+    return rate
+
+
+def new_state():
+    empty_stats = pd.DataFrame(
+        {"shots": [], "goals": [], "expected_goals": []},
+        index=pd.Index([], name="player_id", dtype=np.int64),
+    )
+    return {
+        "prior": {"n": 0, "rate_sum": 0.0, "rate_sq_sum": 0.0},
+        "shooter": empty_stats,
+        "goalie": empty_stats.copy(),
+    }
+
+
+def update_state(state, shots_df, local_rate):
+    # add the shots of new games to the sums, only the players in them are touched
+    is_goal = shots_df["is_goal"].to_numpy().astype(np.float64)
+
+    prior = dict(state["prior"])
+    prior["n"] += len(local_rate)
+    prior["rate_sum"] += float(local_rate.sum())
+    prior["rate_sq_sum"] += float((local_rate**2).sum())
+
+    new_state_ = {"prior": prior}
+    for role, id_col in roles.items():
+        game_stats = _grouped_stats(
+            shots_df[id_col].to_numpy().astype(np.int64), is_goal, local_rate
+        )
+        new_state_[role] = state[role].add(game_stats, fill_value=0)
+
+    return new_state_
+
+
+def prior_parameters(state):
+    prior = state["prior"]
+    mean = prior["rate_sum"] / prior["n"]
+    var = prior["rate_sq_sum"] / prior["n"] - mean**2
+    alpha, beta = beta_from_moments(mean, var)
+    return {"mean": mean, "var": var, "concentration": alpha + beta}
+
+
+def posterior_table(state, role):
+    # compact per player parameters, multiplier is how much better (shooter) or worse (goalie) than expected
+    #  from location the player is, so scoring a shot is local rate * shooter multiplier * goalie multiplier
+    concentration = prior_parameters(state)["concentration"]
+    stats = state[role]
+
+    prior_mean = np.clip(
+        (stats["expected_goals"] / stats["shots"]).to_numpy(), 1e-6, 1 - 1e-6
+    )
+    prior_alpha = prior_mean * concentration
+    prior_beta = (1 - prior_mean) * concentration
+    alpha = prior_alpha + stats["goals"].to_numpy()
+    beta = prior_beta + (stats["shots"] - stats["goals"]).to_numpy()
+    posterior_mean = alpha / (alpha + beta)
+
+    return pd.DataFrame(
+        {
+            "shots": stats["shots"].to_numpy().astype(np.int32),
+            "goals": stats["goals"].to_numpy().astype(np.int32),
+            "prior_alpha": prior_alpha.astype(np.float32),
+            "prior_beta": prior_beta.astype(np.float32),
+            "alpha": alpha.astype(np.float32),
+            "beta": beta.astype(np.float32),
+            "posterior_mean": posterior_mean.astype(np.float32),
+            "multiplier": (posterior_mean / prior_mean).astype(np.float32),
+        },
+        index=stats.index,
+    )
+
+
+def score_shots(shots_df, local_rate, shooter_table, goalie_table):
+    # danger of every shot as a lookup, players without a posterior keep the league rate
+    shooter_mult = (
+        shooter_table["multiplier"]
+        .reindex(shots_df["shooter_id"].to_numpy())
+        .fillna(1.0)
+        .to_numpy()
+    )
+    goalie_mult = (
+        goalie_table["multiplier"]
+        .reindex(shots_df["goalie_id"].to_numpy())
+        .fillna(1.0)
+        .to_numpy()
+    )
+    return np.clip(local_rate * shooter_mult * goalie_mult, 0, 1)
+
+
+def posterior_folder():
+    return os.path.join(os.path.dirname(__file__), "data", "posteriors")
+
+
+def save_state(state):
+    if not os.path.isdir(posterior_folder()):
+        os.makedirs(posterior_folder())
+
+    with open(os.path.join(posterior_folder(), "prior.json"), "w") as json_file:
+        json.dump(state["prior"], json_file)
+    for role in roles:
+        state[role].to_parquet(
+            os.path.join(posterior_folder(), f"{role}_stats.parquet")
+        )
+        posterior_table(state, role).to_parquet(
+            os.path.join(posterior_folder(), f"{role}_posterior.parquet")
+        )
+
+
+def load_state():
+    if not os.path.isfile(os.path.join(posterior_folder(), "prior.json")):
+        return new_state()
+
+    with open(os.path.join(posterior_folder(), "prior.json"), "r") as json_file:
+        state = {"prior": json.load(json_file)}
+    for role in roles:
+        state[role] = pd.read_parquet(
+            os.path.join(posterior_folder(), f"{role}_stats.parquet")
+        )
+    return state
+
+
+def load_posterior_tables():
+    return tuple(
+        pd.read_parquet(os.path.join(posterior_folder(), f"{role}_posterior.parquet"))
+        for role in roles
+    )
+
+
+def fit_posteriors(season_ids, radius=10.0):
+    # from scratch over seasons whose shots are in the shot index
+    start = time.time()
+
+    shot_index = load_shot_index()
+    shots_df = load_season_shots(season_ids)
+    local_rate = shot_local_rates(shot_index, shots_df, radius=radius, in_index=True)
+    state = update_state(new_state(), shots_df, local_rate)
+    save_state(state)
+
+    end = time.time()
+    progress(
+        f'Fit posteriors for {len(state["shooter"])} shooters and {len(state["goalie"])} goalies from {len(shots_df)} shots in {end - start:.2f} seconds.'
+    )
+    return state
+
+
+def update_posteriors(shots_df, radius=10.0):
+    # add shots of newly arrived games to the saved state
+    shot_index = load_shot_index()
+    local_rate = shot_local_rates(shot_index, shots_df, radius=radius)
+    state = update_state(load_state(), shots_df, local_rate)
+    save_state(state)
+    return state
+
+
+if __name__ == "__main__":
+    fit_posteriors(["20202021"])
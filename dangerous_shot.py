@@ -13,99 +13,69 @@
 
 # moneypuck about modeling: https://moneypuck.com/about.htm
 
-import requests
-from collections import defaultdict, Counter
-from nhl_requests import nhl_live_feed_request, nhl_pbp_request
-from bs4 import BeautifulSoup
-import re
-
-
-def parse_nhl_live_shots(live_game_json):
-    df_dict = {
-        "gameId": [],
-        "playId": [],
-        "event": [],
-        "timestamp": [],
-        "shot_x": [],
-        "shot_y": [],
-    }
-
-    # get gameId gameData -> game -> pk
-    gameId = live_game_json["gameData"]["game"]["pk"]
-
-    allPlays = live_game_json["liveData"]["plays"]["allPlays"]
-    for play_ind, play_dict in enumerate(allPlays):
-        assert "event" in play_dict["result"]
-        event = play_dict["result"]["event"]
-
-        if event in [
-            "Game Scheduled",
-            "Period Ready",
-            "Period Start",
-            "Period End",
-            "Period Official",
-            "Stoppage",
-            "Official Challenge",
-            "Game End",
-            "Shootout Complete",
-            "Early Intermission Start",
-            "Early Intermission End",
-            "Emergency Goaltender",
-            "Faceoff",
-            "Takeaway",
-            "Hit",
-            "Penalty",
-            "Giveaway",
-            "Game Official",
-            "Game End",
-        ]:
-            continue
-
-        df_dict["gameId"].append(gameId)
-        df_dict["event"].append(event)
-
-        assert "about" in play_dict and "eventIdx" in play_dict["about"]
-        playId = play_dict["about"]["eventIdx"]
-        df_dict["playId"].append(playId)
-
-        assert "periodTime" in play_dict["about"] and "period" in play_dict["about"]
-        period = int(play_dict["about"]["period"])
-        minutes_gone_in_period = int(play_dict["about"]["periodTime"].split(":")[0])
-        seconds_gone_in_period = int(play_dict["about"]["periodTime"].split(":")[1])
-        seconds_remaining_in_game = 20 * 3 * 60 - (
-            20 * 60 * (period - 1)
-            + 60 * minutes_gone_in_period
-            + seconds_gone_in_period
-        )
-        df_dict["timestamp"].append(seconds_remaining_in_game)
-
-        shot_xy = None
-        if event == "Blocked Shot":
-            event_ = "block"
-        elif event in ["Shot", "Missed Shot"]:
-            event_ = "shot"
-
-            assert "coordinates" in play_dict
-            shot_xy = play_dict["coordinates"]
-        elif event == "Goal":
-            event_ = "goal"
-
-            assert "coordinates" in play_dict
-            shot_xy = play_dict["coordinates"]
-        else:
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import numpy as np
+import pandas as pd
+from instrumentation import progress, warning
+from nhl_requests import (
+    endpoint_url,
+    nhl_get,
+    live_feed_shot_events,
+    live_feed_skip_events,
+    nhl_live_feed_request,
+    nhl_pbp_request,
+    parse_nhl_pbp,
+    parse_nhl_live_events,
+    parse_nhl_pbp_events,
+)
+from player_data import crawl_players
+from rolling_features import build_form_features
+
+
+# plays of the live feed that are not shots
+live_shots_skip_events = live_feed_skip_events | {
+    "Faceoff",
+    "Takeaway",
+    "Hit",
+    "Penalty",
+    "Giveaway",
+    "Game Official",
+}
+
+
+def parse_nhl_live_shots(live_game_json, live_events=None):
+    # shot view of the live feed, pass live_events when it has already been parsed by
+    #  nhl_requests.parse_nhl_live_events
+    if live_events is None:
+        live_events = parse_nhl_live_events(live_game_json)
+    events = live_events["event"]
+    if any(
+        event not in live_shots_skip_events and event not in live_feed_shot_events
+        for event in events
+    ):
+        raise NotImplementedError
+    shot_inds = [i for i, event in enumerate(events) if event in live_feed_shot_events]
+    assert len(shot_inds) > 0
+
+    # the team of a blocked shot is the blocking team, so the shooting side is the other one
+    sides = []
+    for i in shot_inds:
+        team = live_events["team"][i]
+        assert team is not None
+        if team == "unknown":
             raise NotImplementedError
-
-        if shot_xy is not None and len(shot_xy):
-            df_dict["shot_x"].append(shot_xy["x"])
-            df_dict["shot_y"].append(shot_xy["y"])
-
-        for col, vals in df_dict.items():
-            if len(vals) < len(df_dict["gameId"]):
-                df_dict[col].append(0)
-
-        assert all(len(vals) == len(df_dict["gameId"]) for vals in df_dict.values())
-
-    assert len(df_dict["gameId"]) > 0
+        if events[i] == "Blocked Shot":
+            team = "home" if team == "away" else "away"
+        sides.append(team)
+
+    df_dict = {"gameId": [live_events["gameId"]] * len(shot_inds)}
+    for column in ["playId", "event", "timestamp", "shot_x", "shot_y"]:
+        df_dict[column] = [live_events[column][i] for i in shot_inds]
+    df_dict["side"] = sides
+    for column in ["shooter_id", "goalie_id"]:
+        df_dict[column] = [live_events[column][i] for i in shot_inds]
     return df_dict
 
 
@@ -115,160 +85,251 @@ def fetch_to_df_nhl_shots(game_id):
     return live_data_df_dict
 
 
-def parse_nhl_pbp_shots(nhl_event_soup, game_id):
-    assert isinstance(nhl_event_soup, BeautifulSoup)
-    # return line items in table similar to what is seen online: http://www.nhl.com/scores/htmlreports/20212022/PL030234.HTM
+def parse_nhl_pbp_shots(nhl_event_soup, game_id, events_df=None):
+    # offense/defense view of the shots in the play by play, pass events_df when the PL report has already been
+    #  parsed by nhl_requests.parse_nhl_pbp_events
+    if events_df is None:
+        events_df = parse_nhl_pbp_events(nhl_event_soup, game_id)
+
+    shots = events_df.loc[events_df["event"].isin(["SHOT", "GOAL", "MISS", "BLOCK"])]
+    assert len(shots.index) > 0
+
+    # goalie pulled is only known when the report lists the players of both sides
+    recorded = (shots["away_pulled_goalie"] != "-1").to_numpy() & (
+        shots["home_pulled_goalie"] != "-1"
+    ).to_numpy()
+    if (recorded & (shots["event_team"] == "").to_numpy()).any():
+        raise NotImplementedError
+    is_home = (shots["event_team"] == "home").to_numpy()
+    away_pulled = shots["away_pulled_goalie"].to_numpy()
+    home_pulled = shots["home_pulled_goalie"].to_numpy()
+
     df_dict = {
-        "gameId": [],
-        "playId": [],
-        "strength": [],
-        "timestamp": [],
-        "event": [],
-        "description": [],
-        "off_goalie_pulled": [],
-        "def_goalie_pulled": [],
+        column: shots[column].to_list()
+        for column in ["gameId", "playId", "strength", "timestamp", "event"]
     }
+    df_dict["description"] = shots["description"].to_list()
+    df_dict["off_goalie_pulled"] = np.where(
+        recorded, np.where(is_home, home_pulled, away_pulled), "-1"
+    ).tolist()
+    df_dict["def_goalie_pulled"] = np.where(
+        recorded, np.where(is_home, away_pulled, home_pulled), "-1"
+    ).tolist()
+    return df_dict
 
-    # get the home and away team abbreviations
-    abbreviations = {
-        "Atlanta": ["AFM"],
-        "Anaheim": ["ANA"],
-        "Arizona": ["ARI"],
-        "Boston": ["BOS"],
-        "Brooklyn": ["BRK"],
-        "Buffalo": ["BUF"],
-        "Carolina": ["CAR"],
-        "Columbus": ["CBJ"],
-        "California": ["CGS"],
-        "Calgary": ["CGY"],
-        "Chicago": ["CHI"],
-        "Cleveland": ["CLE"],
-        "Colorado": ["COL"],
-        "Dallas": ["DAL"],
-        "Detroit": ["DET"],
-        "Edmonton": ["EDM"],
-        "Florida": ["FLA"],
-        "Hamilton": ["HAM"],
-        "Hartford": ["HFD"],
-        "Kansas City": ["KCS"],
-        "Los Angeles": ["LAK", "L.A"],
-        "Minnesota": ["MIN"],
-        "Montreal": ["MTL"],
-        "New Jersey": ["NJD", "N.J"],
-        "Nashville": ["NSH"],
-        "New York Rangers": ["NYR"],
-        "New York Islanders": ["NYI"],
-        "Ottawa": ["OTT"],
-        "Philadelphia": ["PHI"],
-        "Phoenix": ["PHX"],
-        "Pittsburgh": ["PIT"],
-        "Quebec": ["QBD"],
-        "Seattle": ["SEA"],
-        "San Jose": ["SJS", "S.J"],
-        "St. Louis": ["STL"],
-        "Tampa Bay": ["TBL", "T.B"],
-        "Toronto": ["TOR"],
-        "Vancouver": ["VAN"],
-        "Vegas": ["VGK"],
-        "Winnipeg": ["WPG"],
-        "Washington": ["WSH"],
-    }
 
-    visitor_table = nhl_event_soup.find("table", {"id": "Visitor"})
-    home_table = nhl_event_soup.find("table", {"id": "Home"})
-
-    away_abbrev = None
-    home_abbrev = None
-
-    for loc, abbr_list in abbreviations.items():
-        if loc.lower() in visitor_table.text.lower():
-            assert away_abbrev is None
-            away_abbrev = abbr_list[0]
-        if loc.lower() in home_table.text.lower():
-            assert home_abbrev is None
-            home_abbrev = abbr_list[0]
-
-    assert away_abbrev is not None and home_abbrev is not None
-    assert isinstance(away_abbrev, str) and isinstance(home_abbrev, str)
-
-    # not all games have the id=PL-# format
-    # ex game that does: 2021030234
-    # ex game that doesn't: 2017020001
-    PL_tr = nhl_event_soup.find_all("tr", {"id": re.compile(r"PL-\d")})
-    color_tr = nhl_event_soup.find_all(
-        "tr", {"class": re.compile(r"(?:even|odd)Color")}
-    )
+def fetch_to_df_nhl_pbp(game_id):
+    pbp_data = nhl_pbp_request(game_id)
+    pbp_df = parse_nhl_pbp_shots(pbp_data, game_id)
+    return pbp_df
 
-    all_tr = PL_tr if len(PL_tr) >= len(color_tr) else color_tr
 
-    for tr in all_tr:
-        line_items = [tag.text for tag in tr.find_all("td", recursive=False)]
-        assert len(line_items) == 8
+def strength_state(off_skaters, def_skaters, off_goalie_pulled, def_goalie_pulled):
+    # man advantage label of each shot from the shooting team's perspective, all arguments are arrays
+    # ev5 -> 5on5
+    # ev4 -> 4on4
+    # ev3 -> 3on3
+    # pp4 -> 5on4
+    # pp3 -> 5on3
+    # pp43 -> 4on3
+    # sh4 -> 4on5, sh3 -> 3on5, sh34 -> 3on4
+    # en5 -> 6on5 (shooting team pulled their goalie)
+    # en4 -> 6on4
+    # open -> the defending team's net is empty
+    # unk -> on ice players not recorded
+    off_skaters = np.asarray(off_skaters)
+    def_skaters = np.asarray(def_skaters)
+    off_str = off_skaters.astype(str)
+    def_str = def_skaters.astype(str)
+
+    return np.select(
+        [
+            (off_skaters < 0) | (def_skaters < 0),
+            np.asarray(def_goalie_pulled) == 1,
+            np.asarray(off_goalie_pulled) == 1,
+            off_skaters == def_skaters,
+            (off_skaters > def_skaters) & (off_skaters == 5),
+            off_skaters > def_skaters,
+            def_skaters == 5,
+        ],
+        [
+            "unk",
+            "open",
+            np.char.add("en", def_str),
+            np.char.add("ev", off_str),
+            np.char.add("pp", def_str),
+            np.char.add(np.char.add("pp", off_str), def_str),
+            np.char.add("sh", off_str),
+        ],
+        default=np.char.add(np.char.add("sh", off_str), def_str),
+    )
 
-        event = line_items[4]
-        if event not in ["SHOT", "GOAL", "MISS", "BLOCK"]:
-            continue
 
-        df_dict["gameId"].append(game_id)
+def _skaters_on_ice(on_ice):
+    # "{# forwards}_{# defense}_{# goalies}" -> number of skaters, -1 when not recorded
+    counts = on_ice.astype(str).str.split("_", expand=True)
+    if counts.shape[1] < 3:
+        return np.full(len(on_ice), -1)
+    forwards = pd.to_numeric(counts[0], errors="coerce")
+    defense = pd.to_numeric(counts[1], errors="coerce")
+    return (forwards + defense).fillna(-1).astype(int).to_numpy()
+
+
+def merge_shots_strength(live_shots_df, pbp_df, tolerance=2):
+    # match every live feed shot to the play by play row of the same event within tolerance seconds and attach the
+    #  on ice strength, sorted join instead of searching the pbp list for every shot
+    live_to_pbp_event = {
+        "Shot": "SHOT",
+        "Blocked Shot": "BLOCK",
+        "Missed Shot": "MISS",
+        "Goal": "GOAL",
+    }
 
-        df_dict["playId"].append(line_items[0])
-        df_dict["strength"].append(
-            line_items[2] if not line_items[2] == "\xa0" else "-1"
+    shots = live_shots_df.copy()
+    shots["pbp_event"] = shots["event"].map(live_to_pbp_event)
+    shots = shots.sort_values("timestamp", kind="stable")
+
+    pbp = pbp_df.loc[pbp_df["event"].isin(live_to_pbp_event.values())]
+    pbp = pd.DataFrame(
+        {
+            "pbp_event": pbp["event"].to_numpy(),
+            "timestamp": pbp["timestamp"].to_numpy(),
+            "pbp_playId": pbp["playId"].to_numpy(),
+            "away_skaters": _skaters_on_ice(pbp["away_on_ice"]),
+            "home_skaters": _skaters_on_ice(pbp["home_on_ice"]),
+            "away_pulled_goalie": pbp["away_pulled_goalie"].astype(int).to_numpy(),
+            "home_pulled_goalie": pbp["home_pulled_goalie"].astype(int).to_numpy(),
+        }
+    ).sort_values("timestamp", kind="stable")
+
+    merged = pd.merge_asof(
+        shots,
+        pbp,
+        on="timestamp",
+        by="pbp_event",
+        tolerance=tolerance,
+        direction="nearest",
+    )
+    unmatched = merged["pbp_playId"].isna()
+    if unmatched.any():
+        warning(
+            f'{unmatched.sum()} shots in gameId {merged["gameId"].iloc[0]} had no play by play match.'
         )
+    merged = merged.loc[~unmatched]
+
+    is_home = merged["side"].to_numpy() == "home"
+    away_skaters = merged["away_skaters"].astype(int).to_numpy()
+    home_skaters = merged["home_skaters"].astype(int).to_numpy()
+    away_pulled = merged["away_pulled_goalie"].astype(int).to_numpy()
+    home_pulled = merged["home_pulled_goalie"].astype(int).to_numpy()
+    merged["off_skaters"] = np.where(is_home, home_skaters, away_skaters)
+    merged["def_skaters"] = np.where(is_home, away_skaters, home_skaters)
+    merged["off_goalie_pulled"] = np.where(is_home, home_pulled, away_pulled)
+    merged["def_goalie_pulled"] = np.where(is_home, away_pulled, home_pulled)
+    merged["strength"] = strength_state(
+        merged["off_skaters"],
+        merged["def_skaters"],
+        merged["off_goalie_pulled"],
+        merged["def_goalie_pulled"],
+    )
+    merged["is_goal"] = (merged["event"] == "Goal").astype(np.int8)
+
+    return merged[
+        [
+            "gameId",
+            "playId",
+            "event",
+            "timestamp",
+            "side",
+            "shooter_id",
+            "goalie_id",
+            "shot_x",
+            "shot_y",
+            "off_skaters",
+            "def_skaters",
+            "off_goalie_pulled",
+            "def_goalie_pulled",
+            "strength",
+            "is_goal",
+        ]
+    ].sort_values("playId", kind="stable", ignore_index=True)
+
+
+def build_game_shots(season_id, game_id):
+    game_folder = os.path.join(os.path.dirname(__file__), "data", season_id, game_id)
+
+    # reuse what the win probability ingestion already saved and only go to the network for the rest, what is
+    #  fetched is saved in the game folder the same way so the next build reads it too
+    live_shots_filename = os.path.join(game_folder, "live_shots.csv")
+    if os.path.isfile(live_shots_filename):
+        live_shots_df = pd.read_csv(live_shots_filename)
+    else:
+        live_shots_df = pd.DataFrame(fetch_to_df_nhl_shots(game_id))
+        os.makedirs(game_folder, exist_ok=True)
+        live_shots_df.to_csv(live_shots_filename, index=False)
+
+    pbp_filename = os.path.join(game_folder, "pbp_data.csv")
+    if os.path.isfile(pbp_filename):
+        pbp_df = pd.read_csv(pbp_filename)
+    else:
+        pbp_df = parse_nhl_pbp(nhl_pbp_request(game_id), game_id)
+        os.makedirs(game_folder, exist_ok=True)
+        pbp_df.to_csv(pbp_filename, index=False)
+
+    return merge_shots_strength(live_shots_df, pbp_df)
+
+
+def build_season_shots(season_id, max_workers=8):
+    season_request = nhl_get(
+        endpoint_url("schedule", season_year=season_id), "schedule"
+    ).json()
+    game_ids = [
+        str(game_data["gamePk"])
+        for game_date_dict in season_request["dates"]
+        for game_data in game_date_dict["games"]
+        if game_data["gameType"] in ["R", "P"]
+    ]
+
+    start = time.time()
+    game_shots = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(build_game_shots, season_id, game_id): game_id
+            for game_id in game_ids
+        }
+        for future in as_completed(futures):
+            try:
+                game_shots.append(future.result())
+            except Exception as e:
+                warning(
+                    f"Could not build shots for gameId {futures[future]}: {e!r}",
+                    game_id=futures[future],
+                )
+    end = time.time()
+    progress(
+        f"Built shots for {len(game_shots)} of {len(game_ids)} games in {season_id} in {end - start:.2f} seconds."
+    )
 
-        period = int(line_items[1])
-        minutes_gone_in_period = int(line_items[3].split(":")[0])
-        seconds_gone_in_period = int(line_items[3].split(":")[1][:2])
-        seconds_remaining_in_game = 20 * 3 * 60 - (
-            20 * 60 * (period - 1)
-            + 60 * minutes_gone_in_period
-            + seconds_gone_in_period
-        )
-        df_dict["timestamp"].append(seconds_remaining_in_game)
-        df_dict["event"].append(line_items[4])
-        df_dict["description"].append(
-            line_items[5].replace("\xa0", " ") if not line_items[5] == "\xa0" else "-1"
-        )
+    shots_df = pd.concat(game_shots, ignore_index=True)
+    return shots_df.sort_values(["gameId", "playId"], kind="stable", ignore_index=True)
 
-        if not line_items[6] == "\xa0" and not line_items[7] == "\xa0":
-            away_positions = [
-                c[-1] for c in "".join(line_items[6].split("\n")).split("\xa0")
-            ]
-            home_positions = [
-                c[-1] for c in "".join(line_items[7].split("\n")).split("\xa0")
-            ]
-
-            if df_dict["description"][-1].startswith(away_abbrev):
-                df_dict["off_goalie_pulled"].append(
-                    "0" if "G" in away_positions else "1"
-                )
-                df_dict["def_goalie_pulled"].append(
-                    "0" if "G" in home_positions else "1"
-                )
-            elif df_dict["description"][-1].startswith(home_abbrev):
-                df_dict["off_goalie_pulled"].append(
-                    "0" if "G" in home_positions else "1"
-                )
-                df_dict["def_goalie_pulled"].append(
-                    "0" if "G" in away_positions else "1"
-                )
-            else:
-                raise NotImplementedError
-        else:
-            df_dict["off_goalie_pulled"].append("-1")
-            df_dict["def_goalie_pulled"].append("-1")
 
-        assert all(len(vals) == len(df_dict["gameId"]) for vals in df_dict.values())
+def season_shots_filename(season_id):
+    return os.path.join(os.path.dirname(__file__), "data", season_id, "shots.parquet")
 
-    assert len(df_dict["gameId"]) > 0
 
-    return df_dict
+def save_season_shots(shots_df, season_id):
+    filename = season_shots_filename(season_id)
+    if not os.path.isdir(os.path.dirname(filename)):
+        os.makedirs(os.path.dirname(filename))
+    shots_df.to_parquet(filename, index=False)
 
 
-def fetch_to_df_nhl_pbp(game_id):
-    pbp_data = nhl_pbp_request(game_id)
-    pbp_df = parse_nhl_pbp_shots(pbp_data, game_id)
-    return pbp_df
+def load_season_shots(season_ids):
+    return pd.concat(
+        [pd.read_parquet(season_shots_filename(season_id)) for season_id in season_ids],
+        ignore_index=True,
+    )
 
 
 def data_main(args):
@@ -284,359 +345,41 @@ def data_main(args):
     #  will score at least one goal in the game, response variable for goalie will be the save percentage of the game
     #  want to get for each shot in the game was the probability they will save it basically
 
-    """
-    teams_request = requests.get("https://statsapi.web.nhl.com/api/v1/teams").json()
-    team_ids = [d["id"] for d in teams_request["teams"] if d["active"]]
-    player_data = {}
-    game_player_window = 4
-    for team_id in team_ids:
-        roster_request = requests.get(
-            f"https://statsapi.web.nhl.com/api/v1/teams/{team_id}?expand=team.roster"
-        ).json()
-        assert len(roster_request["teams"]) == 1
-        team_dict = roster_request["teams"][0]
-        roster = team_dict["roster"]["roster"]
-        player_ids = [d["person"]["id"] for d in roster]
-        for player_id in player_ids:
-            if player_id not in player_data:
-                base_stats_request = requests.get(
-                    f"https://statsapi.web.nhl.com/api/v1/people/{player_id}"
-                ).json()
-                career_stats_request = requests.get(
-                    f"https://statsapi.web.nhl.com/api/v1/people/{player_id}/stats?stats=yearByYear"
-                ).json()
-
-                base_stats = base_stats_request["people"][0]
-                player_data[player_id] = {
-                    "height": base_stats["height"],
-                    "weight": base_stats["weight"],
-                    "position": base_stats["primaryPosition"]["abbreviation"],
-                    "current_age": base_stats["currentAge"],
-                    "game_data": {},  # keys will be season IDs and values will be list of ordered game dicts
-                }
-                is_goalie = player_data[player_id]["position"] in ["G"]
-                num_games_played = defaultdict(int)
-                career_splits = career_stats_request["stats"][0]["splits"]
-                for year_split in career_splits:
-                    if year_split["league"]["name"] == "National Hockey League":
-                        if year_split["season"] in season_ids:
-                            num_games_played[year_split["season"]] += year_split[
-                                "stat"
-                            ]["games"]
-                        if (
-                            2005
-                            <= int(year_split["season"][:4])
-                            < int(season_ids[-1][:4])
-                        ):
-                            if not is_goalie:
-                                if (
-                                    "career_shots_per_game"
-                                    not in player_data[player_id]
-                                ):
-                                    assert (
-                                        "career_goals_per_game"
-                                        not in player_data[player_id]
-                                    )
-                                    player_data[player_id].update(
-                                        {
-                                            "career_shots_per_game": defaultdict(
-                                                Counter
-                                            ),
-                                            "career_goals_per_game": defaultdict(
-                                                Counter
-                                            ),
-                                        }
-                                    )
-
-                                player_data[player_id]["career_shots_per_game"][
-                                    year_split["season"]
-                                ].update(
-                                    Counter(
-                                        {
-                                            "shots": year_split["stat"]["shots"],
-                                            "games": year_split["stat"]["games"],
-                                        }
-                                    )
-                                )
-                                player_data[player_id]["career_goals_per_game"][
-                                    year_split["season"]
-                                ].update(
-                                    Counter(
-                                        {
-                                            "goals": year_split["stat"]["goals"],
-                                            "games": year_split["stat"]["games"],
-                                        }
-                                    )
-                                )
-                            else:
-                                if (
-                                    "career_goals_against_per_toi"
-                                    not in player_data[player_id]
-                                ):
-                                    assert (
-                                        "career_shots_saves"
-                                        not in player_data[player_id]
-                                    )
-                                    player_data[player_id].update(
-                                        {
-                                            "career_goals_against_per_toi": defaultdict(
-                                                Counter
-                                            ),
-                                            "career_shots_saves": defaultdict(Counter),
-                                        }
-                                    )
-
-                                player_data[player_id]["career_goals_against_per_toi"][
-                                    year_split["season"]
-                                ].update(
-                                    Counter(
-                                        {
-                                            "goals_against": year_split["stat"][
-                                                "goalsAgainst"
-                                            ],
-                                            "toi": 60
-                                            * int(
-                                                year_split["stat"]
-                                                .get("timeOnIce", "0:0")
-                                                .split(":")[0]
-                                            )
-                                            + int(
-                                                year_split["stat"]
-                                                .get("timeOnIce", "0:0")
-                                                .split(":")[1]
-                                            ),
-                                        }
-                                    )
-                                )
-                                player_data[player_id]["career_shots_saves"][
-                                    year_split["season"]
-                                ].update(
-                                    Counter(
-                                        {
-                                            "shots_against": year_split["stat"][
-                                                "shotsAgainst"
-                                            ],
-                                            "saves": year_split["stat"]["saves"],
-                                        }
-                                    )
-                                )
-                    else:
-                        num_games_played[year_split["season"]] = 0
-            else:
-                is_goalie = player_data[player_id]["position"] in ["G"]
-                career_stats_request = requests.get(
-                    f"https://statsapi.web.nhl.com/api/v1/people/{player_id}/stats?stats=yearByYear"
-                ).json()
-                num_games_played = defaultdict(int)
-                career_splits = career_stats_request["stats"][0]["splits"]
-                for year_split in career_splits:
-                    if (
-                        year_split["league"]["name"] == "National Hockey League"
-                        and year_split["season"] in season_ids
-                    ):
-                        num_games_played[year_split["season"]] += year_split["stat"][
-                            "games"
-                        ]
-            for season_id in season_ids:
-                if (
-                    season_id not in num_games_played
-                    or num_games_played[season_id] == 0
-                ):
-                    continue
-                season_log_request = requests.get(
-                    f"https://statsapi.web.nhl.com/api/v1/people/{player_id}/stats?stats=gameLog&season={season_id}"
-                ).json()
-                assert len(season_log_request["stats"]) == 1
-                season_split = season_log_request["stats"][0]["splits"]
-                assert len(season_split) == num_games_played[season_id]
-                season_log = []
-                for log_ind, game_log in enumerate(season_split):
-                    if not is_goalie:
-                        game_stats = {
-                            "avg_goals": 0.0,
-                            "avg_shots": 0.0,
-                            "avg_mins": 0.0,
-                            # "cum_pm": 0,
-                            "num_goals": game_log["stat"].get("goals", 0),
-                            "num_shots": game_log["stat"].get("shots", 0),
-                            "num_mins": 60
-                            * int(
-                                game_log["stat"].get("timeOnIce", "0:0").split(":")[0]
-                            )
-                            + int(
-                                game_log["stat"].get("timeOnIce", "0:0").split(":")[1]
-                            ),
-                            # "pm": game_log["stat"].get("plusMinus", 0),
-                            'gamePk': game_log['game']['gamePk'],
-                        }
-
-                        prev_game_stats = season_log[-game_player_window:]
-                        game_stats["avg_goals"] = (
-                            sum([pgs["num_goals"] for pgs in prev_game_stats])
-                            / game_player_window
-                        )
-                        game_stats["avg_shots"] = (
-                            sum([pgs["num_shots"] for pgs in prev_game_stats])
-                            / game_player_window
-                        )
-                        game_stats["avg_mins"] = (
-                            sum([pgs["num_mins"] for pgs in prev_game_stats])
-                            / game_player_window
-                        )
-                        # game_stats["cum_pm"] = sum(
-                        #     [pgs["pm"] for pgs in prev_game_stats]
-                        # )
-
-                    else:
-                        game_stats = {
-                            "avg_saves": 0.0,
-                            "avg_shots": 0.0,
-                            "cum_goals": 0.0,
-                            "cum_toi": 0.0,
-                            "num_saves": game_log["stat"].get("saves", 0),
-                            "num_shots": game_log["stat"].get("shotsAgainst", 0),
-                            "num_goals": game_log["stat"].get("goalsAgainst", 0),
-                            "num_toi": 60
-                            * int(
-                                game_log["stat"].get("timeOnIce", "0:0").split(":")[0]
-                            )
-                            + int(
-                                game_log["stat"].get("timeOnIce", "0:0").split(":")[1]
-                            ),
-                            'gamePk': game_log['game']['gamePk'],
-                        }
-
-                        prev_game_stats = season_log[-game_player_window:]
-                        game_stats["avg_saves"] = (
-                            sum([pgs["num_saves"] for pgs in prev_game_stats])
-                            / game_player_window
-                        )
-                        game_stats["avg_shots"] = (
-                            sum([pgs["num_shots"] for pgs in prev_game_stats])
-                            / game_player_window
-                        )
-                        game_stats["cum_goals"] = sum(
-                            [pgs["num_goals"] for pgs in prev_game_stats]
-                        )
-                        game_stats["cum_toi"] = sum(
-                            [pgs["num_toi"] for pgs in prev_game_stats]
-                        )
-
-                    season_log.append(game_stats)
-                player_data[player_id]["game_data"][season_id] = season_log
-    """
+    crawl_players(season_ids, max_workers=args.workers)
+    build_form_features(windows=args.form_windows)
 
     # data for shot situation model is previous x game plays - actions and locations and man advantage (power play, EN, 6 on 5, 4 on 4 etc.)
     #  and shot location itself
-    gamedays_shot_window = 20
     for season_id in season_ids[:-1]:
-
-        season_request = requests.get(
-            f"https://statsapi.web.nhl.com/api/v1/schedule?season={season_id}"
-        ).json()
-        for i, game_date_dict in enumerate(season_request["dates"]):
-            games_data = game_date_dict["games"]
-            for game_data in games_data:
-                game_id = str(game_data["gamePk"])
-
-                game_type = game_data["gameType"]
-                if game_type not in ["R", "P"]:
-                    print(
-                        f"gameId {game_id} is not a regular season or playoff game. Continuing."
-                    )
-                    continue
-
-                live_df = fetch_to_df_nhl_shots(game_id)
-                pbp_df = fetch_to_df_nhl_pbp(game_id)
-                pass
-                # todo merge two df on event and timestamp to determine if the shot taken was a powerplay/shorthanded/adv empty netter/disadv empty netter
-                # ev5 -> 5on5
-                # ev4 -> 4on4
-                # ev3 -> 3on3
-                # pp4 -> 5on4
-                # pp3 -> 5on3
-                # pp43 -> 4on3
-                # en5 -> 6on5
-                # en4 -> 6on4
-                merged_df = {
-                    "gameId": [],
-                    "playId": [],
-                    "event": [],
-                    "timestamp": [],
-                    "shot_x": [],
-                    "shot_y": [],
-                    "strength": [],
-                }
-                for j in range(len(live_df["gameId"])):
-                    exact_match = True
-                    if live_df["timestamp"][j] in pbp_df["timestamp"]:
-                        time_ind = pbp_df["timestamp"].index(live_df["timestamp"][j])
-                    elif live_df["timestamp"][j] - 1 in pbp_df["timestamp"]:
-                        time_ind = pbp_df["timestamp"].index(
-                            live_df["timestamp"][j] - 1
-                        )
-                    elif live_df["timestamp"][j] - 2 in pbp_df["timestamp"]:
-                        time_ind = pbp_df["timestamp"].index(
-                            live_df["timestamp"][j] - 2
-                        )
-                    elif live_df["timestamp"][j] + 1 in pbp_df["timestamp"]:
-                        time_ind = pbp_df["timestamp"].index(
-                            live_df["timestamp"][j] + 1
-                        )
-                    elif live_df["timestamp"][j] + 2 in pbp_df["timestamp"]:
-                        time_ind = pbp_df["timestamp"].index(
-                            live_df["timestamp"][j] + 2
-                        )
-                    else:
-                        print("timestamp not found")
-                        continue
-
-                    def check_shot_type(live_event, pbp_event):
-                        translation = {
-                            "Shot": "SHOT",
-                            "Blocked Shot": "BLOCK",
-                            "Missed Shot": "MISS",
-                            "Goal": "GOAL",
-                        }
-                        return translation[live_event] == pbp_event
-
-                    if not check_shot_type(
-                        live_df["event"][time_ind], pbp_df["event"][time_ind]
-                    ):
-                        continue
-
-                # retrieve row from pbp
-                #         pbp_row = pbp_df.loc[
-                #             (pbp_df["timestamp"] == time_remaining)
-                #             & (pbp_df["event"] == live_to_pbp_event[event])
-                #         ]
-                #         if len(pbp_row) > 1:
-                #             pbp_row = pbp_row.iloc[[0]]
-                #         elif len(pbp_row) == 0:
-                #             skipped_rows += 1
-                #             if skipped_rows >= 10:
-                #                 raise Exception("Too many skipped rows!")
-                #             continue
-                #         assert (
-                #             len(pbp_row.index) == 1
-                #         ), f"Actual length of play by play is {len(pbp_row.index)}"
+        shots_df = build_season_shots(season_id, max_workers=args.workers)
+        save_season_shots(shots_df, season_id)
 
     # data for combined models is shot locations, whether they were goals or not, and the shooter & goalie involved
     pass
 
 
 def train_main(args):
-    pass
+    # imported here since shot_model builds on this module
+    from shot_model import train_stacked_model
+
+    season_ids = ["20202021"]
+    train_stacked_model(season_ids, n_jobs=args.workers)
 
 
 def main(args):
-    data_main(args)
+    if args.train:
+        train_main(args)
+    else:
+        data_main(args)
 
 
 if __name__ == "__main__":
     import argparse
 
     parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--train", action="store_true")
+    parser.add_argument("--form-windows", type=int, nargs="+", default=[4, 10, 20])
 
     args = parser.parse_args()
 
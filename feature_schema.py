@@ -0,0 +1,137 @@
+import os
+import numpy as np
+import pandas as pd
+
+# dtypes of the accumulated_data columns, used when saving an accumulated game and every time one is loaded
+# flags are in {-1, 0, 1}, counts, differentials and times of a game fit in int16 (overtime makes
+#  time_remaining_neg negative, five overtimes are -6000), only the skew and expected goals are fractional
+# accumulated games are saved as accumulated_data.parquet, accumulated_data.csv from before is still read
+
+FEATURE_SCHEMA = {
+    "gameId": np.int32,
+    "playId": np.int16,
+    "time_remaining": np.int16,
+    "time_remaining_neg": np.int16,
+    "goal_differential": np.int16,
+    "goal_total": np.int16,
+    "shot_differential": np.int16,
+    "shot_total": np.int16,
+    "faceoff_differential": np.int16,
+    "faceoff_total": np.int16,
+    "goalie_pulled": np.int8,
+    "players_on_ice_differential": np.int8,
+    "players_on_ice_total": np.int8,
+    "takeaway_differential": np.int16,
+    "takeaway_total": np.int16,
+    "hit_differential": np.int16,
+    "hit_total": np.int16,
+    "block_differential": np.int16,
+    "block_total": np.int16,
+    "giveaway_differential": np.int16,
+    "giveaway_total": np.int16,
+    "goalie_change": np.int8,
+    "toi_skew_differential": np.float32,
+    "last_goal": np.int8,
+    "xg_differential": np.float32,
+    "xg_total": np.float32,
+    "winner": np.int8,
+}
+
+# what the model is fit and scored on, random forests convert anything else to float32 themselves
+MODEL_DTYPE = np.float32
+
+
+def apply_schema(accumulated_df):
+    unknown = [c for c in accumulated_df.columns if c not in FEATURE_SCHEMA]
+    assert not unknown, f"Columns {unknown} are not in the feature schema."
+    return accumulated_df.astype({c: FEATURE_SCHEMA[c] for c in accumulated_df.columns})
+
+
+def accumulated_data_filename(game_folder):
+    # the saved accumulation of a game, None when the game has not been accumulated
+    for name in ["accumulated_data.parquet", "accumulated_data.csv"]:
+        if os.path.isfile(os.path.join(game_folder, name)):
+            return os.path.join(game_folder, name)
+    return None
+
+
+def has_accumulated_data(game_folder):
+    return accumulated_data_filename(game_folder) is not None
+
+
+def save_accumulated_data(accumulated_df, game_folder):
+    apply_schema(accumulated_df).to_parquet(
+        os.path.join(game_folder, "accumulated_data.parquet"), index=False
+    )
+
+
+def read_accumulated_data(game_folder):
+    filename = accumulated_data_filename(game_folder)
+    assert filename is not None, f"No accumulated data in {game_folder}."
+    if filename.endswith(".parquet"):
+        return apply_schema(pd.read_parquet(filename))
+    # csv from before the schema, read straight into the schema dtypes
+    header = pd.read_csv(filename, nrows=0).columns
+    return apply_schema(
+        pd.read_csv(filename, dtype={c: FEATURE_SCHEMA.get(c) for c in header})
+    )
+
+
+# model inputs in the order the model sees them, the rest of the schema (gameId, playId, time_remaining, winner) is
+#  never a model input
+# todo investigate further the difference in training between using time_remaining and time_remaining_neg,
+#  I see some plots do not end at 100% or 0% and I believe because that is because there is data where
+#  time_remaining=0 (overtime) and the game is still undecided. Would be better if there was a better way to
+#  represent overtime and still know that it is sudden death.
+FEATURE_COLUMNS = [
+    "time_remaining_neg",
+    "goal_differential",
+    "goal_total",
+    "shot_differential",
+    "shot_total",
+    "faceoff_differential",
+    "faceoff_total",
+    "goalie_pulled",
+    "players_on_ice_differential",
+    "players_on_ice_total",
+    "takeaway_differential",
+    "takeaway_total",
+    "hit_differential",
+    "hit_total",
+    "block_differential",
+    "block_total",
+    "giveaway_differential",
+    "giveaway_total",
+    "goalie_change",
+    "toi_skew_differential",
+    "last_goal",
+    "xg_differential",
+    "xg_total",
+]
+
+
+def model_columns(available_columns):
+    # registry order no matter the order columns were stored in, optional columns (expected goals) only when present
+    return [c for c in FEATURE_COLUMNS if c in available_columns]
+
+
+def model_matrix(accumulated, columns):
+    # accumulated is a DataFrame or dict of columns, every column is written once into the model dtype matrix
+    X = np.empty((len(accumulated[columns[0]]), len(columns)), dtype=MODEL_DTYPE)
+    for column_ind, column in enumerate(columns):
+        X[:, column_ind] = accumulated[column]
+    return X
+
+
+def fitted_columns(clf, available_columns):
+    # the columns a model was fit on, saved on it as feature_columns when it is trained, models from before that were
+    #  fit on the stored order which is the registry order
+    columns = getattr(clf, "feature_columns", None)
+    if columns is None:
+        columns = model_columns(available_columns)
+    assert clf.n_features_in_ == len(
+        columns
+    ), f"Model was fit on {clf.n_features_in_} features, data has {len(columns)}."
+    missing = [c for c in columns if c not in available_columns]
+    assert not missing, f"Columns {missing} the model was fit on are missing."
+    return columns
@@ -0,0 +1,233 @@
+import os
+import time
+import random
+import threading
+from urllib.parse import quote
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import requests
+
+from nhl_requests import default_base_urls, set_base_urls
+
+# local stand in for statsapi.web.nhl.com and the nhl.com html reports, serving a recorded corpus so fetching can be
+#  benchmarked and regression tested without the real services
+# a corpus is a folder with one subfolder per base url (statsapi, htmlreports), every document saved under its path
+#  and query quoted into one file name, e.g. fixtures/default/htmlreports/%2F20212022%2FPL030234.HTM
+# the server answers http://host:port/{base}/{path}, point the fetch layer at it with use_fixture_server(server)
+#  or the NHL_STATSAPI_URL and NHL_HTMLREPORTS_URL environment variables
+# every response can be delayed (latency plus uniform jitter in seconds) and fail with error_status at error_rate,
+#  which nhl_requests.nhl_get retries with backoff (NHL_RETRY_BACKOFF)
+# in record mode documents missing from the corpus are fetched from the real services and saved
+# no corpus is committed, the benchmark's default corpus is recorded once with
+#  python fixture_server.py --corpus default --record-games 2021020001 2021020002 2021020003 2021020004 2021020005
+
+
+def fixtures_folder():
+    return os.path.join(os.path.dirname(__file__), "fixtures")
+
+
+def fixture_filename(corpus_folder, base, path):
+    return os.path.join(corpus_folder, base, quote(path, safe=""))
+
+
+def not_found_html():
+    # the html reports answer missing documents with a page titled 404 Not Found, which the request functions retry
+    return b"<html><head><title>404 Not Found</title></head><body></body></html>"
+
+
+def not_found_json():
+    # statsapi answers a game it does not know with a 404 and this message, which live_feed_json turns into None
+    return b'{"messageNumber": 2, "message": "Game data couldn\'t be found"}'
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.stats["requests"] += 1
+            delay = server.latency + server.rng.uniform(0, server.jitter)
+            inject_error = server.rng.random() < server.error_rate
+        if delay > 0:
+            time.sleep(delay)
+
+        if inject_error:
+            with server.lock:
+                server.stats["errors"] += 1
+            self._respond(server.error_status, b"", "text/plain")
+            return
+
+        base, _, path = self.path.lstrip("/").partition("/")
+        path = "/" + path
+        if base not in default_base_urls:
+            self._respond(404, b"", "text/plain")
+            return
+
+        filename = fixture_filename(server.corpus_folder, base, path)
+        if not os.path.isfile(filename) and server.record:
+            self._record(base, path, filename)
+
+        if os.path.isfile(filename):
+            with open(filename, "rb") as rf:
+                content = rf.read()
+            with server.lock:
+                server.stats["served"] += 1
+                server.stats["bytes"] += len(content)
+            self._respond(200, content, self._content_type(base))
+        else:
+            with server.lock:
+                server.stats["missing"] += 1
+            if base == "htmlreports":
+                self._respond(404, not_found_html(), "text/html")
+            else:
+                self._respond(404, not_found_json(), "application/json")
+
+    def _record(self, base, path, filename):
+        response = requests.get(default_base_urls[base] + path)
+        if response.status_code != 200:
+            return
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        tmp_filename = f"{filename}.{threading.get_ident()}.tmp"
+        with open(tmp_filename, "wb") as wf:
+            wf.write(response.content)
+        os.replace(tmp_filename, filename)
+        with self.server.lock:
+            self.server.stats["recorded"] += 1
+
+    @staticmethod
+    def _content_type(base):
+        return "application/json" if base == "statsapi" else "text/html"
+
+    def _respond(self, status, content, content_type):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+def start_fixture_server(
+    corpus="default",
+    host="127.0.0.1",
+    port=0,
+    latency=0.0,
+    jitter=0.0,
+    error_rate=0.0,
+    error_status=503,
+    record=False,
+    seed=645,
+    verbose=False,
+):
+    # serves from a background thread, port=0 picks a free port, stop with server.shutdown()
+    server = ThreadingHTTPServer((host, port), FixtureHandler)
+    server.daemon_threads = True
+    server.corpus_folder = os.path.join(fixtures_folder(), corpus)
+    server.latency = latency
+    server.jitter = jitter
+    server.error_rate = error_rate
+    server.error_status = error_status
+    server.record = record
+    server.verbose = verbose
+    server.rng = random.Random(seed)
+    server.lock = threading.Lock()
+    server.stats = {
+        "requests": 0,
+        "served": 0,
+        "missing": 0,
+        "errors": 0,
+        "recorded": 0,
+        "bytes": 0,
+    }
+    server.base_urls = {
+        base: f"http://{host}:{server.server_address[1]}/{base}"
+        for base in default_base_urls
+    }
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def use_fixture_server(server):
+    set_base_urls(**server.base_urls)
+
+
+def use_real_services():
+    set_base_urls(**default_base_urls)
+
+
+def season_of(game_id):
+    return f"{str(game_id)[:4]}{int(str(game_id)[:4]) + 1}"
+
+
+def record_corpus(corpus, game_ids):
+    # fetches everything the benchmark and the collection read for game_ids through a recording server, so the
+    #  corpus is fixtures/{corpus} built from the real services, documents already in it are not fetched again
+    from nhl_requests import endpoint_url, nhl_get, nhl_live_feed_content
+    from nhl_requests import report_content
+    from player_identity import add_season, empty_identity_index
+
+    server = start_fixture_server(corpus=corpus, record=True)
+    use_fixture_server(server)
+    try:
+        for season_year in sorted({season_of(game_id) for game_id in game_ids}):
+            nhl_get(endpoint_url("schedule", season_year=season_year), "schedule")
+            # teams and rosters of the season, what the shift parser's identity index is built from
+            add_season(empty_identity_index(), season_year)
+        for game_id in game_ids:
+            nhl_live_feed_content(game_id)
+            for name, document in [
+                ("pbp_report", "pbp"),
+                ("home_shifts_report", "shifts"),
+                ("away_shifts_report", "shifts"),
+            ]:
+                assert (
+                    report_content(name, game_id, document) is not None
+                ), f"No {name} for {game_id}."
+    finally:
+        server.shutdown()
+        use_real_services()
+    return server.stats
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--corpus", type=str, default="default")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--record", action="store_true")
+    parser.add_argument(
+        "--record-games", nargs="+", default=None, help="record these games and exit"
+    )
+    parser.add_argument("--verbose", action="store_true")
+
+    args = parser.parse_args()
+
+    if args.record_games is not None:
+        print(record_corpus(args.corpus, args.record_games))
+        raise SystemExit
+
+    server = start_fixture_server(
+        corpus=args.corpus,
+        port=args.port,
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        record=args.record,
+        verbose=args.verbose,
+    )
+    print(f"Serving fixtures/{args.corpus} on port {server.server_address[1]}.")
+    for base, url in server.base_urls.items():
+        print(f"export NHL_{base.upper()}_URL={url}")
+    try:
+        while True:
+            time.sleep(60)
+            print(server.stats)
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,134 @@
+import os
+import json
+import glob
+from pathlib import Path
+import pandas as pd
+import numpy as np
+
+from instrumentation import progress
+
+# one json file per season keyed by gameId so game metadata is a single read instead of globbing game folders
+# gameId -> {game_type, date, home_team, away_team, home_goals, away_goals, winner, goals: [[elapsed, side], ...]}
+# elapsed is seconds since the start of the game (can be > 3600 in overtime), side is "home" or "away"
+
+_loaded_indexes = {}
+
+
+def game_index_filename(season_year):
+    return os.path.join(
+        os.path.dirname(__file__), "data", season_year, "game_index.json"
+    )
+
+
+def summarize_game(live_df, game_type, home_team, away_team, date=None):
+    # goal events pulled from the live data columns in one pass rather than per play
+    home_goal = live_df["home_goal"].to_numpy() == 1
+    away_goal = live_df["away_goal"].to_numpy() == 1
+    is_goal = home_goal | away_goal
+    elapsed = 20 * 3 * 60 - live_df["timestamp"].to_numpy()[is_goal]
+    sides = np.where(home_goal[is_goal], "home", "away")
+
+    if live_df["home_win"].to_list()[-1]:
+        winner = "home"
+    elif live_df["away_win"].to_list()[-1]:
+        winner = "away"
+    else:
+        raise NotImplementedError
+
+    return {
+        "game_type": game_type,
+        "date": date,
+        "home_team": home_team,
+        "away_team": away_team,
+        "home_goals": int(home_goal.sum()),
+        "away_goals": int(away_goal.sum()),
+        "winner": winner,
+        "goals": [[int(e), str(s)] for e, s in zip(elapsed, sides)],
+    }
+
+
+def summarize_scheduled_game(live_df, game_data):
+    # game_data is one entry of dates -> games from the schedule endpoint
+    return summarize_game(
+        live_df,
+        game_data["gameType"],
+        game_data["teams"]["home"]["team"]["name"],
+        game_data["teams"]["away"]["team"]["name"],
+        date=game_data["gameDate"][:10],
+    )
+
+
+def load_game_index(season_year):
+    filename = game_index_filename(season_year)
+    if not os.path.isfile(filename):
+        return {}
+
+    # reuse the parsed index until the file changes on disk
+    mtime = os.path.getmtime(filename)
+    if season_year in _loaded_indexes and _loaded_indexes[season_year][0] == mtime:
+        return _loaded_indexes[season_year][1]
+
+    with open(filename, "r") as json_file:
+        game_index = json.load(json_file)
+    _loaded_indexes[season_year] = (mtime, game_index)
+    return game_index
+
+
+def save_game_index(season_year, game_index):
+    filename = game_index_filename(season_year)
+    if not os.path.isdir(os.path.dirname(filename)):
+        os.makedirs(os.path.dirname(filename))
+
+    # write then rename so a reader never sees a half written index
+    tmp_filename = f"{filename}.{os.getpid()}.tmp"
+    with open(tmp_filename, "w") as json_file:
+        json.dump(game_index, json_file, sort_keys=True)
+    os.replace(tmp_filename, filename)
+    _loaded_indexes.pop(season_year, None)
+
+
+def update_game_index(season_year, game_summaries):
+    # game_summaries is gameId -> summary, existing entries are overwritten
+    game_index = dict(load_game_index(season_year))
+    game_index.update({str(k): v for k, v in game_summaries.items()})
+    save_game_index(season_year, game_index)
+
+
+def get_game_info(season_year, game_id):
+    game_index = load_game_index(season_year)
+    if str(game_id) not in game_index:
+        raise Exception(f"gameId {game_id} is not in the game index for {season_year}.")
+    return game_index[str(game_id)]
+
+
+def build_game_index(season_year):
+    # backfill the index for games ingested before it existed, uses the .txt marker and live data of each game
+    game_index = load_game_index(season_year)
+    game_folders = glob.glob(
+        os.path.join(os.path.dirname(__file__), "data", season_year, "*")
+    )
+    game_summaries = {}
+    for game_folder in game_folders:
+        if Path(game_folder).stem in game_index:
+            continue
+
+        marker_filenames = glob.glob(os.path.join(game_folder, "*.txt"))
+        live_filename = os.path.join(game_folder, "live_data.csv")
+        if len(marker_filenames) != 1 or not os.path.isfile(live_filename):
+            continue
+
+        game_type, away_team, _, home_team = Path(marker_filenames[0]).stem.split("_")
+        live_df = pd.read_csv(live_filename)
+        game_summaries[Path(game_folder).stem] = summarize_game(
+            live_df,
+            game_type,
+            home_team.replace("-", " "),
+            away_team.replace("-", " "),
+        )
+
+    update_game_index(season_year, game_summaries)
+    progress(f"Indexed {len(game_summaries)} games for {season_year}.")
+
+
+if __name__ == "__main__":
+    build_game_index("20202021")
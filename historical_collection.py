@@ -1,14 +1,37 @@
 import re
 import time
-import requests
 import os
+import threading
+from collections import defaultdict
 from pathlib import Path
+import pandas as pd
 
+import instrumentation
+from instrumentation import count, progress, stage
 from nhl_requests import (
-    fetch_to_df_nhl_pbp,
-    fetch_to_df_nhl_shifts,
-    fetch_to_df_nhl_live_feed,
+    html_soup,
+    live_feed_json,
+    nhl_live_feed_content,
+    parse_nhl_live_events,
+    parse_nhl_live_feed,
+    parse_nhl_pbp,
+    parse_nhl_shifts,
+    report_content,
 )
+from dangerous_shot import parse_nhl_live_shots
+from game_index import summarize_scheduled_game, update_game_index
+from pipeline import pipeline_stage, run_pipeline
+from schedule_sync import games_to_ingest, mark_ingested, sync_schedule
+
+# the documents of a game, saved as {document}.csv in its folder, live_shots is the shot view of the live feed
+#  dangerous_shot.py builds its shot tables from
+game_documents = [
+    "live_data",
+    "live_shots",
+    "pbp_data",
+    "away_shifts_data",
+    "home_shifts_data",
+]
 
 
 # minutes/seconds left in the game
@@ -38,10 +61,41 @@ from nhl_requests import (
 # https://www.stephenpettigrew.com/articles/pettigrew_nhl_win_probs.pdf
 # http://homepage.divms.uiowa.edu/~dzimmer/sports-statistics/nettletonandlock.pdf
 
+
+def parse_game_document(game_id, document, content):
+    # runs in the parse worker processes, html parsing is what a game's collection spends its cpu time on
+    if document == "live_data":
+        # both views of the live feed from one pass over its plays
+        live_json = live_feed_json(content)
+        live_events = parse_nhl_live_events(live_json)
+        return [
+            (game_id, "live_data", parse_nhl_live_feed(live_json, live_events)),
+            (
+                game_id,
+                "live_shots",
+                pd.DataFrame(parse_nhl_live_shots(live_json, live_events)),
+            ),
+        ]
+    elif document == "pbp_data":
+        df = parse_nhl_pbp(html_soup(content, "pbp"), game_id)
+    else:
+        df = parse_nhl_shifts(html_soup(content, "shifts"), game_id)
+    return [(game_id, document, df)]
+
+
 # function to go through each season and each game (avoid preseason, all star game)
 # this function will feed the json output
 # save each game separately
-def build_season_data(season_year):
+# games go through a pipeline: fetch threads download a game's documents, parse processes turn them into DataFrames
+#  and persist threads write them, so downloads, parsing and writing of different games overlap (see pipeline.py)
+def build_season_data(
+    season_year,
+    fetch_workers=8,
+    parse_workers=None,
+    persist_workers=2,
+    queue_size=16,
+    save_every=50,
+):
 
     assert isinstance(season_year, str)
     assert len(season_year) == 8
@@ -54,159 +108,164 @@ def build_season_data(season_year):
     if not os.path.isdir(os.path.join(os.path.dirname(__file__), "data", season_year)):
         os.makedirs(os.path.join(os.path.dirname(__file__), "data", season_year))
 
-    # pull all season games to get game ids
-    season_request = requests.get(
-        f"https://statsapi.web.nhl.com/api/v1/schedule?season={season_year}"
-    ).json()
-
-    print(f"Beginning data pull for season {season_year}")
-    for i, game_date_dict in enumerate(season_request["dates"]):
-        print(f'Starting day {i + 1} out of {len(season_request["dates"])}')
-        games_data = game_date_dict["games"]
-        for game_data in games_data:
-            game_id = str(game_data["gamePk"])
-
-            game_type = game_data["gameType"]
-            if game_type not in ["R", "P"]:
-                print(
-                    f"gameId {game_id} is not a regular season or playoff game. Continuing."
-                )
-                continue
-
-            game_directory_exists = os.path.isdir(
-                os.path.join(os.path.dirname(__file__), "data", season_year, game_id)
-            )
-            live_data_exists = os.path.isfile(
-                os.path.join(
-                    os.path.dirname(__file__),
-                    "data",
-                    season_year,
-                    game_id,
-                    "live_data.csv",
-                )
-            )
-            pbp_data_exists = os.path.isfile(
-                os.path.join(
-                    os.path.dirname(__file__),
-                    "data",
-                    season_year,
-                    game_id,
-                    "pbp_data.csv",
-                )
-            )
-            away_shifts_data_exists = os.path.isfile(
-                os.path.join(
-                    os.path.dirname(__file__),
-                    "data",
-                    season_year,
-                    game_id,
-                    "away_shifts_data.csv",
-                )
-            )
-            home_shifts_data_exists = os.path.isfile(
-                os.path.join(
-                    os.path.dirname(__file__),
-                    "data",
-                    season_year,
-                    game_id,
-                    "home_shifts_data.csv",
-                )
-            )
+    # only the dates that can still change are asked for, the local schedule knows what is already saved
+    schedule = sync_schedule(season_year)
+    pending_games = games_to_ingest(schedule)
+    count(
+        "skipped_games.collect",
+        sum(g["gameType"] not in ["R", "P"] for g in schedule["games"].values()),
+    )
+    count(
+        "cache_hits.collect",
+        sum(g["ingested"] for g in schedule["games"].values()),
+    )
 
-            if (
-                game_directory_exists
-                and live_data_exists
-                and pbp_data_exists
-                and away_shifts_data_exists
-                and home_shifts_data_exists
-            ):
-                print(f"All data found for {game_id} in {season_year}. Continuing.")
-                continue
-
-            if not game_directory_exists:
-                os.makedirs(
-                    os.path.join(
-                        os.path.dirname(__file__), "data", season_year, game_id
-                    )
-                )
-
-            start = time.time()
-
-            live_df = fetch_to_df_nhl_live_feed(game_id)
-            live_df.to_csv(
-                os.path.join(
-                    os.path.dirname(__file__),
-                    "data",
-                    season_year,
-                    game_id,
-                    "live_data.csv",
-                ),
-                index=False,
-            )
-            print(f"Saved live data for gameID {game_id}.")
-
-            pbp_df = fetch_to_df_nhl_pbp(game_id)
-            pbp_df.to_csv(
-                os.path.join(
-                    os.path.dirname(__file__),
-                    "data",
-                    season_year,
-                    game_id,
-                    "pbp_data.csv",
-                ),
-                index=False,
-            )
-            print(f"Saved pbp data for gameID {game_id}.")
-
-            away_shifts_df, home_shifts_df = fetch_to_df_nhl_shifts(game_id)
-            away_shifts_df.to_csv(
-                os.path.join(
-                    os.path.dirname(__file__),
-                    "data",
-                    season_year,
-                    game_id,
-                    "away_shifts_data.csv",
-                ),
-                index=False,
-            )
-            print(f"Saved away shift data for gameID {game_id}.")
-            home_shifts_df.to_csv(
-                os.path.join(
-                    os.path.dirname(__file__),
-                    "data",
-                    season_year,
-                    game_id,
-                    "home_shifts_data.csv",
-                ),
-                index=False,
+    progress(
+        f"Beginning data pull for season {season_year}, {len(pending_games)} games to collect",
+        season=season_year,
+    )
+    if not len(pending_games):
+        return None
+
+    # the shift parsers of every worker process read the season's rosters from the identity index, built here once
+    from player_identity import load_identity_index
+
+    load_identity_index(season_year)
+
+    # a game is finished once all of its documents are written, parsed live data is kept until then for the index
+    # the index entries and ingested marks of finished games are saved every save_every games and at the end, so
+    #  the season files are not rewritten for every game, games finished since the last save are collected again
+    #  after an interruption
+    game_starts = {}
+    finished_summaries = {}
+    live_dfs = {}
+    written = defaultdict(int)
+    finished_games = []
+    finish_lock = threading.Lock()
+
+    def fetch_game(game_id, game_data):
+        game_starts[game_id] = time.time()
+        yield game_id, "live_data", nhl_live_feed_content(game_id)
+        yield game_id, "pbp_data", report_content("pbp_report", game_id, "pbp")
+        yield game_id, "away_shifts_data", report_content(
+            "away_shifts_report", game_id, "shifts"
+        )
+        yield game_id, "home_shifts_data", report_content(
+            "home_shifts_report", game_id, "shifts"
+        )
+
+    def persist_document(game_id, document, df):
+        game_folder = os.path.join(
+            os.path.dirname(__file__), "data", season_year, game_id
+        )
+        os.makedirs(game_folder, exist_ok=True)
+        df.to_csv(os.path.join(game_folder, f"{document}.csv"), index=False)
+
+        with finish_lock:
+            if document == "live_data":
+                live_dfs[game_id] = df
+            written[game_id] += 1
+            if written[game_id] < len(game_documents):
+                return None
+            finish_game(game_id, live_dfs.pop(game_id))
+
+    def finish_game(game_id, live_df):
+        game_data = schedule["games"][game_id]
+        game_type = game_data["gameType"]
+        home_team = "-".join(game_data["teams"]["home"]["team"]["name"].split(" "))
+        away_team = "-".join(game_data["teams"]["away"]["team"]["name"].split(" "))
+        Path(
+            os.path.join(
+                os.path.dirname(__file__),
+                "data",
+                season_year,
+                game_id,
+                f"{game_type}_{away_team}_at_{home_team}.txt",
             )
-            print(f"Saved home shift data for gameID {game_id}.")
+        ).touch()
+        finished_summaries[game_id] = summarize_scheduled_game(live_df, game_data)
+        finished_games.append(game_id)
+        if len(finished_summaries) >= save_every:
+            save_finished_games()
+
+        end = time.time()
+        instrumentation.add_time(
+            "game.collect", end - game_starts[game_id], game_id=game_id
+        )
+        count("games.collect")
+        progress(
+            f"Finished gameId {game_id} ({len(finished_games)} out of {len(pending_games)}) "
+            f"in {end - game_starts[game_id]:.2f} seconds.",
+            game_id=game_id,
+        )
 
-            home_team = "-".join(game_data["teams"]["home"]["team"]["name"].split(" "))
-            away_team = "-".join(game_data["teams"]["away"]["team"]["name"].split(" "))
-            Path(
-                os.path.join(
-                    os.path.dirname(__file__),
-                    "data",
-                    season_year,
-                    game_id,
-                    f"{game_type}_{away_team}_at_{home_team}.txt",
-                )
-            ).touch()
+    def save_finished_games():
+        # the index first, a game marked ingested is always in it
+        if not len(finished_summaries):
+            return None
+        update_game_index(season_year, finished_summaries)
+        mark_ingested(season_year, schedule, list(finished_summaries))
+        finished_summaries.clear()
 
-            end = time.time()
-            print(f"Finished gameId {game_id} in {end-start:.2f} seconds.")
+    try:
+        return run_pipeline(
+            pending_games,
+            [
+                pipeline_stage("fetch", fetch_game, workers=fetch_workers),
+                pipeline_stage(
+                    "parse",
+                    parse_game_document,
+                    workers=parse_workers or os.cpu_count(),
+                    processes=True,
+                    initializer=load_identity_index,
+                    initargs=(season_year,),
+                ),
+                pipeline_stage("persist", persist_document, workers=persist_workers),
+            ],
+            queue_size=queue_size,
+        )
+    finally:
+        with finish_lock:
+            save_finished_games()
 
 
-def build_database():
-    seasons = ["2017", "2018", "2019", "2020", "2021"]
-    seasons = ["2020"]
+def build_database(seasons=None, **pipeline_options):
+    if seasons is None:
+        seasons = ["2020"]
 
     for season in seasons:
         season_year = f"{season}{int(season) + 1}"
 
-        build_season_data(season_year)
+        with stage("collect", season=season_year):
+            build_season_data(season_year, **pipeline_options)
 
 
 if __name__ == "__main__":
-    build_database()
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--seasons", nargs="+", default=["2020"], help="e.g. 2017 2018 2019"
+    )
+    parser.add_argument("--fetch-workers", type=int, default=8, help="threads")
+    parser.add_argument(
+        "--parse-workers", type=int, default=None, help="processes, default cpu count"
+    )
+    parser.add_argument("--persist-workers", type=int, default=2, help="threads")
+    parser.add_argument(
+        "--queue-size", type=int, default=16, help="documents between stages"
+    )
+
+    instrumentation.add_arguments(parser)
+
+    args = parser.parse_args()
+    instrumentation.setup_from_args(args)
+
+    build_database(
+        args.seasons,
+        fetch_workers=args.fetch_workers,
+        parse_workers=args.parse_workers,
+        persist_workers=args.persist_workers,
+        queue_size=args.queue_size,
+    )
+    instrumentation.finish(args)
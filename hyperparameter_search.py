@@ -0,0 +1,251 @@
+import os
+import json
+import time
+import hashlib
+import itertools
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.metrics import brier_score_loss, log_loss
+from sklearn.model_selection import GroupKFold
+
+from instrumentation import progress, warning
+from train import (
+    cache_season_matrix,
+    feature_matrix_folder,
+    load_matrix,
+    load_season_matrices,
+    save_matrix,
+)
+
+# search over random forest hyperparameters and feature subsets
+# the training matrix is built once per search (several seasons are stacked into model/search/{name}-matrix) and
+#  every trial memory maps it in its own worker, so it is never copied between processes, and is cross validated
+#  with folds grouped by game so plays of one game are never on both sides of a fold
+# finished trials are appended to model/search/{name}.jsonl as they complete, running the same search again skips
+#  them, so an interrupted search resumes where it stopped
+# a trial is identified by its parameters and feature subset and by the data it ran on (seasons, folds, seed, the
+#  columns of the matrix and a fingerprint of the games and accumulated files the season matrices were cached from),
+#  trials of the same name run on other data, or on a season since collected or accumulated again, are neither
+#  skipped nor ranked with the new ones
+
+param_grid = {
+    "n_estimators": [100, 300],
+    "max_depth": [None, 12, 20],
+    "min_samples_leaf": [1, 20, 100],
+    "max_features": ["sqrt", 0.5],
+}
+
+# a subset either lists the columns to keep or the columns to drop from the cached matrix
+feature_subsets = {
+    "all": {"exclude": []},
+    "no_toi_skew": {"exclude": ["toi_skew_differential"]},
+    "no_event_totals": {
+        "exclude": [
+            "takeaway_total",
+            "hit_total",
+            "block_total",
+            "giveaway_total",
+            "faceoff_total",
+        ]
+    },
+    "score_and_time": {
+        "include": [
+            "time_remaining_neg",
+            "goal_differential",
+            "goal_total",
+            "goalie_pulled",
+            "players_on_ice_differential",
+            "last_goal",
+        ]
+    },
+}
+
+
+def subset_columns(feature_subset, columns):
+    subset = feature_subsets[feature_subset]
+    if "include" in subset:
+        return [columns.index(c) for c in subset["include"] if c in columns]
+    return [i for i, c in enumerate(columns) if c not in subset["exclude"]]
+
+
+def search_folder():
+    return os.path.join("model", "search")
+
+
+def calibration_error(y_true, y_pred_prob, num_bins=20):
+    # expected calibration error, the same 5% bins validate uses, weighted by how many predictions fall in each
+    bins = np.minimum((y_pred_prob * num_bins).astype(int), num_bins - 1)
+    counts = np.bincount(bins, minlength=num_bins)
+    pred_sums = np.bincount(bins, weights=y_pred_prob, minlength=num_bins)
+    true_sums = np.bincount(bins, weights=y_true, minlength=num_bins)
+    occupied = counts > 0
+    return float(np.abs(pred_sums[occupied] - true_sums[occupied]).sum() / counts.sum())
+
+
+def data_fingerprint(season_metas):
+    # games and accumulated file stamps of every season matrix (train.cache_season_matrix meta)
+    return hashlib.sha1(
+        json.dumps(
+            [[meta["games"], meta["stamps"]] for meta in season_metas], sort_keys=True
+        ).encode()
+    ).hexdigest()[:16]
+
+
+def search_context(season_years, n_splits, seed, columns, data):
+    return {
+        "season_years": list(season_years),
+        "n_splits": n_splits,
+        "seed": seed,
+        "columns": list(columns),
+        "data": data,
+    }
+
+
+def context_id(context):
+    return hashlib.sha1(json.dumps(context, sort_keys=True).encode()).hexdigest()[:12]
+
+
+def trial_id(params, feature_subset, context):
+    return hashlib.sha1(
+        json.dumps([params, feature_subset, context], sort_keys=True).encode()
+    ).hexdigest()[:12]
+
+
+def search_matrix(name, season_years):
+    # folder of the matrix the trials memory map, one season straight from its cache, several stacked here once
+    if len(season_years) == 1:
+        return feature_matrix_folder(season_years[0])
+    X, y, groups, columns = load_season_matrices(season_years)
+    folder = os.path.join(search_folder(), f"{name}-matrix")
+    save_matrix(folder, X, y, groups, {"columns": columns, "seasons": season_years})
+    return folder
+
+
+def run_trial(matrix_folder, params, feature_subset, context):
+    start = time.time()
+
+    X, y, groups, columns = load_matrix(matrix_folder)
+    assert columns == context["columns"]
+    column_inds = subset_columns(feature_subset, columns)
+    y_true = (np.asarray(y) == 1).astype(np.int8)
+
+    fold_log_loss, fold_brier, fold_calibration = [], [], []
+    for train_ind, val_ind in GroupKFold(n_splits=context["n_splits"]).split(
+        X, y_true, groups=groups
+    ):
+        clf = RandomForestClassifier(random_state=context["seed"], **params)
+        # np.ix_ reads the fold rows and columns from the memory map in a single copy
+        clf.fit(X[np.ix_(train_ind, column_inds)], y_true[train_ind])
+        y_pred_prob = clf.predict_proba(X[np.ix_(val_ind, column_inds)])[:, 1]
+        fold_log_loss.append(log_loss(y_true[val_ind], y_pred_prob, labels=[0, 1]))
+        fold_brier.append(brier_score_loss(y_true[val_ind], y_pred_prob))
+        fold_calibration.append(calibration_error(y_true[val_ind], y_pred_prob))
+
+    end = time.time()
+    return {
+        "trial_id": trial_id(params, feature_subset, context),
+        "context_id": context_id(context),
+        "params": params,
+        "feature_subset": feature_subset,
+        "season_years": context["season_years"],
+        "n_splits": context["n_splits"],
+        "seed": context["seed"],
+        "log_loss": float(np.mean(fold_log_loss)),
+        "log_loss_std": float(np.std(fold_log_loss)),
+        "brier": float(np.mean(fold_brier)),
+        "calibration_error": float(np.mean(fold_calibration)),
+        "seconds": end - start,
+    }
+
+
+def load_trials(name):
+    filename = os.path.join(search_folder(), f"{name}.jsonl")
+    if not os.path.isfile(filename):
+        return []
+    with open(filename, "r") as jsonl_file:
+        return [json.loads(line) for line in jsonl_file if line.strip()]
+
+
+def rank_trials(trials):
+    # best log loss first, calibration breaks ties
+    return sorted(
+        trials, key=lambda t: (round(t["log_loss"], 4), t["calibration_error"])
+    )
+
+
+def search(name, season_years, n_trials=None, n_splits=5, max_workers=None, seed=645):
+    # n_trials samples that many trials from the grid with seed, None runs the full grid
+    season_metas = [cache_season_matrix(season_year) for season_year in season_years]
+
+    keys = sorted(param_grid)
+    trials = [
+        (dict(zip(keys, values)), feature_subset)
+        for values in itertools.product(*[param_grid[k] for k in keys])
+        for feature_subset in feature_subsets
+    ]
+    if n_trials is not None and n_trials < len(trials):
+        perm = np.random.RandomState(seed).permutation(len(trials))
+        trials = [trials[i] for i in sorted(perm[:n_trials])]
+
+    matrix_folder = search_matrix(name, season_years)
+    _, _, _, columns = load_matrix(matrix_folder)
+    context = search_context(
+        season_years, n_splits, seed, columns, data_fingerprint(season_metas)
+    )
+
+    previous = load_trials(name)
+    other_context = sum(t.get("context_id") != context_id(context) for t in previous)
+    if other_context:
+        warning(
+            f"{other_context} trials of search {name} ran on other seasons, games, folds, seed or columns, they are not resumed or ranked."
+        )
+    done = {t["trial_id"] for t in previous}
+    todo = [t for t in trials if trial_id(*t, context) not in done]
+    progress(f"{len(trials) - len(todo)} trials already done, running {len(todo)}.")
+
+    if not os.path.isdir(search_folder()):
+        os.makedirs(search_folder())
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            executor.submit(run_trial, matrix_folder, params, feature_subset, context)
+            for params, feature_subset in todo
+        ]
+        for future in as_completed(futures):
+            result = future.result()
+            # checkpoint every trial as soon as it is done
+            with open(
+                os.path.join(search_folder(), f"{name}.jsonl"), "a"
+            ) as jsonl_file:
+                jsonl_file.write(json.dumps(result) + "\n")
+            progress(
+                f'Trial {result["trial_id"]} log loss {result["log_loss"]:.4f} calibration error {result["calibration_error"]:.4f} in {result["seconds"]:.2f} seconds.'
+            )
+
+    ranked = rank_trials(
+        [t for t in load_trials(name) if t.get("context_id") == context_id(context)]
+    )
+    for t in ranked[:10]:
+        progress(
+            f'{t["log_loss"]:.4f} (+/- {t["log_loss_std"]:.4f}) calibration error {t["calibration_error"]:.4f} brier {t["brier"]:.4f} {t["feature_subset"]} {t["params"]}'
+        )
+    return ranked
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--name", type=str, default="random-forest")
+    parser.add_argument("--seasons", nargs="+", default=["2020"])
+    parser.add_argument("--trials", type=int, default=None)
+    parser.add_argument("--workers", type=int, default=None)
+
+    args = parser.parse_args()
+
+    search(
+        args.name,
+        [f"{season}{int(season) + 1}" for season in args.seasons],
+        n_trials=args.trials,
+        max_workers=args.workers,
+    )
@@ -0,0 +1,209 @@
+import io
+import os
+import json
+import time
+import logging
+import cProfile
+import functools
+import pstats
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime
+
+# timers and counters for the collection, accumulation, training and rendering stages, so where the time of a season
+#  goes can be added up instead of read off per game prints
+# names are dotted, the first part is the kind of measurement:
+#  network.{document} seconds waiting on a request, bytes.{document} and requests.{document} what it returned
+#  soup.{document} html parsing, parse.{document} building the DataFrame, rows.{document} rows it produced
+#  cache_hits.{stage} games whose output already existed, skipped_rows.{stage} rows dropped on the way
+#  stage.{stage} the whole stage
+# summary() adds everything up per process, the NHL_TRACE_PATH file gets one json line per timed span and progress
+#  message (pid included so worker processes can share it)
+# stages listed in NHL_PROFILE_STAGES (comma separated, or all) run under cProfile, the stats are saved to
+#  profiles/{stage}-{pid}-{time}.prof and the top functions logged
+# both are environment variables so worker processes started afterwards inherit them, set with setup()
+
+logger = logging.getLogger("nhl_ml")
+if not logger.handlers:
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+    logger.addHandler(_handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+_lock = threading.Lock()
+_timers = defaultdict(lambda: [0, 0.0])
+_counters = defaultdict(int)
+_trace_file = None
+
+
+def profile_folder():
+    return os.path.join(os.path.dirname(__file__), "profiles")
+
+
+def setup(trace_path=None, profile_stages=None, quiet=False):
+    global _trace_file
+    if trace_path is not None:
+        os.environ["NHL_TRACE_PATH"] = trace_path
+        if _trace_file is not None:
+            _trace_file.close()
+            _trace_file = None
+    if profile_stages is not None:
+        os.environ["NHL_PROFILE_STAGES"] = ",".join(profile_stages)
+    logger.setLevel(logging.WARNING if quiet else logging.INFO)
+
+
+def add_arguments(parser):
+    parser.add_argument("--trace", type=str, default=None, help="json lines file")
+    parser.add_argument(
+        "--profile", nargs="+", default=None, help="stages to run under cProfile"
+    )
+    parser.add_argument("--summary", type=str, default=None, help="json file")
+    parser.add_argument("--quiet", action="store_true")
+
+
+def setup_from_args(args):
+    setup(trace_path=args.trace, profile_stages=args.profile, quiet=args.quiet)
+
+
+def _trace(record):
+    global _trace_file
+    trace_path = os.environ.get("NHL_TRACE_PATH")
+    if not trace_path:
+        return
+    record = {"time": time.time(), "pid": os.getpid(), **record}
+    with _lock:
+        if _trace_file is None:
+            if os.path.dirname(trace_path):
+                os.makedirs(os.path.dirname(trace_path), exist_ok=True)
+            _trace_file = open(trace_path, "a")
+        _trace_file.write(json.dumps(record, default=str) + "\n")
+        _trace_file.flush()
+
+
+def count(name, value=1):
+    with _lock:
+        _counters[name] += value
+
+
+def add_time(name, seconds, **fields):
+    # for spans timed somewhere else, e.g. in a worker process that returned its time
+    with _lock:
+        _timers[name][0] += 1
+        _timers[name][1] += seconds
+    _trace({"span": name, "seconds": seconds, **fields})
+
+
+@contextmanager
+def timer(name, **fields):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_time(name, time.perf_counter() - start, **fields)
+
+
+def timed(name):
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with timer(name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def progress(message, **fields):
+    logger.info(message)
+    _trace({"progress": message, **fields})
+
+
+def warning(message, **fields):
+    logger.warning(f"WARNING {message}")
+    _trace({"warning": message, **fields})
+
+
+def profiled_stages():
+    return [s for s in os.environ.get("NHL_PROFILE_STAGES", "").split(",") if s]
+
+
+@contextmanager
+def stage(name, **fields):
+    # times the stage and, when asked for, profiles it
+    stages = profiled_stages()
+    profiler = cProfile.Profile() if name in stages or "all" in stages else None
+    if profiler is not None:
+        profiler.enable()
+    try:
+        with timer(f"stage.{name}", **fields):
+            yield
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            os.makedirs(profile_folder(), exist_ok=True)
+            filename = os.path.join(
+                profile_folder(),
+                f"{name}-{os.getpid()}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.prof",
+            )
+            profiler.dump_stats(filename)
+            progress(f"Saved the {name} profile to {filename}.", profile=filename)
+            stream = io.StringIO()
+            pstats.Stats(profiler, stream=stream).sort_stats("cumulative").print_stats(
+                15
+            )
+            logger.info(stream.getvalue())
+
+
+def summary():
+    with _lock:
+        return {
+            "timers": {
+                name: {"calls": calls, "seconds": round(seconds, 6)}
+                for name, (calls, seconds) in sorted(_timers.items())
+            },
+            "counters": dict(sorted(_counters.items())),
+        }
+
+
+def merge(stats):
+    # adds a summary() of another process, e.g. a worker that ran part of a stage (its spans are already traced)
+    with _lock:
+        for name, timer_stats in stats["timers"].items():
+            _timers[name][0] += timer_stats["calls"]
+            _timers[name][1] += timer_stats["seconds"]
+        for name, value in stats["counters"].items():
+            _counters[name] += value
+
+
+def reset():
+    with _lock:
+        _timers.clear()
+        _counters.clear()
+
+
+def log_summary():
+    stats = summary()
+    for name, timer_stats in stats["timers"].items():
+        logger.info(
+            f"{name:<32} {timer_stats['seconds']:10.3f} s {timer_stats['calls']:8} calls"
+        )
+    for name, value in stats["counters"].items():
+        logger.info(f"{name:<32} {value:>12}")
+    _trace({"summary": stats})
+
+
+def write_summary(filename):
+    if os.path.dirname(filename):
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+    with open(filename, "w") as wf:
+        json.dump(summary(), wf, indent=2)
+
+
+def finish(args=None):
+    # end of a command line run, summary logged and written where --summary points
+    log_summary()
+    if args is not None and args.summary is not None:
+        write_summary(args.summary)
@@ -1,19 +1,158 @@
 import datetime
 import re
+import time
 
 import requests
-import yaml
 import os
 import json
-from bs4 import BeautifulSoup
-import pandas as pd
-from nltk import edit_distance
 
-if not os.path.isfile("nhl.yaml"):
-    openapi_url = "https://raw.githubusercontent.com/erunion/sport-api-specifications/master/nhl/nhl.yaml"
-    response = requests.get(openapi_url)
-    with open("nhl.yaml", "wb") as wf:
-        wf.write(response.content)
+from instrumentation import count, timed, timer, warning
+
+# bs4, pandas and yaml are imported by the functions that use them, importing this module (every worker process
+#  of the collection pools does) only needs requests and never goes to the network
+
+# local copy of the NHL API spec, NHL_SPEC_PATH points somewhere else, downloaded the first time load_nhl_spec is
+#  called without one
+nhl_spec_url = "https://raw.githubusercontent.com/erunion/sport-api-specifications/master/nhl/nhl.yaml"
+nhl_spec_path = os.environ.get(
+    "NHL_SPEC_PATH", os.path.join(os.path.dirname(__file__), "nhl.yaml")
+)
+_nhl_spec = None
+
+
+def load_nhl_spec(download=True):
+    global _nhl_spec
+    if _nhl_spec is None:
+        import yaml
+
+        if not os.path.isfile(nhl_spec_path):
+            assert download, f"No NHL API spec at {nhl_spec_path}."
+            response = requests.get(nhl_spec_url)
+            with open(nhl_spec_path, "wb") as wf:
+                wf.write(response.content)
+        with open(nhl_spec_path, "rb") as rf:
+            _nhl_spec = yaml.safe_load(rf)
+    return _nhl_spec
+
+
+# every url the collection uses, built with endpoint_url(name, **params)
+# the NHL_STATSAPI_URL and NHL_HTMLREPORTS_URL environment variables (or set_base_urls) point them somewhere else,
+#  e.g. the recorded corpus served by fixture_server.py
+default_base_urls = {
+    "statsapi": "https://statsapi.web.nhl.com/api/v1",
+    "htmlreports": "http://www.nhl.com/scores/htmlreports",
+}
+base_urls = {
+    base: os.environ.get(f"NHL_{base.upper()}_URL", url)
+    for base, url in default_base_urls.items()
+}
+endpoints = {
+    "teams": ("statsapi", "/teams"),
+    "season_teams": ("statsapi", "/teams?season={season_year}"),
+    "team_roster": ("statsapi", "/teams/{team_id}/roster?season={season_year}"),
+    "team_expanded_roster": ("statsapi", "/teams/{team_id}?expand=team.roster"),
+    "person": ("statsapi", "/people/{player_id}"),
+    "person_year_by_year": ("statsapi", "/people/{player_id}/stats?stats=yearByYear"),
+    "person_game_log": (
+        "statsapi",
+        "/people/{player_id}/stats?stats=gameLog&season={season_id}",
+    ),
+    "schedule": ("statsapi", "/schedule?season={season_year}"),
+    "schedule_dates": (
+        "statsapi",
+        "/schedule?startDate={start_date}&endDate={end_date}",
+    ),
+    "live_feed": ("statsapi", "/game/{game_id}/feed/live"),
+    "pbp_report": ("htmlreports", "/{season_id}/PL{game_identifier}.HTM"),
+    "home_shifts_report": ("htmlreports", "/{season_id}/TH{game_identifier}.HTM"),
+    "away_shifts_report": ("htmlreports", "/{season_id}/TV{game_identifier}.HTM"),
+}
+
+
+def set_base_urls(**urls):
+    # also exported to the environment so worker processes started afterwards use the same urls
+    for base, url in urls.items():
+        assert base in default_base_urls, f"Unknown base url {base}."
+        base_urls[base] = url.rstrip("/")
+        os.environ[f"NHL_{base.upper()}_URL"] = base_urls[base]
+
+
+def endpoint_url(name, **params):
+    base, path = endpoints[name]
+    return base_urls[base] + path.format(**params)
+
+
+def report_url(name, game_id):
+    # html reports are per season folder and the last six digits of the game id
+    season_id = f"{str(game_id)[:4]}{int(str(game_id)[:4]) + 1}"
+    return endpoint_url(name, season_id=season_id, game_identifier=str(game_id)[-6:])
+
+
+# server errors (5xx) and dropped connections are retried, waiting retry_backoff seconds and twice as long after
+#  every further failure, NHL_RETRY_BACKOFF sets it (0 for the fixture server)
+retry_attempts = 4
+retry_backoff = float(os.environ.get("NHL_RETRY_BACKOFF", "0.5"))
+
+
+def nhl_get(url, document):
+    # every request of the collection goes through here so network wait and bytes are counted per document type
+    # raises once a server error or dropped connection has been retried retry_attempts times, other status codes
+    #  are left to the caller
+    for attempt in range(retry_attempts):
+        if attempt > 0:
+            count(f"retries.{document}")
+            time.sleep(retry_backoff * 2 ** (attempt - 1))
+        try:
+            with timer(f"network.{document}"):
+                response = requests.get(url)
+        except requests.ConnectionError as e:
+            count(f"connection_errors.{document}")
+            error = e
+            continue
+        count(f"requests.{document}")
+        count(f"bytes.{document}", len(response.content))
+        if response.status_code < 500:
+            return response
+        count(f"server_errors.{document}")
+        error = requests.HTTPError(
+            f"{response.status_code} from {url}", response=response
+        )
+
+    count(f"failed.{document}")
+    warning(f"Giving up on {url} after {retry_attempts} attempts: {error}", url=url)
+    raise error
+
+
+# title of the page the html reports answer missing documents with, checked on the raw bytes so downloading a report
+#  does not need to parse it
+not_found_title = re.compile(rb"<title>\s*404 Not Found\s*</title>", re.IGNORECASE)
+
+
+def report_content(name, game_id, document):
+    # html reports answer missing documents with a 404 Not Found page, tried three times before giving up
+    for _ in range(3):
+        response = nhl_get(report_url(name, game_id), document)
+        if not_found_title.search(response.content) is None:
+            # anything else than the report or the not found page, e.g. an empty body with an error status
+            response.raise_for_status()
+            return response.content
+        count(f"not_found.{document}")
+
+    return None
+
+
+def html_soup(content, document):
+    from bs4 import BeautifulSoup
+
+    if content is None:
+        return None
+    with timer(f"soup.{document}"):
+        return BeautifulSoup(content, "html.parser")
+
+
+def report_soup(name, game_id, document):
+    return html_soup(report_content(name, game_id, document), document)
+
 
 avalanche_team_id = 21
 mckinnon_id = 8477492
@@ -64,10 +203,16 @@ latest_game_id = 2021030243
 # print(json.dumps(live_game_info_liveData, indent=2))
 
 
-def nhl_live_feed_request(game_id):
-    live_game_info = requests.get(
-        f"https://statsapi.web.nhl.com/api/v1/game/{game_id}/feed/live"
-    ).json()
+def nhl_live_feed_content(game_id):
+    response = nhl_get(endpoint_url("live_feed", game_id=game_id), "live_feed")
+    # a game the api does not know is answered with a 404 and a message, live_feed_json turns it into None
+    if response.status_code != 404:
+        response.raise_for_status()
+    return response.content
+
+
+def live_feed_json(content):
+    live_game_info = json.loads(content)
 
     if (
         "message" in live_game_info
@@ -78,157 +223,197 @@ def nhl_live_feed_request(game_id):
         return live_game_info
 
 
-def parse_nhl_live_feed(live_game_json):
-    # should return a pandas with the play by play data
-    df_dict = {
-        "gameId": [],
-        "playId": [],
-        "event": [],
-        "timestamp": [],
-        "home_faceoff_won": [],
-        "away_faceoff_won": [],
-        "home_hit": [],
-        "away_hit": [],
-        "home_goal": [],
-        "away_goal": [],
-        "home_giveaway": [],
-        "away_giveaway": [],
-        "home_takeaway": [],
-        "away_takeaway": [],
-        "home_block": [],
-        "away_block": [],
-        "home_shot": [],
-        "away_shot": [],
-        "shot_x": [],
-        "shot_y": [],
-        "home_penalty": [],
-        "away_penalty": [],
-        "home_win": [],
-        "away_win": [],
-    }
-
+def nhl_live_feed_request(game_id):
+    return live_feed_json(nhl_live_feed_content(game_id))
+
+
+# plays no view of the live feed uses, except when it is the last play of the game, which records the winner
+live_feed_skip_events = {
+    "Game Scheduled",
+    "Period Ready",
+    "Period Start",
+    "Period End",
+    "Period Official",
+    "Stoppage",
+    "Official Challenge",
+    "Game End",
+    "Shootout Complete",
+    "Early Intermission Start",
+    "Early Intermission End",
+    "Emergency Goaltender",
+}
+live_feed_shot_events = {"Blocked Shot", "Shot", "Missed Shot", "Goal"}
+# live feed event -> the {home|away}_{column} one hot column it counts for, a goal also counts as a shot
+live_feed_event_columns = {
+    "Blocked Shot": "block",
+    "Faceoff": "faceoff_won",
+    "Takeaway": "takeaway",
+    "Hit": "hit",
+    "Shot": "shot",
+    "Missed Shot": "shot",
+    "Penalty": "penalty",
+    "Giveaway": "giveaway",
+    "Goal": "goal",
+}
+live_feed_columns = [
+    "gameId",
+    "playId",
+    "event",
+    "timestamp",
+    "home_faceoff_won",
+    "away_faceoff_won",
+    "home_hit",
+    "away_hit",
+    "home_goal",
+    "away_goal",
+    "home_giveaway",
+    "away_giveaway",
+    "home_takeaway",
+    "away_takeaway",
+    "home_block",
+    "away_block",
+    "home_shot",
+    "away_shot",
+    "shot_x",
+    "shot_y",
+    "home_penalty",
+    "away_penalty",
+    "home_win",
+    "away_win",
+]
+
+
+@timed("parse.live_feed")
+def parse_nhl_live_events(live_game_json):
+    # one pass over liveData -> plays -> allPlays, one record per play either view of the live feed can use:
+    #  event, playId, timestamp (seconds remaining in regulation)
+    #  team -> away or home the play is attributed to, unknown for another triCode, None when the play has no team
+    #  shot_x, shot_y -> coordinates of shots, missed shots and goals, nan when the play has none, 0 otherwise
+    #  shooter_id, goalie_id -> of shots, -1 when not listed
+    # returned as columns next to the gameId and the final score
     # get triCode of home and away team gameData -> teams -> away/home -> triCode
     away_triCode = live_game_json["gameData"]["teams"]["away"]["triCode"]
     home_triCode = live_game_json["gameData"]["teams"]["home"]["triCode"]
+    teams = {away_triCode: "away", home_triCode: "home"}
 
-    # get gameId gameData -> game -> pk
-    gameId = live_game_json["gameData"]["game"]["pk"]
-
-    # go through each play of liveData -> plays -> allPlays and record relevant information
-    # ignore stoppages and period start and ends
+    records = []
     allPlays = live_game_json["liveData"]["plays"]["allPlays"]
+    last_play_ind = len(allPlays) - 1
     for play_ind, play_dict in enumerate(allPlays):
-
         assert "result" in play_dict and "event" in play_dict["result"]
         event = play_dict["result"]["event"]
-
-        if (
-            event
-            in [
-                "Game Scheduled",
-                "Period Ready",
-                "Period Start",
-                "Period End",
-                "Period Official",
-                "Stoppage",
-                "Official Challenge",
-                "Game End",
-                "Shootout Complete",
-                "Early Intermission Start",
-                "Early Intermission End",
-                "Emergency Goaltender",
-            ]
-            and play_ind < len(allPlays) - 1
-        ):
+        if event in live_feed_skip_events and play_ind < last_play_ind:
             continue
 
-        df_dict["gameId"].append(gameId)
-        df_dict["event"].append(event)
-
-        assert "about" in play_dict and "eventIdx" in play_dict["about"]
-        playId = play_dict["about"]["eventIdx"]
-        df_dict["playId"].append(playId)
-
-        assert "periodTime" in play_dict["about"] and "period" in play_dict["about"]
-        period = int(play_dict["about"]["period"])
-        minutes_gone_in_period = int(play_dict["about"]["periodTime"].split(":")[0])
-        seconds_gone_in_period = int(play_dict["about"]["periodTime"].split(":")[1])
+        assert "about" in play_dict
+        about = play_dict["about"]
+        assert "eventIdx" in about and "periodTime" in about and "period" in about
+        period = int(about["period"])
+        minutes_gone_in_period, seconds_gone_in_period = about["periodTime"].split(":")
         seconds_remaining_in_game = 20 * 3 * 60 - (
             20 * 60 * (period - 1)
-            + 60 * minutes_gone_in_period
-            + seconds_gone_in_period
+            + 60 * int(minutes_gone_in_period)
+            + int(seconds_gone_in_period)
         )
-        df_dict["timestamp"].append(seconds_remaining_in_game)
-
-        if (event == "Game Official" or event == "Game End") and play_ind == len(
-            allPlays
-        ) - 1:
-            # end of game, record who won based on goals scored
-            assert (
-                not live_game_json["liveData"]["linescore"]["teams"]["home"]["goals"]
-                == live_game_json["liveData"]["linescore"]["teams"]["away"]["goals"]
-            )
-            event_ = "win"
-            team_ = (
-                "home"
-                if live_game_json["liveData"]["linescore"]["teams"]["home"]["goals"]
-                > live_game_json["liveData"]["linescore"]["teams"]["away"]["goals"]
-                else "away"
-            )
 
-        else:
-            # normal play, record which team play is attributed to and the type of play
-            assert "team" in play_dict and "triCode" in play_dict["team"]
-            if play_dict["team"]["triCode"] == away_triCode:
-                team_ = "away"
-            elif play_dict["team"]["triCode"] == home_triCode:
-                team_ = "home"
-            else:
-                raise NotImplementedError
-
-            shot_xy = None
-            if event == "Blocked Shot":
-                event_ = "block"
-            elif event == "Faceoff":
-                event_ = "faceoff_won"
-            elif event == "Takeaway":
-                event_ = "takeaway"
-            elif event == "Hit":
-                event_ = "hit"
-            elif event in ["Shot", "Missed Shot"]:
-                event_ = "shot"
-
-                assert "coordinates" in play_dict
-                shot_xy = play_dict["coordinates"]
-            elif event == "Penalty":
-                event_ = "penalty"
-            elif event == "Giveaway":
-                event_ = "giveaway"
-            elif event == "Goal":
-                event_ = "goal"
+        team = play_dict.get("team", {}).get("triCode")
+        if team is not None:
+            team = teams.get(team, "unknown")
 
+        shot_x, shot_y, shooter_id, goalie_id = 0, 0, -1, -1
+        if event in live_feed_shot_events:
+            if not event == "Blocked Shot":
                 assert "coordinates" in play_dict
-                shot_xy = play_dict["coordinates"]
-            else:
-                raise NotImplementedError
-
-            if shot_xy is not None and len(shot_xy):
-                df_dict["shot_x"].append(shot_xy["x"])
-                df_dict["shot_y"].append(shot_xy["y"])
+                shot_x = play_dict["coordinates"].get("x", float("nan"))
+                shot_y = play_dict["coordinates"].get("y", float("nan"))
+            players = {
+                d["playerType"]: d["player"]["id"] for d in play_dict.get("players", [])
+            }
+            shooter_id = players.get("Shooter", players.get("Scorer", -1))
+            goalie_id = players.get("Goalie", -1)
+
+        records.append(
+            (
+                event,
+                about["eventIdx"],
+                seconds_remaining_in_game,
+                team,
+                shot_x,
+                shot_y,
+                shooter_id,
+                goalie_id,
+            )
+        )
 
-        df_dict["_".join([team_, event_])].append(1)
-        if event_ == "goal":
-            df_dict["_".join([team_, "shot"])].append(1)
+    assert len(records) > 0
+    columns = [
+        "event",
+        "playId",
+        "timestamp",
+        "team",
+        "shot_x",
+        "shot_y",
+        "shooter_id",
+        "goalie_id",
+    ]
+    live_events = dict(zip(columns, map(list, zip(*records))))
+    # get gameId gameData -> game -> pk
+    live_events["gameId"] = live_game_json["gameData"]["game"]["pk"]
+    live_events["home_goals"] = live_game_json["liveData"]["linescore"]["teams"][
+        "home"
+    ]["goals"]
+    live_events["away_goals"] = live_game_json["liveData"]["linescore"]["teams"][
+        "away"
+    ]["goals"]
+    return live_events
+
+
+def parse_nhl_live_feed(live_game_json, live_events=None):
+    import numpy as np
+    import pandas as pd
+
+    # one row per play with the home/away one hot event columns, ignoring stoppages and period start and ends, the
+    #  last row is the winner of the game
+    # pass live_events when the live feed has already been parsed by parse_nhl_live_events
+    if live_events is None:
+        live_events = parse_nhl_live_events(live_game_json)
+    events = live_events["event"]
+    teams = list(live_events["team"])
+    kinds = [live_feed_event_columns.get(event) for event in events]
+
+    if events[-1] in ["Game Official", "Game End"]:
+        # end of game, record who won based on goals scored
+        assert not live_events["home_goals"] == live_events["away_goals"]
+        teams[-1] = (
+            "home" if live_events["home_goals"] > live_events["away_goals"] else "away"
+        )
+        kinds[-1] = "win"
 
-        for col, vals in df_dict.items():
-            if len(vals) < len(df_dict["gameId"]):
-                df_dict[col].append(0)
+    # normal plays, record which team play is attributed to and the type of play
+    assert all(team is not None for team in teams)
+    if any(team == "unknown" for team in teams) or any(kind is None for kind in kinds):
+        raise NotImplementedError
 
-        assert all(len(vals) == len(df_dict["gameId"]) for vals in df_dict.values())
+    teams = np.array(teams)
+    kinds = np.array(kinds)
+    df_dict = {
+        "gameId": [live_events["gameId"]] * len(events),
+        "playId": live_events["playId"],
+        "event": events,
+        "timestamp": live_events["timestamp"],
+    }
+    for column in live_feed_columns[4:]:
+        if column in ["shot_x", "shot_y"]:
+            df_dict[column] = live_events[column]
+            continue
+        team, kind = column.split("_", 1)
+        is_kind = (kinds == kind) | ((kinds == "goal") if kind == "shot" else False)
+        df_dict[column] = ((teams == team) & is_kind).astype(np.int64)
 
     df = pd.DataFrame(df_dict)
     assert not df.empty
-    assert sum(df_dict.get("home_win", 0)) == 1 or sum(df_dict.get("away_win", 0)) == 1
+    assert df["home_win"].sum() == 1 or df["away_win"].sum() == 1
+    count("rows.live_feed", len(df.index))
     return df
 
 
@@ -239,110 +424,133 @@ def fetch_to_df_nhl_live_feed(game_id):
 
 
 def nhl_pbp_request(game_id):
-    season_id = f"{str(game_id)[:4]}{int(str(game_id)[:4]) + 1}"
-    game_identifier = str(game_id)[-6:]
-
-    try_count = 0
-    iterating = True
-    while iterating:
-        try_count += 1
-        event_info = requests.get(
-            f"http://www.nhl.com/scores/htmlreports/{season_id}/PL{game_identifier}.HTM"
-        )
-        event_soup = BeautifulSoup(event_info.content, "html.parser")
-        assert isinstance(event_soup, BeautifulSoup)
-
-        if "404 Not Found" == event_soup.find("title").text:
-            iterating = try_count <= 2
-        else:
-            return event_soup
-
-    return None
-
-
-def parse_nhl_pbp(nhl_event_soup, game_id):
-    assert isinstance(nhl_event_soup, BeautifulSoup)
-    # return line items in table similar to what is seen online: http://www.nhl.com/scores/htmlreports/20212022/PL030234.HTM
-    df_dict = {
-        "gameId": [],
-        "playId": [],
-        "strength": [],
-        "timestamp": [],
-        "event": [],
-        "description": [],
-        # the on ice should be formatted as "{# offense}_{# defense}_{# goalies}"
-        "away_on_ice": [],
-        "home_on_ice": [],
-        "away_goalie_number": [],
-        "home_goalie_number": [],
-        "away_pulled_goalie": [],
-        "home_pulled_goalie": [],
-        "away_del_penalty": [],
-        "home_del_penalty": [],
-        "away_penalty": [],
-        "home_penalty": [],
-    }
-
-    # get the home and away team abbreviations
-    abbreviations = {
-        "Atlanta": ["AFM"],
-        "Anaheim": ["ANA"],
-        "Arizona": ["ARI"],
-        "Boston": ["BOS"],
-        "Brooklyn": ["BRK"],
-        "Buffalo": ["BUF"],
-        "Carolina": ["CAR"],
-        "Columbus": ["CBJ"],
-        "California": ["CGS"],
-        "Calgary": ["CGY"],
-        "Chicago": ["CHI"],
-        "Cleveland": ["CLE"],
-        "Colorado": ["COL"],
-        "Dallas": ["DAL"],
-        "Detroit": ["DET"],
-        "Edmonton": ["EDM"],
-        "Florida": ["FLA"],
-        "Hamilton": ["HAM"],
-        "Hartford": ["HFD"],
-        "Kansas City": ["KCS"],
-        "Los Angeles": ["LAK", "L.A"],
-        "Minnesota": ["MIN"],
-        "Montreal": ["MTL"],
-        "New Jersey": ["NJD", "N.J"],
-        "Nashville": ["NSH"],
-        "New York Rangers": ["NYR"],
-        "New York Islanders": ["NYI"],
-        "Ottawa": ["OTT"],
-        "Philadelphia": ["PHI"],
-        "Phoenix": ["PHX"],
-        "Pittsburgh": ["PIT"],
-        "Quebec": ["QBD"],
-        "Seattle": ["SEA"],
-        "San Jose": ["SJS", "S.J"],
-        "St. Louis": ["STL"],
-        "Tampa Bay": ["TBL", "T.B"],
-        "Toronto": ["TOR"],
-        "Vancouver": ["VAN"],
-        "Vegas": ["VGK"],
-        "Winnipeg": ["WPG"],
-        "Washington": ["WSH"],
-    }
-
-    visitor_table = nhl_event_soup.find("table", {"id": "Visitor"})
-    home_table = nhl_event_soup.find("table", {"id": "Home"})
+    return report_soup("pbp_report", game_id, "pbp")
+
+
+# team locations as they appear in the PL report headers and the abbreviations event descriptions start with
+pbp_abbreviations = {
+    "Atlanta": ["AFM"],
+    "Anaheim": ["ANA"],
+    "Arizona": ["ARI"],
+    "Boston": ["BOS"],
+    "Brooklyn": ["BRK"],
+    "Buffalo": ["BUF"],
+    "Carolina": ["CAR"],
+    "Columbus": ["CBJ"],
+    "California": ["CGS"],
+    "Calgary": ["CGY"],
+    "Chicago": ["CHI"],
+    "Cleveland": ["CLE"],
+    "Colorado": ["COL"],
+    "Dallas": ["DAL"],
+    "Detroit": ["DET"],
+    "Edmonton": ["EDM"],
+    "Florida": ["FLA"],
+    "Hamilton": ["HAM"],
+    "Hartford": ["HFD"],
+    "Kansas City": ["KCS"],
+    "Los Angeles": ["LAK", "L.A"],
+    "Minnesota": ["MIN"],
+    "Montreal": ["MTL"],
+    "New Jersey": ["NJD", "N.J"],
+    "Nashville": ["NSH"],
+    "New York Rangers": ["NYR"],
+    "New York Islanders": ["NYI"],
+    "Ottawa": ["OTT"],
+    "Philadelphia": ["PHI"],
+    "Phoenix": ["PHX"],
+    "Pittsburgh": ["PIT"],
+    "Quebec": ["QBD"],
+    "Seattle": ["SEA"],
+    "San Jose": ["SJS", "S.J"],
+    "St. Louis": ["STL"],
+    "Tampa Bay": ["TBL", "T.B"],
+    "Toronto": ["TOR"],
+    "Vancouver": ["VAN"],
+    "Vegas": ["VGK"],
+    "Winnipeg": ["WPG"],
+    "Washington": ["WSH"],
+}
+
+# columns of the win probability play by play, see parse_nhl_pbp
+pbp_columns = [
+    "gameId",
+    "playId",
+    "strength",
+    "timestamp",
+    "event",
+    "description",
+    # the on ice should be formatted as "{# offense}_{# defense}_{# goalies}"
+    "away_on_ice",
+    "home_on_ice",
+    "away_goalie_number",
+    "home_goalie_number",
+    "away_pulled_goalie",
+    "home_pulled_goalie",
+    "away_del_penalty",
+    "home_del_penalty",
+    "away_penalty",
+    "home_penalty",
+]
+
+
+def pbp_team_abbreviations(nhl_event_soup):
+    # abbreviations of the away and home team from the Visitor and Home header tables
+    visitor_text = nhl_event_soup.find("table", {"id": "Visitor"}).text.lower()
+    home_text = nhl_event_soup.find("table", {"id": "Home"}).text.lower()
 
     away_abbrev = None
     home_abbrev = None
 
-    for loc, abbr_list in abbreviations.items():
-        if loc.lower() in visitor_table.text.lower():
+    for loc, abbr_list in pbp_abbreviations.items():
+        if loc.lower() in visitor_text:
             assert away_abbrev is None
             away_abbrev = abbr_list
-        if loc.lower() in home_table.text.lower():
+        if loc.lower() in home_text:
             assert home_abbrev is None
             home_abbrev = abbr_list
 
     assert away_abbrev is not None and home_abbrev is not None
+    return away_abbrev, home_abbrev
+
+
+def _on_ice_players(on_ice_text):
+    # "8C\xa029R..." -> (numbers, positions), None when the report has no players for the side
+    if on_ice_text == "\xa0":
+        return None
+    players = "".join(on_ice_text.split("\n")).split("\xa0")
+    return [p[:-1] for p in players], [p[-1] for p in players]
+
+
+def _on_ice_columns(side_players):
+    # the on ice, goalie number and pulled goalie columns of one side, "-1" when not recorded
+    if side_players is None:
+        return "-1", "-1", "-1"
+    numbers, positions = side_players
+    on_ice = (
+        f'{sum([1 for p in positions if p in ["C", "R", "L"]])}'
+        f'_{sum([1 for p in positions if p == "D"])}'
+        f'_{sum([1 for p in positions if p == "G"])}'
+    )
+    if "G" in positions:
+        return on_ice, str(numbers[positions.index("G")]), "0"
+    return on_ice, "-1", "1"
+
+
+@timed("parse.pbp")
+def parse_nhl_pbp_events(nhl_event_soup, game_id):
+    from bs4 import BeautifulSoup
+    import pandas as pd
+
+    assert isinstance(nhl_event_soup, BeautifulSoup)
+    # every line item of the PL report (http://www.nhl.com/scores/htmlreports/20212022/PL030234.HTM) in one pass,
+    #  the win probability play by play and the shot view are projections of it:
+    #   the pbp_columns
+    #   period
+    #   event_team -> away or home when the description starts with the team's abbreviation, otherwise ""
+    #   {away|home}_numbers and {away|home}_positions -> space separated jersey numbers and positions on ice, "-1"
+    #    when not recorded
+    away_abbrev, home_abbrev = pbp_team_abbreviations(nhl_event_soup)
 
     # not all games have the id=PL-# format
     # ex game that does: 2021030234
@@ -354,109 +562,102 @@ def parse_nhl_pbp(nhl_event_soup, game_id):
 
     all_tr = PL_tr if len(PL_tr) >= len(color_tr) else color_tr
 
-    for tr in all_tr:
-        df_dict["gameId"].append(game_id)
-
-        line_items = [tag.text for tag in tr.find_all("td", recursive=False)]
-        assert len(line_items) == 8
-        df_dict["playId"].append(line_items[0])
-        df_dict["strength"].append(
-            line_items[2] if not line_items[2] == "\xa0" else "-1"
-        )
-        period = int(line_items[1])
-        minutes_gone_in_period = int(line_items[3].split(":")[0])
-        seconds_gone_in_period = int(line_items[3].split(":")[1][:2])
-        seconds_remaining_in_game = 20 * 3 * 60 - (
-            20 * 60 * (period - 1)
-            + 60 * minutes_gone_in_period
-            + seconds_gone_in_period
-        )
-        df_dict["timestamp"].append(seconds_remaining_in_game)
-        df_dict["event"].append(line_items[4])
-        df_dict["description"].append(
-            line_items[5].replace("\xa0", " ") if not line_items[5] == "\xa0" else "-1"
-        )
+    line_items = [
+        [tag.text for tag in tr.find_all("td", recursive=False)] for tr in all_tr
+    ]
+    assert all(len(items) == 8 for items in line_items)
 
-        if line_items[6] == "\xa0":
-            df_dict["away_on_ice"].append("-1")
-            df_dict["away_goalie_number"].append("-1")
-            df_dict["away_pulled_goalie"].append("-1")
-        else:
-            away_positions = [
-                c[-1] for c in "".join(line_items[6].split("\n")).split("\xa0")
-            ]
-            away_numbers = [
-                c[:-1] for c in "".join(line_items[6].split("\n")).split("\xa0")
-            ]
-            df_dict["away_on_ice"].append(
-                f'{sum([1 for p in away_positions if p in ["C", "R", "L"]])}_{sum([1 for p in away_positions if p == "D"])}_{sum([1 for p in away_positions if p == "G"])}'
-            )
-            df_dict["away_goalie_number"].append(
-                str(away_numbers[away_positions.index("G")])
-                if "G" in away_positions
-                else "-1"
-            )
-            df_dict["away_pulled_goalie"].append("0" if "G" in away_positions else "1")
-
-        if line_items[7] == "\xa0":
-            df_dict["home_on_ice"].append("-1")
-            df_dict["home_goalie_number"].append("-1")
-            df_dict["home_pulled_goalie"].append("-1")
-        else:
-            home_positions = [
-                c[-1] for c in "".join(line_items[7].split("\n")).split("\xa0")
-            ]
-            home_numbers = [
-                c[:-1] for c in "".join(line_items[7].split("\n")).split("\xa0")
-            ]
-            df_dict["home_on_ice"].append(
-                f'{sum([1 for p in home_positions if p in ["C", "R", "L"]])}_{sum([1 for p in home_positions if p == "D"])}_{sum([1 for p in home_positions if p == "G"])}'
-            )
-            df_dict["home_goalie_number"].append(
-                str(home_numbers[home_positions.index("G")])
-                if "G" in home_positions
-                else "-1"
-            )
-            df_dict["home_pulled_goalie"].append("0" if "G" in home_positions else "1")
-
-        if df_dict["event"][-1] == "PENL":
-            assert not df_dict["description"][-1] == -1
-            if df_dict["description"][-1][:3] in away_abbrev:
-                df_dict["away_penalty"].append(1)
-                df_dict["home_penalty"].append(0)
-            elif df_dict["description"][-1][:3] in home_abbrev:
-                df_dict["away_penalty"].append(0)
-                df_dict["home_penalty"].append(1)
-            else:
-                print(f'Abbreviation not found is {df_dict["description"][-1][:3]}')
-                raise NotImplementedError
-        else:
-            df_dict["away_penalty"].append(0)
-            df_dict["home_penalty"].append(0)
-
-        if df_dict["event"][-1] == "DELPEN":
-            assert not df_dict["description"][-1] == -1
-            if df_dict["description"][-1][:3] in away_abbrev:
-                df_dict["away_del_penalty"].append(1)
-                df_dict["home_del_penalty"].append(0)
-            elif df_dict["description"][-1][:3] in home_abbrev:
-                df_dict["away_del_penalty"].append(0)
-                df_dict["home_del_penalty"].append(1)
-            else:
-                print(f'Abbreviation not found is {df_dict["description"][-1][:3]}')
-                raise NotImplementedError
-        else:
-            df_dict["away_del_penalty"].append(0)
-            df_dict["home_del_penalty"].append(0)
-
-        assert all(len(vals) == len(df_dict["gameId"]) for vals in df_dict.values())
+    periods = [int(items[1]) for items in line_items]
+    descriptions = [
+        items[5].replace("\xa0", " ") if not items[5] == "\xa0" else "-1"
+        for items in line_items
+    ]
+    away_players = [_on_ice_players(items[6]) for items in line_items]
+    home_players = [_on_ice_players(items[7]) for items in line_items]
+    away_on_ice = [_on_ice_columns(players) for players in away_players]
+    home_on_ice = [_on_ice_columns(players) for players in home_players]
+    event_teams = [
+        "away"
+        if description[:3] in away_abbrev
+        else "home"
+        if description[:3] in home_abbrev
+        else ""
+        for description in descriptions
+    ]
+    events = [items[4] for items in line_items]
+
+    df = pd.DataFrame(
+        {
+            "gameId": [game_id] * len(line_items),
+            "playId": [items[0] for items in line_items],
+            "period": periods,
+            "strength": [
+                items[2] if not items[2] == "\xa0" else "-1" for items in line_items
+            ],
+            "timestamp": [
+                20 * 3 * 60
+                - (
+                    20 * 60 * (period - 1)
+                    + 60 * int(items[3].split(":")[0])
+                    + int(items[3].split(":")[1][:2])
+                )
+                for period, items in zip(periods, line_items)
+            ],
+            "event": events,
+            "description": descriptions,
+            "event_team": event_teams,
+            "away_numbers": [
+                " ".join(p[0]) if p is not None else "-1" for p in away_players
+            ],
+            "away_positions": [
+                " ".join(p[1]) if p is not None else "-1" for p in away_players
+            ],
+            "home_numbers": [
+                " ".join(p[0]) if p is not None else "-1" for p in home_players
+            ],
+            "home_positions": [
+                " ".join(p[1]) if p is not None else "-1" for p in home_players
+            ],
+            "away_on_ice": [c[0] for c in away_on_ice],
+            "home_on_ice": [c[0] for c in home_on_ice],
+            "away_goalie_number": [c[1] for c in away_on_ice],
+            "home_goalie_number": [c[1] for c in home_on_ice],
+            "away_pulled_goalie": [c[2] for c in away_on_ice],
+            "home_pulled_goalie": [c[2] for c in home_on_ice],
+        }
+    )
+    for penalty_event, column in [("DELPEN", "del_penalty"), ("PENL", "penalty")]:
+        is_penalty = df["event"] == penalty_event
+        df[f"away_{column}"] = (is_penalty & (df["event_team"] == "away")).astype(int)
+        df[f"home_{column}"] = (is_penalty & (df["event_team"] == "home")).astype(int)
 
-    df = pd.DataFrame(df_dict)
     assert not df.empty
+    count("rows.pbp_events", len(df.index))
+    return df
+
+
+def parse_nhl_pbp(nhl_event_soup, game_id, events_df=None):
+    # win probability view of the play by play, pass events_df when the PL report has already been parsed
+    if events_df is None:
+        events_df = parse_nhl_pbp_events(nhl_event_soup, game_id)
+
+    unknown_team = events_df["event"].isin(["PENL", "DELPEN"]) & (
+        events_df["event_team"] == ""
+    )
+    if unknown_team.any():
+        warning(
+            f'Abbreviation not found is {events_df.loc[unknown_team, "description"].iloc[0][:3]}',
+            game_id=game_id,
+        )
+        raise NotImplementedError
+
+    df = events_df[pbp_columns].copy()
     if not len(df.index) == int(df["playId"].to_list()[-1]):
-        print(
-            f'WARNING The length of the pbp df is {len(df.index)} and the last playId is {df["playId"].to_list()[-1]}.'
+        warning(
+            f'The length of the pbp df is {len(df.index)} and the last playId is {df["playId"].to_list()[-1]}.',
+            game_id=game_id,
         )
+    count("rows.pbp", len(df.index))
     return df
 
 
@@ -467,45 +668,11 @@ def fetch_to_df_nhl_pbp(game_id):
 
 
 def nhl_home_shifts_request(game_id):
-    season_id = f"{str(game_id)[:4]}{int(str(game_id)[:4]) + 1}"
-    game_identifier = str(game_id)[-6:]
-
-    try_count = 0
-    iterating = True
-    while iterating:
-        try_count += 1
-        home_shifts_info = requests.get(
-            f"http://www.nhl.com/scores/htmlreports/{season_id}/TH{game_identifier}.HTM"
-        )
-        home_shifts_soup = BeautifulSoup(home_shifts_info.content, "html.parser")
-
-        if "404 Not Found" == home_shifts_soup.find("title").text:
-            iterating = try_count <= 2
-        else:
-            return home_shifts_soup
-
-    return None
+    return report_soup("home_shifts_report", game_id, "shifts")
 
 
 def nhl_away_shifts_request(game_id):
-    season_id = f"{str(game_id)[:4]}{int(str(game_id)[:4]) + 1}"
-    game_identifier = str(game_id)[-6:]
-
-    try_count = 0
-    iterating = True
-    while iterating:
-        try_count += 1
-        away_shifts_info = requests.get(
-            f"http://www.nhl.com/scores/htmlreports/{season_id}/TV{game_identifier}.HTM"
-        )
-        away_shifts_soup = BeautifulSoup(away_shifts_info.content, "html.parser")
-
-        if "404 Not Found" == away_shifts_soup.find("title").text:
-            iterating = try_count <= 2
-        else:
-            return away_shifts_soup
-
-    return None
+    return report_soup("away_shifts_report", game_id, "shifts")
 
 
 def nhl_shifts_request(game_id):
@@ -515,115 +682,81 @@ def nhl_shifts_request(game_id):
     return home_shifts_soup, away_shifts_soup
 
 
+# period, start and end ("elapsed / left" clocks), duration and event cells of a shift report row
+shift_cell_columns = ["period", "start", "end", "duration", "event"]
+
+
+@timed("parse.shifts")
 def parse_nhl_shifts(nhl_shifts_soup, game_id):
     # return for each player a list of tuples of (period, start shift time, end shift time)
     # idea will be when a period/time is inputted do a double for loop over player and tuples to calculate how long each
     #  player has been on the ice in the game
+    from bs4 import BeautifulSoup
+
     assert isinstance(nhl_shifts_soup, BeautifulSoup)
 
-    df_dict = {
-        "gameId": [],
-        "playerId": [],
-        "start_shift": [],
-        "end_shift": [],
-        "shift_length": [],
-        "event": [],
-    }
+    # raw cells of every shift row, times are converted for the whole report at once by shift_timestamps
+    player_ids = []
+    shift_cells = []
 
-    change_first_name = {
-        "alexander": ["alex", "sasha"],
-        "alex": ["alexander"],
-        "gerald": ["gerry"],
-        "gerry": ["gerald"],
-        "nick": ["nicholas"],
-        "nicholas": ["nick"],
-        "christopher": ["chris"],
-        "chris": ["christopher"],
-        "cal": ["callan", "calvin"],
-        "callan": ["cal"],
-        "calvin": ["cal"],
-        "egor": ["yegor"],
-        "yegor": ["egor"],
-        "sasha": ["alexander"],
-        "william": ["will"],
-        "will": ["william"],
-    }
-    change_last_name = dict()
+    from player_identity import (
+        load_identity_index,
+        queue_for_review,
+        resolve_player,
+        resolve_team,
+        unreviewed_matches,
+    )
 
-    # get team name
-    team_td = nhl_shifts_soup.find("td", {"class": "teamHeading + border"})
-    team_text = team_td.text
+    # team and players are resolved with the season's identity index, built from the rosters the first time
+    season_year = f"{str(game_id)[:4]}{int(str(game_id)[:4]) + 1}"
+    identity_index = load_identity_index(season_year)
 
     # get team id
-    teams_request = requests.get("https://statsapi.web.nhl.com/api/v1/teams").json()
-    team_ids = [
-        d["id"]
-        for d in teams_request["teams"]
-        if d["name"].replace("é", "e").lower() == team_text.lower()
-    ]
-    assert len(team_ids) == 1
-    team_id = team_ids[0]
-
-    # get roster
-    season_year = f"{str(game_id)[:4]}{int(str(game_id)[:4]) + 1}"
-    roster_request = requests.get(
-        f"https://statsapi.web.nhl.com/api/v1/teams/{team_id}/roster?season={season_year}"
-    ).json()
-    playername_to_id = {
-        d["person"]["fullName"].lower().replace("é", "e"): d["person"]["id"]
-        for d in roster_request["roster"]
-    }
+    team_td = nhl_shifts_soup.find("td", {"class": "teamHeading + border"})
+    team_id = resolve_team(identity_index, team_td.text)
+    assert team_id is not None, f"Team {team_td.text} is not in the identity index."
 
     all_td_playerHeading = nhl_shifts_soup.find_all(
         "td", {"class": "playerHeading + border"}
     )
     for td_playerHeading in all_td_playerHeading:
         number_player_name = td_playerHeading.text
+        number = number_player_name.split(" ")[0]
         player_name = " ".join(number_player_name.split(" ")[1:])
         assert player_name.count(",") == 1
         last_name, first_name = player_name.split(",")
         first_name = first_name.strip().lower()
         last_name = last_name.strip().lower()
-        if " ".join([first_name, last_name]) in playername_to_id:
-            player_id = playername_to_id[" ".join([first_name, last_name])]
-        elif first_name in change_first_name.keys() and any(
-            " ".join([fn, last_name]) in playername_to_id
-            for fn in change_first_name[first_name]
-        ):
-            player_id = [
-                playername_to_id[" ".join([fn, last_name])]
-                for fn in change_first_name[first_name]
-                if " ".join([fn, last_name]) in playername_to_id
-            ][0]
-        elif (
-            last_name in change_last_name.keys()
-            and " ".join([first_name, change_last_name[last_name]]) in playername_to_id
-        ):
-            player_id = playername_to_id[
-                " ".join([first_name, change_last_name[last_name]])
-            ]
-        elif (
-            first_name in change_first_name.keys()
-            and last_name in change_last_name.keys()
-            and any(
-                " ".join([fn, change_last_name[last_name]]) in playername_to_id
-                for fn in change_first_name[first_name]
+        player_id, match, candidates = resolve_player(
+            identity_index, team_id, season_year, first_name, last_name, number
+        )
+        if match in unreviewed_matches:
+            # kept, but a name that was not matched exactly waits in the review queue to be confirmed or corrected
+            queue_for_review(
+                game_id,
+                team_id,
+                season_year,
+                " ".join([first_name, last_name]),
+                number,
+                candidates,
+                match=match,
+                matched_id=player_id,
             )
-        ):
-            player_id = [
-                playername_to_id[" ".join([fn, change_last_name[last_name]])]
-                for fn in change_first_name[first_name]
-                if " ".join([fn, change_last_name[last_name]]) in playername_to_id
-            ][0]
-        else:
+        elif player_id is None:
+            # kept under a name placeholder so the game is still collected, the name waits in the review queue
             player_id = ".".join([first_name, last_name])
-            print(
-                f'{" ".join([first_name, last_name])} was not found in shift request.'
+            queue_for_review(
+                game_id,
+                team_id,
+                season_year,
+                " ".join([first_name, last_name]),
+                number,
+                candidates,
             )
-            print(
-                f'Closest found is "{sorted([(k, edit_distance(" ".join([first_name, last_name]), k)) for k in playername_to_id.keys()], key=lambda x: x[1], reverse=False)[0][0]}"'
+            warning(
+                f'{" ".join([first_name, last_name])} was not found in shift request, closest are {candidates}.',
+                game_id=game_id,
             )
-            assert False
 
         next_tr = td_playerHeading.find_next("tr").find_next("tr")
         while (
@@ -633,85 +766,85 @@ def parse_nhl_shifts(nhl_shifts_soup, game_id):
         ):
             line_info = next_tr.text.split("\n")
             assert len(line_info) == 8
-            period = 4 if line_info[2] == "OT" else int(line_info[2])
-
-            # easy enough to change these to counting up just by doing 20 * 3 * 60 - #
-            start_shift_elapsed = line_info[3].split("/")[0].strip()
-            start_shift_timestamp_elapsed = 20 * 3 * 60 - (
-                20 * 60 * (period - 1)
-                + 60 * int(start_shift_elapsed.split(":")[0])
-                + int(start_shift_elapsed.split(":")[1])
-            )
-            start_shift_left = line_info[3].split("/")[1].strip()
-            start_shift_timestamp_left = (
-                20 * (3 - period) * 60
-                + 60 * int(start_shift_left.split(":")[0])
-                + int(start_shift_left.split(":")[1])
-            )
-
-            end_shift_elapsed = line_info[4].split("/")[0].strip()
-            end_shift_timestamp_elapsed = 20 * 3 * 60 - (
-                20 * 60 * (period - 1)
-                + 60 * int(end_shift_elapsed.split(":")[0])
-                + int(end_shift_elapsed.split(":")[1])
-            )
-
-            end_shift_left = line_info[4].split("/")[1].strip()
-            end_shift_timestamp_left = (
-                20 * (3 - period) * 60
-                + 60 * int(end_shift_left.split(":")[0])
-                + int(end_shift_left.split(":")[1])
-            )
-
-            shift_length = int(line_info[5].split(":")[0]) * 60 + int(
-                line_info[5].split(":")[1]
-            )
-            if (
-                start_shift_timestamp_elapsed - end_shift_timestamp_elapsed
-                == shift_length
-            ):
-                start_shift_timestamp = start_shift_timestamp_elapsed
-                end_shift_timestamp = end_shift_timestamp_elapsed
-            elif start_shift_timestamp_left - end_shift_timestamp_left == shift_length:
-                start_shift_timestamp = start_shift_timestamp_left
-                end_shift_timestamp = end_shift_timestamp_left
-            elif (
-                start_shift_timestamp_left - end_shift_timestamp_left
-                == start_shift_timestamp_elapsed - end_shift_timestamp_elapsed
-                and start_shift_timestamp_left == start_shift_timestamp_elapsed
-            ):
-                start_shift_timestamp = start_shift_timestamp_left
-                end_shift_timestamp = end_shift_timestamp_left
-                shift_length = start_shift_timestamp_left - end_shift_timestamp_left
-            else:
-                # consider it missing data
-                start_shift_timestamp = 0
-                end_shift_timestamp = 0
-                shift_length = 0
-
-            assert shift_length == (start_shift_timestamp - end_shift_timestamp)
-
-            if not line_info[6] == "\xa0":
-                event = line_info[6]
-            else:
-                event = "0"
-
-            df_dict["gameId"].append(game_id)
-            df_dict["playerId"].append(player_id)
-            df_dict["start_shift"].append(start_shift_timestamp)
-            df_dict["end_shift"].append(end_shift_timestamp)
-            df_dict["shift_length"].append(shift_length)
-            df_dict["event"].append(event)
-
-            assert all(len(vals) == len(df_dict["gameId"]) for vals in df_dict.values())
+            player_ids.append(player_id)
+            shift_cells.append(line_info[2:7])
 
             next_tr = next_tr.find_next("tr")
 
-    df = pd.DataFrame(df_dict)
+    df = shift_timestamps(shift_cells)
+    df.insert(0, "playerId", player_ids)
+    df.insert(0, "gameId", game_id)
     assert not df.empty
+    count("rows.shifts", len(df.index))
     return df
 
 
+def _clock_seconds(cells, clocks_per_cell):
+    # every cell of a column parsed at once, "mm:ss" clocks separated by "/" -> seconds, one column per clock
+    import numpy as np
+
+    fields = " ".join(cells).replace(":", " ").replace("/", " ").split()
+    assert len(fields) == 2 * clocks_per_cell * len(cells)
+    clocks = np.array(fields, dtype=np.int64).reshape(len(cells), clocks_per_cell, 2)
+    return 60 * clocks[:, :, 0] + clocks[:, :, 1]
+
+
+def shift_timestamps(shift_cells):
+    import numpy as np
+    import pandas as pd
+
+    # raw period, "elapsed / left" start and end, duration and event cells of a shift report -> seconds remaining in
+    #  regulation at the start and end of every shift
+    # the start and end are taken from the elapsed clock when it agrees with the duration, otherwise the clock left,
+    #  when neither agree the row is considered missing data and zeroed
+    periods, starts, ends, durations, events = (
+        zip(*shift_cells) if len(shift_cells) else [()] * len(shift_cell_columns)
+    )
+    period = np.array(periods, dtype=str)
+    period = np.where(period == "OT", "4", period).astype(np.int64)
+
+    timestamps = {}
+    for column, cells in [("start", starts), ("end", ends)]:
+        elapsed_left = _clock_seconds(cells, 2)
+        # easy enough to change these to counting up just by doing 20 * 3 * 60 - #
+        timestamps[f"{column}_elapsed"] = 20 * 3 * 60 - (
+            20 * 60 * (period - 1) + elapsed_left[:, 0]
+        )
+        timestamps[f"{column}_left"] = 20 * (3 - period) * 60 + elapsed_left[:, 1]
+    duration = _clock_seconds(durations, 1)[:, 0]
+
+    elapsed_length = timestamps["start_elapsed"] - timestamps["end_elapsed"]
+    left_length = timestamps["start_left"] - timestamps["end_left"]
+    use_elapsed = elapsed_length == duration
+    use_left = ~use_elapsed & (
+        (left_length == duration)
+        | (
+            (left_length == elapsed_length)
+            & (timestamps["start_left"] == timestamps["start_elapsed"])
+        )
+    )
+    count("missing_data.shifts", int((~use_elapsed & ~use_left).sum()))
+
+    start_shift = np.select(
+        [use_elapsed, use_left],
+        [timestamps["start_elapsed"], timestamps["start_left"]],
+        default=0,
+    )
+    end_shift = np.select(
+        [use_elapsed, use_left],
+        [timestamps["end_elapsed"], timestamps["end_left"]],
+        default=0,
+    )
+    return pd.DataFrame(
+        {
+            "start_shift": start_shift,
+            "end_shift": end_shift,
+            "shift_length": start_shift - end_shift,
+            "event": [event if not event == "\xa0" else "0" for event in events],
+        }
+    )
+
+
 def fetch_to_df_nhl_shifts(game_id):
 
     home_shifts_soup, away_shifts_soup = nhl_shifts_request(game_id)
@@ -0,0 +1,211 @@
+import time
+import queue
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import instrumentation
+from instrumentation import progress, warning
+
+# staged pipeline so network, cpu and disk work of different items overlap instead of running one after the other
+# a stage is a function called with each item of its input queue (as func(*item)) returning or yielding the items of
+#  the next stage's queue, run by its own number of worker threads, or of worker processes for cpu bound stages
+# queues between stages hold at most queue_size items, a stage that gets ahead blocks until the next one catches up
+#  (backpressure), so downloads never pile up more documents in memory than the parsers can take
+# process stage functions have to be importable (module level) and return a list, their timers and counters are
+#  added to the ones of the main process
+# an item that raises is logged and dropped, no new items are started afterwards and the first error is raised once
+#  the items already in the pipeline are finished
+# run_pipeline returns how each stage spent its time:
+#  busy -> running the stage function, starved -> waiting on the input queue, blocked -> waiting on the output queue
+#  utilization -> busy / (workers * wall time), the bottleneck is the stage with high utilization whose upstream is
+#   blocked and downstream starved
+
+
+def pipeline_stage(
+    name, func, workers=1, processes=False, initializer=None, initargs=()
+):
+    return {
+        "name": name,
+        "func": func,
+        "workers": workers,
+        "processes": processes,
+        "initializer": initializer,
+        "initargs": initargs,
+    }
+
+
+def _run_in_process(func, item):
+    instrumentation.reset()
+    outputs = func(*item)
+    return outputs, instrumentation.summary()
+
+
+def _stage_worker(stage, in_queue, out_queue, executor, stats, lock, stop, errors):
+    busy = starved = blocked = 0.0
+    items = outputs_count = 0
+    while True:
+        start = time.perf_counter()
+        item = in_queue.get()
+        starved += time.perf_counter() - start
+        if item is None:
+            break
+        items += 1
+
+        start = time.perf_counter()
+        try:
+            if executor is not None:
+                outputs, worker_stats = executor.submit(
+                    _run_in_process, stage["func"], item
+                ).result()
+                instrumentation.merge(worker_stats)
+            else:
+                outputs = stage["func"](*item)
+            outputs = iter(outputs if outputs is not None else [])
+        except Exception as e:
+            outputs = iter([])
+            _item_failed(stage, item, e, stop, errors, lock)
+        busy += time.perf_counter() - start
+
+        while True:
+            start = time.perf_counter()
+            try:
+                output = next(outputs)
+            except StopIteration:
+                busy += time.perf_counter() - start
+                break
+            except Exception as e:
+                busy += time.perf_counter() - start
+                _item_failed(stage, item, e, stop, errors, lock)
+                break
+            busy += time.perf_counter() - start
+
+            outputs_count += 1
+            if out_queue is not None:
+                start = time.perf_counter()
+                out_queue.put(output)
+                blocked += time.perf_counter() - start
+
+    with lock:
+        stats["busy"] += busy
+        stats["starved"] += starved
+        stats["blocked"] += blocked
+        stats["items"] += items
+        stats["outputs"] += outputs_count
+
+
+def _item_failed(stage, item, e, stop, errors, lock):
+    warning(f"{stage['name']} failed on {item[0]}: {e!r}", stage=stage["name"])
+    instrumentation.count(f"errors.{stage['name']}")
+    with lock:
+        errors.append(e)
+    stop.set()
+
+
+def run_pipeline(items, stages, queue_size=16):
+    queues = [queue.Queue(maxsize=queue_size) for _ in stages]
+    lock = threading.Lock()
+    stop = threading.Event()
+    errors = []
+    stats = {
+        stage["name"]: {
+            "workers": stage["workers"],
+            "items": 0,
+            "outputs": 0,
+            "busy": 0.0,
+            "starved": 0.0,
+            "blocked": 0.0,
+        }
+        for stage in stages
+    }
+
+    # spawned, forking a process with worker threads running can copy locks they hold
+    spawn = multiprocessing.get_context("spawn")
+    executors = [
+        ProcessPoolExecutor(
+            max_workers=stage["workers"],
+            mp_context=spawn,
+            initializer=stage["initializer"],
+            initargs=stage["initargs"],
+        )
+        if stage["processes"]
+        else None
+        for stage in stages
+    ]
+
+    start = time.perf_counter()
+    threads = []
+    for i, stage in enumerate(stages):
+        out_queue = queues[i + 1] if i + 1 < len(stages) else None
+        threads.append(
+            [
+                threading.Thread(
+                    target=_stage_worker,
+                    args=(
+                        stage,
+                        queues[i],
+                        out_queue,
+                        executors[i],
+                        stats[stage["name"]],
+                        lock,
+                        stop,
+                        errors,
+                    ),
+                    daemon=True,
+                )
+                for _ in range(stage["workers"])
+            ]
+        )
+        for thread in threads[-1]:
+            thread.start()
+
+    try:
+        for item in items:
+            if stop.is_set():
+                break
+            queues[0].put(item)
+
+        # a stage is done once its input is, every worker gets its own end marker
+        for i, stage in enumerate(stages):
+            for _ in range(stage["workers"]):
+                queues[i].put(None)
+            for thread in threads[i]:
+                thread.join()
+    finally:
+        for executor in executors:
+            if executor is not None:
+                executor.shutdown()
+    wall = time.perf_counter() - start
+
+    report = pipeline_report(stats, wall)
+    if len(errors):
+        raise errors[0]
+    return report
+
+
+def pipeline_report(stats, wall):
+    report = {"seconds": round(wall, 3), "stages": {}}
+    for name, stage_stats in stats.items():
+        report["stages"][name] = {
+            "workers": stage_stats["workers"],
+            "items": stage_stats["items"],
+            "outputs": stage_stats["outputs"],
+            "busy": round(stage_stats["busy"], 3),
+            "starved": round(stage_stats["starved"], 3),
+            "blocked": round(stage_stats["blocked"], 3),
+            "utilization": round(
+                stage_stats["busy"] / (stage_stats["workers"] * wall) if wall else 0,
+                3,
+            ),
+        }
+        instrumentation.add_time(f"pipeline.{name}", stage_stats["busy"])
+
+    for name, stage_report in report["stages"].items():
+        progress(
+            f"{name:<10} {stage_report['workers']:3} workers {stage_report['items']:6} items "
+            f"{stage_report['utilization']:7.1%} busy, {stage_report['starved']:9.2f} s starved "
+            f"{stage_report['blocked']:9.2f} s blocked",
+            stage=name,
+        )
+    progress(f"Pipeline ran in {wall:.2f} seconds.", pipeline=report)
+    return report
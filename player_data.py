@@ -0,0 +1,235 @@
+import os
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+
+from instrumentation import count, progress
+from nhl_requests import endpoint_url, nhl_get
+
+# crawler for the player and goalie models in dangerous_shot.py
+# every player id is crawled once no matter how many rosters they are on, responses are cached on disk so a rerun
+#  only goes to the network for what it has not seen, and the results are saved as typed tables:
+#   profiles.parquet -> one row per player
+#   career.parquet -> one row per player and NHL season (yearByYear)
+#   game_logs.parquet -> one row per player and game (gameLog)
+
+
+def player_data_folder():
+    return os.path.join(os.path.dirname(__file__), "data", "players")
+
+
+def cached_get_json(url, cache_name, refresh=False):
+    cache_filename = os.path.join(player_data_folder(), "cache", f"{cache_name}.json")
+    if not refresh and os.path.isfile(cache_filename):
+        count("cache_hits.players")
+        with open(cache_filename, "r") as json_file:
+            return json.load(json_file)
+
+    response_json = nhl_get(url, "players").json()
+
+    if not os.path.isdir(os.path.dirname(cache_filename)):
+        os.makedirs(os.path.dirname(cache_filename), exist_ok=True)
+    tmp_filename = f"{cache_filename}.{os.getpid()}.tmp"
+    with open(tmp_filename, "w") as json_file:
+        json.dump(response_json, json_file)
+    os.replace(tmp_filename, cache_filename)
+    return response_json
+
+
+def toi_to_seconds(toi):
+    # "mm:ss" where minutes can go past 60 for season totals
+    minutes, seconds = toi.split(":")
+    return 60 * int(minutes) + int(seconds)
+
+
+def height_to_inches(height):
+    # "6' 1\"" -> 73
+    feet, inches = height.replace('"', "").split("'")
+    return 12 * int(feet) + int(inches)
+
+
+def roster_player_ids(max_workers=8):
+    teams_request = nhl_get(endpoint_url("teams"), "teams").json()
+    team_ids = [d["id"] for d in teams_request["teams"] if d["active"]]
+
+    def team_roster(team_id):
+        roster_request = nhl_get(
+            endpoint_url("team_expanded_roster", team_id=team_id), "roster"
+        ).json()
+        assert len(roster_request["teams"]) == 1
+        return [
+            d["person"]["id"] for d in roster_request["teams"][0]["roster"]["roster"]
+        ]
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        rosters = list(executor.map(team_roster, team_ids))
+
+    # players traded mid season show up on more than one roster
+    return sorted({player_id for roster in rosters for player_id in roster})
+
+
+def fetch_player(player_id, season_ids, refresh_seasons=()):
+    base_stats_request = cached_get_json(
+        endpoint_url("person", player_id=player_id),
+        f"{player_id}_profile",
+    )
+    career_stats_request = cached_get_json(
+        endpoint_url("person_year_by_year", player_id=player_id),
+        f"{player_id}_yearByYear",
+        refresh=len(refresh_seasons) > 0,
+    )
+
+    base_stats = base_stats_request["people"][0]
+    profile = {
+        "player_id": player_id,
+        "height": height_to_inches(base_stats["height"])
+        if "height" in base_stats
+        else -1,
+        "weight": base_stats.get("weight", -1),
+        "position": base_stats["primaryPosition"]["abbreviation"],
+        "current_age": base_stats.get("currentAge", -1),
+    }
+    is_goalie = profile["position"] in ["G"]
+
+    career = []
+    for year_split in career_stats_request["stats"][0]["splits"]:
+        if not year_split["league"]["name"] == "National Hockey League":
+            continue
+        stat = year_split["stat"]
+        career.append(
+            {
+                "player_id": player_id,
+                "season": year_split["season"],
+                "games": stat.get("games", 0),
+                "goals": stat.get("goals", 0),
+                "shots": stat.get("shots", 0),
+                "toi": toi_to_seconds(stat.get("timeOnIce", "0:0")),
+                "goals_against": stat.get("goalsAgainst", 0),
+                "shots_against": stat.get("shotsAgainst", 0),
+                "saves": stat.get("saves", 0),
+            }
+        )
+
+    # a player traded mid season has one split per team, only seasons they played in need a game log
+    seasons_played = {
+        c["season"] for c in career if c["season"] in season_ids and c["games"] > 0
+    }
+    game_logs = []
+    for season_id in sorted(seasons_played):
+        season_log_request = cached_get_json(
+            endpoint_url("person_game_log", player_id=player_id, season_id=season_id),
+            f"{player_id}_gameLog_{season_id}",
+            refresh=season_id in refresh_seasons,
+        )
+        assert len(season_log_request["stats"]) == 1
+        for game_log in season_log_request["stats"][0]["splits"]:
+            stat = game_log["stat"]
+            game_logs.append(
+                {
+                    "player_id": player_id,
+                    "season": season_id,
+                    "gamePk": game_log["game"]["gamePk"],
+                    "date": game_log["date"],
+                    "is_goalie": is_goalie,
+                    "goals": stat.get("goals", 0),
+                    "shots": stat.get("shots", 0),
+                    "toi": toi_to_seconds(stat.get("timeOnIce", "0:0")),
+                    "saves": stat.get("saves", 0),
+                    "shots_against": stat.get("shotsAgainst", 0),
+                    "goals_against": stat.get("goalsAgainst", 0),
+                }
+            )
+
+    return profile, career, game_logs
+
+
+def crawl_players(season_ids, max_workers=16, refresh_seasons=()):
+    # refresh_seasons is for a season still being played, its game logs are fetched again instead of read from cache
+    start = time.time()
+
+    player_ids = roster_player_ids(max_workers=max_workers)
+    progress(f"Crawling {len(player_ids)} players.")
+
+    profiles, career, game_logs = [], [], []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for p, c, g in executor.map(
+            lambda player_id: fetch_player(player_id, season_ids, refresh_seasons),
+            player_ids,
+        ):
+            profiles.append(p)
+            career.extend(c)
+            game_logs.extend(g)
+
+    save_player_tables(
+        pd.DataFrame(profiles), pd.DataFrame(career), pd.DataFrame(game_logs)
+    )
+
+    end = time.time()
+    progress(
+        f"Crawled {len(player_ids)} players and {len(game_logs)} game logs in {end - start:.2f} seconds."
+    )
+
+
+def save_player_tables(profiles_df, career_df, game_logs_df):
+    profiles_df = profiles_df.astype(
+        {
+            "player_id": np.int32,
+            "height": np.int8,
+            "weight": np.int16,
+            "position": "category",
+            "current_age": np.int8,
+        }
+    )
+    career_df = career_df.astype(
+        {
+            "player_id": np.int32,
+            "season": "category",
+            "games": np.int16,
+            "goals": np.int16,
+            "shots": np.int16,
+            "toi": np.int32,
+            "goals_against": np.int16,
+            "shots_against": np.int16,
+            "saves": np.int16,
+        }
+    )
+    game_logs_df = game_logs_df.astype(
+        {
+            "player_id": np.int32,
+            "season": "category",
+            "gamePk": np.int64,
+            "is_goalie": bool,
+            "goals": np.int8,
+            "shots": np.int8,
+            "toi": np.int16,
+            "saves": np.int8,
+            "shots_against": np.int8,
+            "goals_against": np.int8,
+        }
+    )
+    game_logs_df["date"] = pd.to_datetime(game_logs_df["date"])
+
+    if not os.path.isdir(player_data_folder()):
+        os.makedirs(player_data_folder())
+    profiles_df.to_parquet(
+        os.path.join(player_data_folder(), "profiles.parquet"), index=False
+    )
+    career_df.to_parquet(
+        os.path.join(player_data_folder(), "career.parquet"), index=False
+    )
+    game_logs_df.to_parquet(
+        os.path.join(player_data_folder(), "game_logs.parquet"), index=False
+    )
+
+
+def load_player_tables():
+    return tuple(
+        pd.read_parquet(os.path.join(player_data_folder(), f"{name}.parquet"))
+        for name in ["profiles", "career", "game_logs"]
+    )
+
+
+if __name__ == "__main__":
+    crawl_players(["20202021", "20212022"])
@@ -0,0 +1,304 @@
+import os
+import json
+import time
+import functools
+import unicodedata
+
+from instrumentation import count, progress
+from nhl_requests import endpoint_url, nhl_get
+
+# player identity index, resolves the names of the html reports to player ids without going back to the network
+# built once per season from the rosters of every team and saved to data/players/identity_index.json:
+#  teams -> normalized team name -> team id
+#  players -> player id -> full name
+#  rosters -> "{team id}-{season}" -> normalized name -> player id and jersey number -> player ids
+#  aliases -> normalized name -> player id, names resolved through the review queue, used across seasons
+# the rosters of a season are those of every team that played in it, so traded and retired players are in it too
+# names are resolved in order: exact roster name, reviewed aliases, first name aliases, jersey number with a
+#  matching last name, then a character trigram match within the roster
+# names matched any other way than exactly or by a reviewed alias, and names that do not resolve at all, are appended
+#  to data/players/identity_review.jsonl with their closest candidates (and the player they were matched to),
+#  setting player_id on a line makes it an alias the next time the index is loaded
+# worker processes append to the queue on their own, a name queued by more than one of them is read once
+
+first_name_aliases = {
+    "alexander": ["alex", "sasha"],
+    "alex": ["alexander"],
+    "gerald": ["gerry"],
+    "gerry": ["gerald"],
+    "nick": ["nicholas"],
+    "nicholas": ["nick"],
+    "christopher": ["chris"],
+    "chris": ["christopher"],
+    "cal": ["callan", "calvin"],
+    "callan": ["cal"],
+    "calvin": ["cal"],
+    "egor": ["yegor"],
+    "yegor": ["egor"],
+    "sasha": ["alexander"],
+    "william": ["will"],
+    "will": ["william"],
+}
+
+# matches that are kept but still queued for review
+unreviewed_matches = ("alias", "number", "fuzzy")
+
+# a trigram match has to score at least this much and beat the runner up by the margin
+fuzzy_threshold = 0.6
+fuzzy_margin = 0.1
+last_name_threshold = 0.5
+
+# the NHL_IDENTITY_FOLDER environment variable (or set_identity_folder) keeps the index and review queue somewhere
+#  else than data/players, e.g. the benchmark's work folder
+_identity_folder = os.environ.get(
+    "NHL_IDENTITY_FOLDER", os.path.join(os.path.dirname(__file__), "data", "players")
+)
+_identity_index = None
+_queued_names = set()
+
+
+def identity_folder():
+    return _identity_folder
+
+
+def set_identity_folder(folder):
+    # also exported to the environment so worker processes started afterwards use the same folder, the index cached
+    #  from the previous folder is dropped
+    global _identity_folder, _identity_index
+    _identity_folder = folder
+    os.environ["NHL_IDENTITY_FOLDER"] = folder
+    _identity_index = None
+    _queued_names.clear()
+
+
+def identity_index_filename():
+    return os.path.join(identity_folder(), "identity_index.json")
+
+
+def review_queue_filename():
+    return os.path.join(identity_folder(), "identity_review.jsonl")
+
+
+def normalize_name(name):
+    # "Montréal", "MONTREAL" -> "montreal", "O'Reilly" -> "oreilly", "Pierre-Luc" -> "pierre luc"
+    name = unicodedata.normalize("NFKD", name)
+    name = "".join(c for c in name if not unicodedata.combining(c)).lower()
+    name = name.replace("'", "").replace("-", " ").replace(".", " ")
+    return " ".join(name.split())
+
+
+@functools.lru_cache(maxsize=None)
+def name_trigrams(name):
+    padded = f"  {name} "
+    return frozenset(padded[i : i + 3] for i in range(len(padded) - 2))
+
+
+def trigram_similarity(a_trigrams, b_trigrams):
+    shared = len(a_trigrams & b_trigrams)
+    return shared / (len(a_trigrams) + len(b_trigrams) - shared)
+
+
+def roster_key(team_id, season_year):
+    return f"{team_id}-{season_year}"
+
+
+def empty_identity_index():
+    return {"teams": {}, "players": {}, "rosters": {}, "aliases": {}, "seasons": []}
+
+
+def add_season(identity_index, season_year):
+    # one request for the teams and one per team roster, instead of two for every shift report
+    teams_request = nhl_get(
+        endpoint_url("season_teams", season_year=season_year), "teams"
+    ).json()
+    for team in teams_request["teams"]:
+        identity_index["teams"][normalize_name(team["name"])] = team["id"]
+        roster_request = nhl_get(
+            endpoint_url("team_roster", team_id=team["id"], season_year=season_year),
+            "roster",
+        ).json()
+        roster = {"names": {}, "numbers": {}}
+        for d in roster_request.get("roster", []):
+            player_id = d["person"]["id"]
+            identity_index["players"][str(player_id)] = d["person"]["fullName"]
+            roster["names"][normalize_name(d["person"]["fullName"])] = player_id
+            if "jerseyNumber" in d:
+                roster["numbers"].setdefault(str(d["jerseyNumber"]), []).append(
+                    player_id
+                )
+        identity_index["rosters"][roster_key(team["id"], season_year)] = roster
+    identity_index["seasons"] = sorted(set(identity_index["seasons"]) | {season_year})
+
+
+def save_identity_index(identity_index):
+    os.makedirs(identity_folder(), exist_ok=True)
+    tmp_filename = f"{identity_index_filename()}.{os.getpid()}.tmp"
+    with open(tmp_filename, "w") as wf:
+        json.dump(identity_index, wf)
+    os.replace(tmp_filename, identity_index_filename())
+
+
+def load_review_queue():
+    # one entry per name, team and season, a reviewed line wins over the ones waiting
+    if not os.path.isfile(review_queue_filename()):
+        return []
+    entries = {}
+    with open(review_queue_filename(), "r") as rf:
+        for line in rf:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            key = (entry["name"], entry["team_id"], entry["season"])
+            if key not in entries or (
+                entries[key].get("player_id") is None
+                and entry.get("player_id") is not None
+            ):
+                entries[key] = entry
+    return list(entries.values())
+
+
+def load_identity_index(season_year=None):
+    # cached per process, the season's rosters are fetched and saved the first time it is asked for
+    global _identity_index
+    if _identity_index is None:
+        if os.path.isfile(identity_index_filename()):
+            with open(identity_index_filename(), "r") as rf:
+                _identity_index = json.load(rf)
+        else:
+            _identity_index = empty_identity_index()
+        for entry in load_review_queue():
+            _queued_names.add((entry["name"], entry["team_id"], entry["season"]))
+            if entry.get("player_id") is not None:
+                _identity_index["aliases"][normalize_name(entry["name"])] = entry[
+                    "player_id"
+                ]
+    if season_year is not None and season_year not in _identity_index["seasons"]:
+        start = time.time()
+        add_season(_identity_index, season_year)
+        save_identity_index(_identity_index)
+        end = time.time()
+        progress(
+            f"Indexed the rosters of {season_year} in {end - start:.2f} seconds.",
+            season=season_year,
+        )
+    return _identity_index
+
+
+def resolve_team(identity_index, team_name):
+    return identity_index["teams"].get(normalize_name(team_name))
+
+
+def _fuzzy_candidates(name, names):
+    # (score, normalized name) of names sorted best first
+    trigrams = name_trigrams(name)
+    return sorted(
+        ((trigram_similarity(trigrams, name_trigrams(n)), n) for n in names),
+        reverse=True,
+    )
+
+
+def resolve_player(
+    identity_index, team_id, season_year, first_name, last_name, number=None
+):
+    # (player id, how it matched, closest roster names as (score, name, player id)), player id and match are None
+    #  when the name does not resolve, the candidates are only listed for matches that go to the review queue
+    roster = identity_index["rosters"][roster_key(team_id, season_year)]
+    first_name = normalize_name(first_name)
+    last_name = normalize_name(last_name)
+    name = f"{first_name} {last_name}"
+
+    if name in roster["names"]:
+        return roster["names"][name], "exact", []
+    if name in identity_index["aliases"]:
+        count("reviewed_matches.identity")
+        return identity_index["aliases"][name], "reviewed", []
+
+    candidates = _fuzzy_candidates(name, roster["names"])
+    listed = [(round(score, 3), n, roster["names"][n]) for score, n in candidates[:3]]
+
+    for alias in first_name_aliases.get(first_name, []):
+        if f"{alias} {last_name}" in roster["names"]:
+            count("alias_matches.identity")
+            return roster["names"][f"{alias} {last_name}"], "alias", listed
+
+    if number is not None:
+        number_ids = roster["numbers"].get(str(number), [])
+        if len(number_ids) == 1:
+            roster_name = normalize_name(identity_index["players"][str(number_ids[0])])
+            roster_last_name = " ".join(
+                roster_name.split(" ")[-len(last_name.split(" ")) :]
+            )
+            if (
+                trigram_similarity(
+                    name_trigrams(last_name), name_trigrams(roster_last_name)
+                )
+                >= last_name_threshold
+            ):
+                count("number_matches.identity")
+                return number_ids[0], "number", listed
+
+    best_score = candidates[0][0] if len(candidates) else 0
+    second_score = candidates[1][0] if len(candidates) > 1 else 0
+    if best_score >= fuzzy_threshold and best_score - second_score >= fuzzy_margin:
+        count("fuzzy_matches.identity")
+        return roster["names"][candidates[0][1]], "fuzzy", listed
+
+    return None, None, listed
+
+
+def queue_for_review(
+    game_id, team_id, season_year, name, number, candidates, match=None, matched_id=None
+):
+    # once per name, team and season, later games with the same name are only counted
+    # match and matched_id are how and to whom a name that did resolve was matched
+    count("review_queue.identity")
+    if (name, team_id, season_year) in _queued_names:
+        return
+    _queued_names.add((name, team_id, season_year))
+    os.makedirs(identity_folder(), exist_ok=True)
+    entry = {
+        "game_id": str(game_id),
+        "team_id": team_id,
+        "season": season_year,
+        "name": name,
+        "number": number,
+        "candidates": candidates,
+        "match": match,
+        "matched_id": matched_id,
+        "player_id": None,
+    }
+    with open(review_queue_filename(), "a") as af:
+        af.write(json.dumps(entry) + "\n")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--seasons", nargs="+", default=[], help="e.g. 2020 2021, index their rosters"
+    )
+    parser.add_argument(
+        "--review", action="store_true", help="list names waiting for review"
+    )
+
+    args = parser.parse_args()
+
+    for season in args.seasons:
+        load_identity_index(f"{season}{int(season) + 1}")
+
+    if args.review:
+        for entry in load_review_queue():
+            if entry["player_id"] is None:
+                matched = (
+                    f' matched to {entry["matched_id"]} by {entry["match"]},'
+                    if entry.get("match") is not None
+                    else ""
+                )
+                print(
+                    f'{entry["season"]} {entry["game_id"]} #{entry["number"]} {entry["name"]}:{matched} '
+                    + ", ".join(
+                        f"{name} ({player_id}, {score})"
+                        for score, name, player_id in entry["candidates"]
+                    )
+                )
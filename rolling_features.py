@@ -0,0 +1,121 @@
+import os
+import time
+import numpy as np
+import pandas as pd
+
+from instrumentation import progress
+from player_data import load_player_tables, player_data_folder
+
+# form features for the player and goalie models, for every game of a player-season they describe the previous
+#  `window` games of that season (the game itself is never included):
+#   {col}_sum_{window} -> total over the window
+#   {col}_mean_{window} -> total / window, early season games with fewer previous games are divided by window too
+#   {col}_slope_{window} -> least squares slope per game over the window, 0 with fewer than 2 previous games
+# all windows and columns are computed in one pass over the table with prefix sums instead of slicing each log
+
+skater_columns = ["goals", "shots", "toi"]
+goalie_columns = ["saves", "shots_against", "goals_against", "toi"]
+
+
+def _window_sums(values, window_start, row):
+    # sum of values[window_start:row] for every row using an exclusive prefix sum
+    cumulative = np.concatenate([[0.0], np.cumsum(values)])
+    return cumulative[row] - cumulative[window_start]
+
+
+def rolling_form_features(game_logs_df, columns, windows=(4,), group_cols=None):
+    # game_logs_df has one row per player and game, returns the features aligned with its index
+    if group_cols is None:
+        group_cols = ["player_id", "season"]
+
+    ordered = game_logs_df.sort_values(group_cols + ["date"], kind="stable")
+    num_rows = len(ordered)
+    row = np.arange(num_rows)
+
+    # first row of the group every row belongs to
+    new_group = np.ones(num_rows, dtype=bool)
+    if num_rows:
+        same_group = np.ones(num_rows - 1, dtype=bool)
+        for col in group_cols:
+            group_values = ordered[col].to_numpy()
+            same_group &= group_values[1:] == group_values[:-1]
+        new_group[1:] = ~same_group
+    group_start = np.maximum.accumulate(np.where(new_group, row, 0))
+    position = (row - group_start).astype(np.float64)
+
+    features = {}
+    for window in windows:
+        window_start = np.maximum(row - window, group_start)
+        n = (row - window_start).astype(np.float64)
+
+        # sums of the game positions and their squares over the window, closed form of the arithmetic series
+        first = position - n
+        last = position - 1
+        t_sum = n * (first + last) / 2
+        t_sq_sum = (
+            last * (last + 1) * (2 * last + 1) - (first - 1) * first * (2 * first - 1)
+        ) / 6
+        denominator = n * t_sq_sum - t_sum**2
+
+        for col in columns:
+            values = ordered[col].to_numpy().astype(np.float64)
+            v_sum = _window_sums(values, window_start, row)
+            tv_sum = _window_sums(position * values, window_start, row)
+
+            features[f"{col}_sum_{window}"] = v_sum
+            features[f"{col}_mean_{window}"] = v_sum / window
+            features[f"{col}_slope_{window}"] = np.divide(
+                n * tv_sum - t_sum * v_sum,
+                denominator,
+                out=np.zeros(num_rows),
+                where=n >= 2,
+            )
+
+    return pd.DataFrame(features, index=ordered.index).reindex(game_logs_df.index)
+
+
+def player_form_features(game_logs_df, windows=(4,)):
+    # skaters and goalies get their own columns, ids kept so features join onto shots by player and gamePk
+    is_goalie = game_logs_df["is_goalie"].to_numpy()
+    features = []
+    for goalie, columns in [(False, skater_columns), (True, goalie_columns)]:
+        logs = game_logs_df.loc[is_goalie == goalie]
+        form = rolling_form_features(logs, columns, windows=windows)
+        features.append(
+            pd.concat(
+                [logs[["player_id", "season", "gamePk", "is_goalie"]], form], axis=1
+            )
+        )
+
+    return pd.concat(features, ignore_index=True).astype(
+        {
+            col: np.float32
+            for f in features
+            for col in f.columns
+            if col not in ["player_id", "season", "gamePk", "is_goalie"]
+        }
+    )
+
+
+def build_form_features(windows=(4, 10, 20)):
+    start = time.time()
+
+    _, _, game_logs_df = load_player_tables()
+    form_df = player_form_features(game_logs_df, windows=windows)
+    form_df.to_parquet(
+        os.path.join(player_data_folder(), "form_features.parquet"), index=False
+    )
+
+    end = time.time()
+    progress(
+        f"Built form features for {len(form_df)} player games in {end - start:.2f} seconds."
+    )
+    return form_df
+
+
+def load_form_features():
+    return pd.read_parquet(os.path.join(player_data_folder(), "form_features.parquet"))
+
+
+if __name__ == "__main__":
+    build_form_features()
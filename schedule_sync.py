@@ -0,0 +1,182 @@
+import os
+import json
+from datetime import date, datetime, timedelta
+
+from instrumentation import count, progress
+from nhl_requests import endpoint_url, nhl_get
+
+# local copy of a season's schedule so a refresh only asks the api for the dates that can still change
+# one json file per season, data/{season}/schedule.json:
+#  synced_at -> when the schedule was last synced
+#  games -> gameId -> {gamePk, gameType, gameDate, date, status, teams, ingested}
+#   the fields of the schedule endpoint game entries (status holds abstractGameState and detailedState, teams the
+#    home/away team id and name) plus date, the day it is listed under, and ingested, whether its data is saved
+# the first sync downloads the whole season, later ones only the dates from the earliest game that is not final yet
+#  (or the day after the last game when they all are, to pick up playoff games scheduled since)
+# a game is collected once it is final and not ingested yet, build_season_data marks it ingested after its data is
+#  saved, in batches
+
+final_state = "Final"
+
+
+def schedule_filename(season_year):
+    return os.path.join(os.path.dirname(__file__), "data", season_year, "schedule.json")
+
+
+def season_end_date(season_year):
+    # after the latest playoffs there have been (the 2020 bubble ended at the end of september)
+    return f"{season_year[4:]}-09-30"
+
+
+def load_schedule(season_year):
+    filename = schedule_filename(season_year)
+    if not os.path.isfile(filename):
+        return None
+    with open(filename, "r") as json_file:
+        return json.load(json_file)
+
+
+def save_schedule(season_year, schedule):
+    filename = schedule_filename(season_year)
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+
+    # write then rename so a reader never sees a half written schedule
+    tmp_filename = f"{filename}.{os.getpid()}.tmp"
+    with open(tmp_filename, "w") as json_file:
+        json.dump(schedule, json_file, sort_keys=True)
+    os.replace(tmp_filename, filename)
+
+
+def game_is_final(game):
+    return game["status"]["abstractGameState"] == final_state
+
+
+def schedule_game(game_date, game_data):
+    # the fields of a schedule endpoint game that collection needs
+    return {
+        "gamePk": game_data["gamePk"],
+        "gameType": game_data["gameType"],
+        "gameDate": game_data["gameDate"],
+        "date": game_date,
+        "status": {
+            "abstractGameState": game_data["status"]["abstractGameState"],
+            "detailedState": game_data["status"]["detailedState"],
+        },
+        "teams": {
+            side: {
+                "team": {
+                    "id": game_data["teams"][side]["team"]["id"],
+                    "name": game_data["teams"][side]["team"]["name"],
+                }
+            }
+            for side in ["home", "away"]
+        },
+    }
+
+
+def sync_start_date(schedule):
+    # earliest day that can still change, None when nothing has been synced
+    if schedule is None or not len(schedule["games"]):
+        return None
+    open_dates = [g["date"] for g in schedule["games"].values() if not game_is_final(g)]
+    if len(open_dates):
+        return min(open_dates)
+    last_date = max(g["date"] for g in schedule["games"].values())
+    return (date.fromisoformat(last_date) + timedelta(days=1)).isoformat()
+
+
+def game_data_exists(season_year, game_id):
+    game_folder = os.path.join(os.path.dirname(__file__), "data", season_year, game_id)
+    return all(
+        os.path.isfile(os.path.join(game_folder, filename))
+        for filename in [
+            "live_data.csv",
+            "pbp_data.csv",
+            "away_shifts_data.csv",
+            "home_shifts_data.csv",
+        ]
+    )
+
+
+def sync_schedule(season_year):
+    schedule = load_schedule(season_year)
+    start_date = sync_start_date(schedule)
+    if start_date is None:
+        season_request = nhl_get(
+            endpoint_url("schedule", season_year=season_year), "schedule"
+        )
+    elif start_date > season_end_date(season_year):
+        season_request = None
+    else:
+        season_request = nhl_get(
+            endpoint_url(
+                "schedule_dates",
+                start_date=start_date,
+                end_date=season_end_date(season_year),
+            ),
+            "schedule",
+        )
+    if season_request is not None:
+        assert (
+            season_request.status_code == 200
+        ), f"Schedule request for {season_year} returned {season_request.status_code}."
+        dates = season_request.json()["dates"]
+    else:
+        dates = []
+
+    if schedule is None:
+        schedule = {"games": {}}
+        backfill = True
+    else:
+        backfill = False
+
+    new_games = 0
+    newly_final = 0
+    for game_date_dict in dates:
+        for game_data in game_date_dict["games"]:
+            game_id = str(game_data["gamePk"])
+            game = schedule_game(game_date_dict["date"], game_data)
+            previous = schedule["games"].get(game_id)
+            if previous is None:
+                new_games += 1
+                # games collected before the schedule was kept locally are only checked on disk once
+                game["ingested"] = (
+                    backfill
+                    and game_is_final(game)
+                    and game_data_exists(season_year, game_id)
+                )
+            else:
+                newly_final += game_is_final(game) and not game_is_final(previous)
+                game["ingested"] = previous["ingested"]
+            schedule["games"][game_id] = game
+
+    schedule["synced_at"] = datetime.now().isoformat(timespec="seconds")
+    save_schedule(season_year, schedule)
+    count("schedule_dates.sync", len(dates))
+    progress(
+        f"Synced {len(dates)} days of the {season_year} schedule from {start_date or 'the start'}, "
+        f"{new_games} new games and {newly_final} newly final.",
+        season=season_year,
+    )
+    return schedule
+
+
+def games_to_ingest(schedule, game_types=("R", "P")):
+    # (gameId, game) of the final games whose data is not saved yet, in schedule order
+    return sorted(
+        (
+            (game_id, game)
+            for game_id, game in schedule["games"].items()
+            if game["gameType"] in game_types
+            and game_is_final(game)
+            and not game["ingested"]
+        ),
+        key=lambda item: (item[1]["gameDate"], item[0]),
+    )
+
+
+def mark_ingested(season_year, schedule, game_ids):
+    # one save for a batch of games
+    for game_id in game_ids:
+        schedule["games"][str(game_id)]["ingested"] = True
+    save_schedule(season_year, schedule)
@@ -0,0 +1,285 @@
+import os
+import time
+import joblib
+import numpy as np
+import pandas as pd
+from scipy.ndimage import convolve
+from scipy.spatial import cKDTree
+
+from instrumentation import progress
+from dangerous_shot import load_season_shots
+
+# shot situation model: goal rate of historical shots near a location, within the same strength state
+# shot coordinates from the live feed are whole feet, so shots and goals are counted on a one foot grid of the
+#  attacking half of the rink and every query is answered per grid cell, then broadcast back to the shots in it
+# index is strength -> {"shots": shot count grid, "goals": goal count grid, "cells": occupied cell ids,
+#  "cell_tree": KD tree over occupied cell centers, "goal_rate": overall goal rate}, "all" holds every strength
+#  together and answers strengths with too few shots
+
+grid_x = np.arange(0, 101)
+grid_y = np.arange(-43, 44)
+
+
+def normalize_shot_coordinates(shot_x, shot_y):
+    # teams switch ends every period, fold every shot onto the positive x end of the rink
+    shot_x = np.asarray(shot_x, dtype=np.float64)
+    shot_y = np.asarray(shot_y, dtype=np.float64)
+    flip = shot_x < 0
+    return np.column_stack([np.abs(shot_x), np.where(flip, -shot_y, shot_y)])
+
+
+def shot_cells(shot_x, shot_y):
+    # grid cell id of every shot, off rink coordinates are clipped to the boards and shots without coordinates are
+    #  looked up at center ice, where the parser used to put them (they are never indexed)
+    xy = np.rint(np.nan_to_num(normalize_shot_coordinates(shot_x, shot_y))).astype(
+        np.int64
+    )
+    x_ind = np.clip(xy[:, 0], grid_x[0], grid_x[-1]) - grid_x[0]
+    y_ind = np.clip(xy[:, 1], grid_y[0], grid_y[-1]) - grid_y[0]
+    return x_ind * len(grid_y) + y_ind
+
+
+def _cell_centers(cells):
+    return np.column_stack(
+        [grid_x[cells // len(grid_y)], grid_y[cells % len(grid_y)]]
+    ).astype(np.float64)
+
+
+def indexed_shots(shots_df):
+    # blocked shots are recorded where they were blocked and some shots have no coordinates (nan from the parser),
+    #  neither says where goals are scored from, so only the other shots are indexed (the live data scorer never
+    #  queries blocked shots either)
+    coordinates = shots_df[["shot_x", "shot_y"]].to_numpy(dtype=np.float64)
+    return (shots_df["event"].to_numpy() != "Blocked Shot") & np.isfinite(
+        coordinates
+    ).all(axis=1)
+
+
+def build_shot_index(shots_df, min_shots=500):
+    start = time.time()
+
+    shots_df = shots_df.loc[indexed_shots(shots_df)]
+    cells = shot_cells(shots_df["shot_x"], shots_df["shot_y"])
+    is_goal = shots_df["is_goal"].to_numpy().astype(bool)
+    strengths = shots_df["strength"].to_numpy()
+
+    partitions = {"all": np.ones(len(cells), dtype=bool)}
+    for strength in np.unique(strengths):
+        in_strength = strengths == strength
+        if in_strength.sum() >= min_shots:
+            partitions[strength] = in_strength
+
+    num_cells = len(grid_x) * len(grid_y)
+    shot_index = {}
+    for strength, in_strength in partitions.items():
+        shot_counts = np.bincount(cells[in_strength], minlength=num_cells)
+        goal_counts = np.bincount(cells[in_strength & is_goal], minlength=num_cells)
+        occupied = np.flatnonzero(shot_counts)
+        shot_index[strength] = {
+            "shots": shot_counts.reshape(len(grid_x), len(grid_y)),
+            "goals": goal_counts.reshape(len(grid_x), len(grid_y)),
+            "cells": occupied,
+            "cell_tree": cKDTree(_cell_centers(occupied)),
+            "goal_rate": is_goal[in_strength].mean(),
+        }
+
+    end = time.time()
+    progress(
+        f"Indexed {len(cells)} shots in {len(shot_index)} strength partitions in {end - start:.2f} seconds."
+    )
+    return shot_index
+
+
+def _partition_groups(shot_index, strength):
+    # positions of the queried shots grouped by the partition that answers them
+    strength = np.asarray(strength)
+    groups = {}
+    for s in np.unique(strength):
+        partition = s if s in shot_index else "all"
+        positions = np.flatnonzero(strength == s)
+        groups[partition] = (
+            np.concatenate([groups[partition], positions])
+            if partition in groups
+            else positions
+        )
+    return groups
+
+
+def _in_index(num_shots, indexed):
+    if indexed is None:
+        return np.ones(num_shots, dtype=np.int64)
+    return np.asarray(indexed, dtype=np.int64)
+
+
+def _disk_kernel(radius):
+    r = int(np.floor(radius))
+    offsets = np.arange(-r, r + 1)
+    return (offsets[:, None] ** 2 + offsets[None, :] ** 2 <= radius**2).astype(
+        np.int64
+    )
+
+
+def radius_goal_rate(
+    shot_index, shot_x, shot_y, strength, radius=10.0, is_goal=None, indexed=None
+):
+    # number of shots, number of goals and goal rate within radius feet of every queried shot
+    # pass is_goal when the queried shots are part of the index so each shot does not count itself, and indexed when
+    #  only some of them are (indexed_shots of the queried shots)
+    cells = shot_cells(shot_x, shot_y)
+    shots = np.zeros(len(cells), dtype=np.int64)
+    goals = np.zeros(len(cells), dtype=np.int64)
+
+    kernel = _disk_kernel(radius)
+    for partition, positions in _partition_groups(shot_index, strength).items():
+        part = shot_index[partition]
+        # counts within the radius of every cell at once, kept for the next query, then one lookup per shot
+        if ("radius", radius) not in part:
+            part[("radius", radius)] = (
+                convolve(part["shots"], kernel, mode="constant"),
+                convolve(part["goals"], kernel, mode="constant"),
+            )
+        radius_shots, radius_goals = part[("radius", radius)]
+        shots[positions] = radius_shots.ravel()[cells[positions]]
+        goals[positions] = radius_goals.ravel()[cells[positions]]
+
+    if is_goal is not None:
+        in_index = _in_index(len(cells), indexed)
+        shots = np.maximum(shots - in_index, 0)
+        goals = np.maximum(goals - np.asarray(is_goal, dtype=np.int64) * in_index, 0)
+
+    rate = np.divide(
+        goals, shots, out=np.zeros(len(cells), dtype=np.float64), where=shots > 0
+    )
+    return shots, goals, rate
+
+
+def knn_goal_rate(
+    shot_index, shot_x, shot_y, strength, k=50, is_goal=None, indexed=None
+):
+    # goal rate of the k nearest historical shots of every queried shot and the distance to the furthest of them
+    # pass is_goal when the queried shots are part of the index so each shot does not count itself, and indexed when
+    #  only some of them are
+    cells = shot_cells(shot_x, shot_y)
+    rate = np.zeros(len(cells), dtype=np.float64)
+    reach = np.zeros(len(cells), dtype=np.float64)
+    k_shots = k + 1 if is_goal is not None else k
+    if is_goal is not None:
+        in_index = _in_index(len(cells), indexed)
+
+    for partition, positions in _partition_groups(shot_index, strength).items():
+        part = shot_index[partition]
+        shot_counts = part["shots"].ravel()
+        goal_counts = part["goals"].ravel()
+
+        # every occupied cell holds at least one shot, so the k nearest cells always hold k shots
+        query_cells, inverse = np.unique(cells[positions], return_inverse=True)
+        k_cells = min(k_shots, len(part["cells"]))
+        distances, neighbors = part["cell_tree"].query(
+            _cell_centers(query_cells), k=k_cells, workers=-1
+        )
+        distances = distances.reshape(len(query_cells), k_cells)
+        neighbor_cells = part["cells"][neighbors.reshape(len(query_cells), k_cells)]
+
+        # take whole cells nearest first and the fraction of the last cell needed to reach k shots
+        neighbor_shots = shot_counts[neighbor_cells]
+        neighbor_goals = goal_counts[neighbor_cells]
+        shots_before = np.cumsum(neighbor_shots, axis=1) - neighbor_shots
+        taken = np.clip(k_shots - shots_before, 0, neighbor_shots)
+        num_taken = taken.sum(axis=1)
+        cell_goals = (neighbor_goals * taken / neighbor_shots).sum(axis=1)
+        last_cell = np.argmax(shots_before + taken >= num_taken[:, None], axis=1)
+        cell_reach = distances[np.arange(len(query_cells)), last_cell]
+
+        query_goals = cell_goals[inverse]
+        query_shots = num_taken[inverse].astype(np.float64)
+        if is_goal is not None:
+            query_goals = (
+                query_goals
+                - np.asarray(is_goal, dtype=np.float64)[positions] * in_index[positions]
+            )
+            query_shots = query_shots - in_index[positions]
+        rate[positions] = np.divide(
+            np.maximum(query_goals, 0),
+            query_shots,
+            out=np.zeros(len(positions), dtype=np.float64),
+            where=query_shots > 0,
+        )
+        reach[positions] = cell_reach[inverse]
+
+    return rate, reach
+
+
+def shot_danger_scorer(shot_index, radius=10.0):
+    # scorer for accumulate_game, the league goal rate around each shot within its strength state
+    def scorer(shots_df):
+        _, _, rate = radius_goal_rate(
+            shot_index,
+            shots_df["shot_x"],
+            shots_df["shot_y"],
+            shots_df["strength"],
+            radius=radius,
+        )
+        return rate
+
+    return scorer
+
+
+def shot_index_filename():
+    return os.path.join(os.path.dirname(__file__), "data", "shot_index.joblib")
+
+
+def save_shot_index(shot_index):
+    joblib.dump(shot_index, shot_index_filename())
+
+
+def load_shot_index():
+    return joblib.load(shot_index_filename())
+
+
+def season_shot_features(shot_index, shots_df, radius=10.0, k=50):
+    # danger features for every shot of a season, each indexed shot is excluded from its own neighborhood
+    start = time.time()
+
+    indexed = indexed_shots(shots_df)
+
+    shots, goals, rate = radius_goal_rate(
+        shot_index,
+        shots_df["shot_x"],
+        shots_df["shot_y"],
+        shots_df["strength"],
+        radius=radius,
+        is_goal=shots_df["is_goal"],
+        indexed=indexed,
+    )
+    knn_rate, knn_reach = knn_goal_rate(
+        shot_index,
+        shots_df["shot_x"],
+        shots_df["shot_y"],
+        shots_df["strength"],
+        k=k,
+        is_goal=shots_df["is_goal"],
+        indexed=indexed,
+    )
+
+    end = time.time()
+    progress(
+        f"Computed danger features for {len(shots_df)} shots in {end - start:.2f} seconds."
+    )
+
+    return pd.DataFrame(
+        {
+            "radius_shots": shots,
+            "radius_goals": goals,
+            "radius_goal_rate": rate,
+            "knn_goal_rate": knn_rate,
+            "knn_reach": knn_reach,
+        },
+        index=shots_df.index,
+    )
+
+
+if __name__ == "__main__":
+    season_ids = ["20202021"]
+
+    shot_index = build_shot_index(load_season_shots(season_ids))
+    save_shot_index(shot_index)
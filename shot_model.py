@@ -0,0 +1,290 @@
+import os
+import time
+import hashlib
+import joblib
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.linear_model import LogisticRegression
+from sklearn.metrics import log_loss, roc_auc_score
+from sklearn.model_selection import GroupKFold
+
+from instrumentation import progress
+from dangerous_shot import load_season_shots
+from shot_danger import build_shot_index, knn_goal_rate
+from beta_binomial import (
+    new_state,
+    update_state,
+    posterior_table,
+    shot_local_rates,
+    score_shots,
+)
+from player_data import load_player_tables
+from rolling_features import load_form_features
+
+# stacked expected goals model from the plan in dangerous_shot.py, five base models stacked by a logistic regression
+#   player -> random forest on the shooter's form and profile
+#   situation -> k nearest historical shots of the same strength state (shot_danger index)
+#   player_situation -> beta-binomial shooter posterior times local goal rate
+#   goalie -> random forest on the goalie's form and profile
+#   goalie_situation -> beta-binomial goalie posterior times local goal rate
+# every base model is fit once per fold (grouped by game so shots of one game never straddle train and validation)
+#  and the out of fold predictions are cached on disk, so only base models whose definition or data changed are
+#  refit and changing the meta model alone takes seconds
+
+shooter_features = [
+    "shooter_goals_mean_10",
+    "shooter_goals_slope_10",
+    "shooter_shots_mean_10",
+    "shooter_shots_slope_10",
+    "shooter_toi_mean_10",
+    "shooter_toi_slope_10",
+    "shooter_height",
+    "shooter_weight",
+    "shooter_current_age",
+]
+goalie_features = [
+    "goalie_saves_mean_10",
+    "goalie_shots_against_mean_10",
+    "goalie_goals_against_mean_10",
+    "goalie_goals_against_slope_10",
+    "goalie_toi_mean_10",
+    "goalie_height",
+    "goalie_weight",
+    "goalie_current_age",
+]
+
+base_models = {
+    "player": {
+        "kind": "forest",
+        "features": shooter_features,
+        "params": {"n_estimators": 200, "min_samples_leaf": 50},
+    },
+    "situation": {"kind": "knn", "params": {"k": 100}},
+    "player_situation": {"kind": "beta_binomial", "params": {"role": "shooter"}},
+    "goalie": {
+        "kind": "forest",
+        "features": goalie_features,
+        "params": {"n_estimators": 200, "min_samples_leaf": 50},
+    },
+    "goalie_situation": {"kind": "beta_binomial", "params": {"role": "goalie"}},
+}
+
+
+def stack_folder():
+    return os.path.join(os.path.dirname(__file__), "model", "shot_stack")
+
+
+def build_training_table(season_ids):
+    # one row per shot with the shooter's and goalie's form going into that game
+    shots_df = load_season_shots(season_ids)
+    profiles_df, _, _ = load_player_tables()
+    form_df = load_form_features()
+
+    player_df = form_df.merge(profiles_df, on="player_id", how="left")
+    for role in ["shooter", "goalie"]:
+        role_df = player_df.drop(columns=["season", "is_goalie"]).add_prefix(f"{role}_")
+        shots_df = shots_df.merge(
+            role_df,
+            left_on=[f"{role}_id", "gameId"],
+            right_on=[f"{role}_player_id", f"{role}_gamePk"],
+            how="left",
+        ).drop(columns=[f"{role}_player_id", f"{role}_gamePk"])
+
+    return shots_df
+
+
+def _fit_base_model(definition, train_df):
+    kind = definition["kind"]
+    params = definition["params"]
+    if kind == "forest":
+        clf = RandomForestClassifier(n_jobs=1, random_state=645, **params)
+        clf.fit(train_df[definition["features"]].fillna(-1), train_df["is_goal"])
+        return clf
+    elif kind == "knn":
+        return build_shot_index(train_df)
+    elif kind == "beta_binomial":
+        shot_index = build_shot_index(train_df)
+        local_rate = shot_local_rates(shot_index, train_df, in_index=True)
+        state = update_state(new_state(), train_df, local_rate)
+        return shot_index, posterior_table(state, params["role"])
+    else:
+        raise NotImplementedError
+
+
+def _predict_base_model(definition, fitted, df):
+    kind = definition["kind"]
+    params = definition["params"]
+    if kind == "forest":
+        return fitted.predict_proba(df[definition["features"]].fillna(-1))[:, 1]
+    elif kind == "knn":
+        rate, _ = knn_goal_rate(
+            fitted, df["shot_x"], df["shot_y"], df["strength"], k=params["k"]
+        )
+        return rate
+    elif kind == "beta_binomial":
+        shot_index, table = fitted
+        local_rate = shot_local_rates(shot_index, df)
+        no_player = table.iloc[:0]
+        if params["role"] == "shooter":
+            return score_shots(df, local_rate, table, no_player)
+        else:
+            return score_shots(df, local_rate, no_player, table)
+    else:
+        raise NotImplementedError
+
+
+def _fold_predictions(definition, train_df, val_df):
+    fitted = _fit_base_model(definition, train_df)
+    return _predict_base_model(definition, fitted, val_df)
+
+
+# columns of the shot table the spatial and beta-binomial base models read, the forests read their features
+spatial_columns = ["event", "shot_x", "shot_y", "strength", "is_goal"]
+posterior_columns = spatial_columns + ["shooter_id", "goalie_id"]
+
+
+def base_model_columns(definition):
+    kind = definition["kind"]
+    if kind == "forest":
+        return definition["features"] + ["is_goal"]
+    elif kind == "knn":
+        return spatial_columns
+    elif kind == "beta_binomial":
+        return posterior_columns
+    else:
+        raise NotImplementedError
+
+
+def _cache_key(name, definition, shots_df, n_splits):
+    # changes whenever the base model definition, the folds or any value the base model reads change, so re-parsed
+    #  shots or rebuilt player and form tables are refit instead of served from the cache
+    fingerprint = hashlib.sha1()
+    fingerprint.update(repr((name, sorted(definition.items()), n_splits)).encode())
+    fingerprint.update(shots_df["gameId"].to_numpy().tobytes())
+    fingerprint.update(shots_df["playId"].to_numpy().tobytes())
+    columns = base_model_columns(definition)
+    fingerprint.update(repr(columns).encode())
+    fingerprint.update(
+        pd.util.hash_pandas_object(shots_df[columns], index=False).to_numpy().tobytes()
+    )
+    return fingerprint.hexdigest()[:16]
+
+
+def out_of_fold_predictions(shots_df, n_splits=5, n_jobs=-1):
+    cache_folder = os.path.join(stack_folder(), "cache")
+    if not os.path.isdir(cache_folder):
+        os.makedirs(cache_folder)
+
+    folds = list(
+        GroupKFold(n_splits=n_splits).split(shots_df, groups=shots_df["gameId"])
+    )
+
+    oof = {}
+    missing = []
+    for name, definition in base_models.items():
+        cache_filename = os.path.join(
+            cache_folder,
+            f"{name}-{_cache_key(name, definition, shots_df, n_splits)}.npy",
+        )
+        if os.path.isfile(cache_filename):
+            oof[name] = np.load(cache_filename)
+            progress(f"Loaded cached out of fold predictions for {name}.")
+        else:
+            missing.append((name, cache_filename))
+
+    # every missing (base model, fold) pair is fit exactly once, all in parallel
+    start = time.time()
+    jobs = [(name, fold_ind) for name, _ in missing for fold_ind in range(n_splits)]
+    fold_preds = Parallel(n_jobs=n_jobs)(
+        delayed(_fold_predictions)(
+            base_models[name],
+            shots_df.iloc[folds[fold_ind][0]],
+            shots_df.iloc[folds[fold_ind][1]],
+        )
+        for name, fold_ind in jobs
+    )
+    end = time.time()
+    if jobs:
+        progress(f"Fit {len(jobs)} base model folds in {end - start:.2f} seconds.")
+
+    for name, _ in missing:
+        oof[name] = np.full(len(shots_df), np.nan)
+    for (name, fold_ind), preds in zip(jobs, fold_preds):
+        oof[name][folds[fold_ind][1]] = preds
+    for name, cache_filename in missing:
+        np.save(cache_filename, oof[name])
+
+    return pd.DataFrame({name: oof[name] for name in base_models}, index=shots_df.index)
+
+
+def _meta_features(base_preds):
+    clipped = np.clip(base_preds.to_numpy(), 1e-4, 1 - 1e-4)
+    return np.log(clipped / (1 - clipped))
+
+
+def train_stacked_model(season_ids, n_splits=5, n_jobs=-1, meta_params=None):
+    shots_df = build_training_table(season_ids)
+    y = shots_df["is_goal"].to_numpy()
+
+    oof_df = out_of_fold_predictions(shots_df, n_splits=n_splits, n_jobs=n_jobs)
+
+    start = time.time()
+    meta_clf = LogisticRegression(**(meta_params or {}))
+    meta_clf.fit(_meta_features(oof_df), y)
+    end = time.time()
+    progress(f"Meta model took {end - start:.2f} seconds.")
+
+    for name in base_models:
+        progress(
+            f"{name}: log loss {log_loss(y, np.clip(oof_df[name], 1e-4, 1 - 1e-4)):.4f} auc {roc_auc_score(y, oof_df[name]):.3f}"
+        )
+    # in sample for the meta model, which only has one weight per base model
+    stacked = meta_clf.predict_proba(_meta_features(oof_df))[:, 1]
+    progress(
+        f"stacked: log loss {log_loss(y, stacked):.4f} auc {roc_auc_score(y, stacked):.3f}"
+    )
+
+    # base models for scoring new shots are fit once on all shots and cached like the fold predictions
+    fitted = {}
+    missing = []
+    for name, definition in base_models.items():
+        cache_filename = os.path.join(
+            stack_folder(),
+            "cache",
+            f"{name}-{_cache_key(name, definition, shots_df, n_splits)}.joblib",
+        )
+        if os.path.isfile(cache_filename):
+            fitted[name] = joblib.load(cache_filename)
+        else:
+            missing.append((name, cache_filename))
+    missing_fitted = Parallel(n_jobs=n_jobs)(
+        delayed(_fit_base_model)(base_models[name], shots_df) for name, _ in missing
+    )
+    for (name, cache_filename), base_fitted in zip(missing, missing_fitted):
+        joblib.dump(base_fitted, cache_filename)
+        fitted[name] = base_fitted
+
+    joblib.dump(
+        {
+            "base_models": base_models,
+            "fitted": fitted,
+            "meta": meta_clf,
+        },
+        os.path.join(stack_folder(), "shot_stack.joblib"),
+    )
+
+
+def predict_shots(stack, shots_df):
+    base_preds = pd.DataFrame(
+        {
+            name: _predict_base_model(definition, stack["fitted"][name], shots_df)
+            for name, definition in stack["base_models"].items()
+        }
+    )
+    return stack["meta"].predict_proba(_meta_features(base_preds))[:, 1]
+
+
+def load_stacked_model():
+    return joblib.load(os.path.join(stack_folder(), "shot_stack.joblib"))
@@ -0,0 +1,158 @@
+import os
+import json
+import hashlib
+import numpy as np
+
+from instrumentation import progress, warning
+from game_index import build_game_index, game_index_filename, load_game_index
+
+# train/validation splits by game built from the game index, so no game folder is listed or opened
+# a split is saved as a manifest in splits/{name}.json with the parameters that made it (including a hash of the games
+#  selected, so games indexed since rebuild it) and both game lists, loading a manifest gives back exactly the same
+#  games on any machine
+# a season collected before the game index existed has its index backfilled from the game folders on first use
+# games are (season_year, gameId) pairs so splits can span seasons
+
+
+def select_games(
+    season_years, game_types=("R",), teams=None, start_date=None, end_date=None
+):
+    # dates are "YYYY-MM-DD", end_date is exclusive, games missing a date are only kept when no date is asked for
+    games = []
+    for season_year in season_years:
+        season_folder = os.path.dirname(game_index_filename(season_year))
+        if os.path.isdir(season_folder) and not os.path.isfile(
+            game_index_filename(season_year)
+        ):
+            build_game_index(season_year)
+        for game_id, game_info in sorted(load_game_index(season_year).items()):
+            if game_types is not None and game_info["game_type"] not in game_types:
+                continue
+            if teams is not None and not (
+                game_info["home_team"] in teams or game_info["away_team"] in teams
+            ):
+                continue
+            if start_date is not None or end_date is not None:
+                if game_info["date"] is None:
+                    continue
+                if start_date is not None and game_info["date"] < start_date:
+                    continue
+                if end_date is not None and game_info["date"] >= end_date:
+                    continue
+            games.append((season_year, game_id))
+    return games
+
+
+def random_split(games, train_ratio, seed=645):
+    # RandomState is kept stable across numpy versions, sorting first makes it independent of index order
+    games = sorted(games)
+    perm = np.random.RandomState(seed).permutation(len(games))
+    train_games = [games[i] for i in perm[: int(len(perm) * train_ratio)]]
+    val_games = [games[i] for i in perm[int(len(perm) * train_ratio) :]]
+    return sorted(train_games), sorted(val_games)
+
+
+def date_split(games, cutoff_date):
+    # train on games before the cutoff, validate on the cutoff and after
+    dates = {
+        (season_year, game_id): load_game_index(season_year)[game_id]["date"]
+        for season_year, game_id in games
+    }
+    assert all(d is not None for d in dates.values()), "All games need a date."
+    train_games = [g for g in sorted(games) if dates[g] < cutoff_date]
+    val_games = [g for g in sorted(games) if dates[g] >= cutoff_date]
+    return train_games, val_games
+
+
+def season_split(games, val_seasons):
+    train_games = [g for g in sorted(games) if g[0] not in val_seasons]
+    val_games = [g for g in sorted(games) if g[0] in val_seasons]
+    return train_games, val_games
+
+
+def team_split(games, val_teams):
+    # any game involving one of val_teams is held out
+    def involves(game):
+        game_info = load_game_index(game[0])[game[1]]
+        return (
+            game_info["home_team"] in val_teams or game_info["away_team"] in val_teams
+        )
+
+    train_games = [g for g in sorted(games) if not involves(g)]
+    val_games = [g for g in sorted(games) if involves(g)]
+    return train_games, val_games
+
+
+split_methods = {
+    "random": random_split,
+    "date": date_split,
+    "season": season_split,
+    "team": team_split,
+}
+
+
+def splits_folder():
+    return os.path.join(os.path.dirname(__file__), "splits")
+
+
+def save_split_manifest(name, params, train_games, val_games):
+    if not os.path.isdir(splits_folder()):
+        os.makedirs(splits_folder())
+    with open(os.path.join(splits_folder(), f"{name}.json"), "w") as json_file:
+        json.dump(
+            {
+                "params": params,
+                "train": [list(g) for g in train_games],
+                "val": [list(g) for g in val_games],
+            },
+            json_file,
+            indent=1,
+        )
+
+
+def load_split_manifest(name):
+    with open(os.path.join(splits_folder(), f"{name}.json"), "r") as json_file:
+        manifest = json.load(json_file)
+    return (
+        manifest["params"],
+        [tuple(g) for g in manifest["train"]],
+        [tuple(g) for g in manifest["val"]],
+    )
+
+
+def make_split(name, season_years, method="random", selection=None, **method_params):
+    # reuse the manifest when it was made with the same parameters from the same games, otherwise build and save it
+    # selection is passed to select_games, method_params to the split method
+    params = {
+        "season_years": list(season_years),
+        "method": method,
+        "selection": selection or {},
+        "method_params": method_params,
+    }
+    games = select_games(season_years, **(selection or {}))
+    assert len(games), (
+        f"No games selected for split {name} in {', '.join(season_years)}, "
+        f"collect them or build their game index (game_index.build_game_index)."
+    )
+    params["games"] = hashlib.sha1(repr(sorted(games)).encode()).hexdigest()[:16]
+    # round trip through json so tuples and lists compare equal with a loaded manifest
+    params = json.loads(json.dumps(params))
+
+    if os.path.isfile(os.path.join(splits_folder(), f"{name}.json")):
+        saved_params, train_games, val_games = load_split_manifest(name)
+        if saved_params == params:
+            return train_games, val_games
+        warning(f"Split {name} was made with other parameters or games, rebuilding it.")
+
+    train_games, val_games = split_methods[method](games, **method_params)
+    save_split_manifest(name, params, train_games, val_games)
+    progress(
+        f"Split {name}: {len(train_games)} train and {len(val_games)} validation games."
+    )
+    return train_games, val_games
+
+
+def game_folders(games):
+    return [
+        os.path.join("data", season_year, game_id) for season_year, game_id in games
+    ]
@@ -0,0 +1,91 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+import accumulate_game
+from accumulate_game import accumulate
+from nhl_requests import live_feed_columns, pbp_columns
+
+
+def live_row(play_id, event, timestamp, **columns):
+    row = {column: 0 for column in live_feed_columns}
+    row.update(
+        {
+            "gameId": 2021020001,
+            "playId": play_id,
+            "event": event,
+            "timestamp": timestamp,
+        }
+    )
+    row.update(columns)
+    return row
+
+
+def pbp_row(play_id, event, timestamp):
+    row = {column: 0 for column in pbp_columns}
+    row.update(
+        {
+            "gameId": 2021020001,
+            "playId": play_id,
+            "strength": "EV",
+            "timestamp": timestamp,
+            "event": event,
+            "description": "",
+            "away_on_ice": "3_2_1",
+            "home_on_ice": "3_2_1",
+            "away_goalie_number": 31,
+            "home_goalie_number": 30,
+        }
+    )
+    return row
+
+
+def save_game(game_folder):
+    os.makedirs(game_folder)
+    pd.DataFrame(
+        [
+            # the game opens with a shot, and the hit has no play by play row so it is skipped
+            live_row(1, "Shot", 3590, home_shot=1, shot_x=70, shot_y=2),
+            live_row(2, "Faceoff", 3500, home_faceoff_won=1),
+            live_row(3, "Hit", 3400, away_hit=1),
+            live_row(4, "Goal", 3000, away_goal=1, away_shot=1, shot_x=-80, shot_y=3),
+            live_row(5, "Missed Shot", 2000, home_shot=1, shot_x=60, shot_y=-9),
+            live_row(6, "Game End", 0, home_win=1),
+        ]
+    ).to_csv(os.path.join(game_folder, "live_data.csv"), index=False)
+    pd.DataFrame(
+        [
+            pbp_row(1, "SHOT", 3590),
+            pbp_row(2, "FAC", 3500),
+            pbp_row(3, "GOAL", 3000),
+            pbp_row(4, "MISS", 2000),
+            pbp_row(5, "GEND", 0),
+        ]
+    ).to_csv(os.path.join(game_folder, "pbp_data.csv"), index=False)
+    for side, player_ids in [("home", [1, 2]), ("away", [3, 4])]:
+        pd.DataFrame(
+            {
+                "gameId": 2021020001,
+                "playerId": player_ids,
+                "start_shift": [3600, 3000],
+                "end_shift": [3000, 2000],
+                "shift_length": [600, 1000],
+                "event": "0",
+            }
+        ).to_csv(os.path.join(game_folder, f"{side}_shifts_data.csv"), index=False)
+
+
+def test_expected_goals_sum_every_shot(tmp_path, monkeypatch):
+    monkeypatch.setattr(accumulate_game, "data_folder", lambda: str(tmp_path))
+    save_game(str(tmp_path / "20212022" / "2021020001"))
+
+    def shot_scorer(shots_df):
+        return 0.1 * (1 + np.arange(len(shots_df)))
+
+    accumulate_dict = accumulate("20212022", "2021020001", shot_scorer=shot_scorer)
+
+    # home shot 0.1, away goal 0.2 and home miss 0.3, the skipped hit leaves the totals alone
+    assert accumulate_dict["playId"] == [1, 2, 4, 5, 6]
+    assert np.allclose(accumulate_dict["xg_total"], [0.1, 0.1, 0.3, 0.6, 0.6])
+    assert np.allclose(accumulate_dict["xg_differential"], [0.1, 0.1, -0.1, 0.2, 0.2])
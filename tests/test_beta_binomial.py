@@ -0,0 +1,66 @@
+import numpy as np
+import pandas as pd
+
+from beta_binomial import (
+    beta_from_moments,
+    new_state,
+    posterior_table,
+    prior_parameters,
+    update_state,
+)
+
+
+def random_shots(seed=0, num_shots=400):
+    rng = np.random.RandomState(seed)
+    shots_df = pd.DataFrame(
+        {
+            "shooter_id": rng.choice([-1, 11, 12, 13, 14], num_shots),
+            "goalie_id": rng.choice([31, 32, 33], num_shots),
+            "is_goal": rng.rand(num_shots) < 0.1,
+        }
+    )
+    return shots_df, rng.uniform(0.01, 0.3, num_shots)
+
+
+def test_beta_from_moments_recovers_mean_and_variance():
+    for mean, var in [(0.1, 0.002), (0.5, 0.01), (0.03, 0.0001)]:
+        alpha, beta = beta_from_moments(mean, var)
+        assert np.isclose(alpha / (alpha + beta), mean)
+        assert np.isclose(
+            alpha * beta / ((alpha + beta) ** 2 * (alpha + beta + 1)), var
+        )
+
+
+def test_beta_from_moments_clips_impossible_variance():
+    alpha, beta = beta_from_moments(0.2, 0.5)
+    assert alpha > 0 and beta > 0
+    assert np.isclose(alpha / (alpha + beta), 0.2)
+
+
+def test_incremental_update_matches_one_batch():
+    shots_df, local_rate = random_shots()
+    whole = update_state(new_state(), shots_df, local_rate)
+
+    split = 150
+    state = update_state(new_state(), shots_df.iloc[:split], local_rate[:split])
+    state = update_state(state, shots_df.iloc[split:], local_rate[split:])
+
+    assert state["prior"]["n"] == whole["prior"]["n"]
+    assert np.isclose(state["prior"]["rate_sum"], whole["prior"]["rate_sum"])
+    assert np.isclose(state["prior"]["rate_sq_sum"], whole["prior"]["rate_sq_sum"])
+    for role in ["shooter", "goalie"]:
+        pd.testing.assert_frame_equal(
+            state[role].sort_index(), whole[role].sort_index(), check_dtype=False
+        )
+        pd.testing.assert_frame_equal(
+            posterior_table(state, role), posterior_table(whole, role)
+        )
+
+
+def test_shots_without_a_shooter_only_count_for_the_prior():
+    shots_df, local_rate = random_shots()
+    state = update_state(new_state(), shots_df, local_rate)
+    assert -1 not in state["shooter"].index
+    assert state["shooter"]["shots"].sum() == (shots_df["shooter_id"] >= 0).sum()
+    assert state["goalie"]["shots"].sum() == len(shots_df)
+    assert np.isclose(prior_parameters(state)["mean"], local_rate.mean())
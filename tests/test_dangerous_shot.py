@@ -0,0 +1,73 @@
+import pandas as pd
+
+from dangerous_shot import merge_shots_strength, strength_state
+
+
+def test_strength_state_labels():
+    cases = [
+        ((5, 5, 0, 0), "ev5"),
+        ((4, 4, 0, 0), "ev4"),
+        ((3, 3, 0, 0), "ev3"),
+        ((5, 4, 0, 0), "pp4"),
+        ((5, 3, 0, 0), "pp3"),
+        ((4, 3, 0, 0), "pp43"),
+        ((4, 5, 0, 0), "sh4"),
+        ((3, 5, 0, 0), "sh3"),
+        ((3, 4, 0, 0), "sh34"),
+        ((6, 5, 1, 0), "en5"),
+        ((6, 4, 1, 0), "en4"),
+        ((5, 6, 0, 1), "open"),
+        ((-1, 5, 0, 0), "unk"),
+        ((5, -1, 0, 1), "unk"),
+    ]
+    labels = strength_state(*zip(*(args for args, _ in cases)))
+    assert labels.tolist() == [label for _, label in cases]
+
+
+def live_shots():
+    return pd.DataFrame(
+        {
+            "gameId": ["2021020001"] * 4,
+            "playId": [3, 7, 9, 12],
+            "event": ["Shot", "Goal", "Missed Shot", "Blocked Shot"],
+            "timestamp": [100, 250, 400, 900],
+            "side": ["home", "away", "home", "away"],
+            "shooter_id": [1, 2, 3, 4],
+            "goalie_id": [20, 10, 20, 10],
+            "shot_x": [60.0, -70.0, 50.0, -30.0],
+            "shot_y": [5.0, 2.0, -10.0, 0.0],
+        }
+    )
+
+
+def pbp_rows():
+    return pd.DataFrame(
+        {
+            "event": ["FAC", "SHOT", "GOAL", "MISS", "SHOT", "BLOCK"],
+            "timestamp": [99, 101, 250, 401, 400, 950],
+            "playId": [1, 2, 3, 4, 5, 6],
+            "away_on_ice": ["3_2_1", "3_2_1", "4_2_0", "2_2_1", "3_2_1", "3_2_1"],
+            "home_on_ice": ["3_2_1", "3_2_1", "3_2_1", "3_2_1", "3_2_1", "3_2_1"],
+            "away_pulled_goalie": ["0", "0", "1", "0", "0", "0"],
+            "home_pulled_goalie": ["0", "0", "0", "0", "0", "0"],
+        }
+    )
+
+
+def test_merge_matches_same_event_within_tolerance():
+    merged = merge_shots_strength(live_shots(), pbp_rows())
+
+    # the miss skips the shot at the same second, the blocked shot is 50 seconds away and dropped
+    assert merged["playId"].tolist() == [3, 7, 9]
+    assert merged["is_goal"].tolist() == [0, 1, 0]
+    # the away goal came with their goalie pulled, the miss while the away team was short handed
+    assert merged["strength"].tolist() == ["ev5", "en5", "pp4"]
+    assert merged["off_skaters"].tolist() == [5, 6, 5]
+    assert merged["def_skaters"].tolist() == [5, 5, 4]
+    assert merged["off_goalie_pulled"].tolist() == [0, 1, 0]
+
+
+def test_merge_wider_tolerance_keeps_far_rows():
+    merged = merge_shots_strength(live_shots(), pbp_rows(), tolerance=60)
+    assert merged["playId"].tolist() == [3, 7, 9, 12]
+    assert merged["strength"].iloc[-1] == "ev5"
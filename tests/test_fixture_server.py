@@ -0,0 +1,42 @@
+import json
+
+import pytest
+
+import fixture_server
+import nhl_requests
+from fixture_server import (
+    fixture_filename,
+    start_fixture_server,
+    use_fixture_server,
+)
+from nhl_requests import nhl_live_feed_request
+
+
+@pytest.fixture
+def corpus_folder(tmp_path, monkeypatch):
+    monkeypatch.setattr(fixture_server, "fixtures_folder", lambda: str(tmp_path))
+    for base in nhl_requests.default_base_urls:
+        monkeypatch.setitem(nhl_requests.base_urls, base, nhl_requests.base_urls[base])
+        monkeypatch.setenv(f"NHL_{base.upper()}_URL", nhl_requests.base_urls[base])
+    return tmp_path / "test"
+
+
+def test_missing_game_is_none_like_the_real_api(corpus_folder):
+    filename = fixture_filename(
+        str(corpus_folder), "statsapi", "/game/2021020001/feed/live"
+    )
+    (corpus_folder / "statsapi").mkdir(parents=True)
+    with open(filename, "w") as wf:
+        json.dump({"gameData": {"game": {"pk": 2021020001}}}, wf)
+
+    server = start_fixture_server(corpus="test")
+    try:
+        use_fixture_server(server)
+        assert nhl_live_feed_request("2021020001")["gameData"]["game"]["pk"] == (
+            2021020001
+        )
+        assert nhl_live_feed_request("2021020999") is None
+    finally:
+        server.shutdown()
+    assert server.stats["served"] == 1
+    assert server.stats["missing"] == 1
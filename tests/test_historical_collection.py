@@ -0,0 +1,20 @@
+import json
+
+import pandas as pd
+
+from dangerous_shot import parse_nhl_live_shots
+from historical_collection import game_documents, parse_game_document
+from nhl_requests import parse_nhl_live_feed
+from test_shot_danger import live_feed
+
+
+def test_live_document_gives_both_views():
+    outputs = parse_game_document("2021020001", "live_data", json.dumps(live_feed()))
+    assert [document for _, document, _ in outputs] == ["live_data", "live_shots"]
+    assert {document for _, document, _ in outputs} <= set(game_documents)
+
+    views = {document: df for _, document, df in outputs}
+    pd.testing.assert_frame_equal(views["live_data"], parse_nhl_live_feed(live_feed()))
+    pd.testing.assert_frame_equal(
+        views["live_shots"], pd.DataFrame(parse_nhl_live_shots(live_feed()))
+    )
@@ -0,0 +1,75 @@
+import numpy as np
+
+import hyperparameter_search
+from hyperparameter_search import data_fingerprint, search
+from train import save_matrix
+
+
+def season_meta(games, stamps):
+    return {"columns": ["a", "b"], "games": games, "stamps": stamps}
+
+
+def test_data_fingerprint_follows_games_and_stamps():
+    meta = season_meta(["2021020001"], {"2021020001": [1, 10]})
+    assert data_fingerprint([meta]) == data_fingerprint([dict(meta)])
+    assert data_fingerprint([meta]) != data_fingerprint(
+        [season_meta(["2021020001"], {"2021020001": [2, 10]})]
+    )
+    assert data_fingerprint([meta]) != data_fingerprint(
+        [season_meta(["2021020001", "2021020002"], meta["stamps"])]
+    )
+
+
+def test_trials_on_recached_data_are_run_again(tmp_path, monkeypatch):
+    matrix_folder = str(tmp_path / "features")
+    collected = {"games": 6}
+
+    def cache_season_matrix(season_year):
+        games = [f"20210200{i:02}" for i in range(1, collected["games"] + 1)]
+        rng = np.random.RandomState(len(games))
+        groups = np.repeat(np.arange(len(games)), 20)
+        meta = season_meta(games, {g: [1, 1] for g in games})
+        save_matrix(
+            matrix_folder,
+            rng.rand(len(groups), 2),
+            rng.choice([-1, 1], len(groups)),
+            groups,
+            meta,
+        )
+        return meta
+
+    monkeypatch.setattr(
+        hyperparameter_search, "cache_season_matrix", cache_season_matrix
+    )
+    monkeypatch.setattr(
+        hyperparameter_search, "feature_matrix_folder", lambda _: matrix_folder
+    )
+    monkeypatch.setattr(
+        hyperparameter_search, "search_folder", lambda: str(tmp_path / "search")
+    )
+    monkeypatch.setattr(
+        hyperparameter_search,
+        "param_grid",
+        {
+            "n_estimators": [5],
+            "max_depth": [2],
+            "min_samples_leaf": [1],
+            "max_features": [1],
+        },
+    )
+    monkeypatch.setattr(
+        hyperparameter_search, "feature_subsets", {"all": {"exclude": []}}
+    )
+
+    first = search("test", ["20212022"], n_splits=2, max_workers=1)
+    assert len(first) == 1
+    # the same games again resume the finished trial
+    assert search("test", ["20212022"], n_splits=2, max_workers=1) == first
+    assert len(hyperparameter_search.load_trials("test")) == 1
+
+    # a game collected since, the trial runs again and only the new one is ranked
+    collected["games"] = 7
+    second = search("test", ["20212022"], n_splits=2, max_workers=1)
+    assert len(second) == 1
+    assert second[0]["trial_id"] != first[0]["trial_id"]
+    assert len(hyperparameter_search.load_trials("test")) == 2
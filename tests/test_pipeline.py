@@ -0,0 +1,107 @@
+import threading
+
+import pytest
+
+from pipeline import pipeline_stage, run_pipeline
+
+
+def square(x):
+    # module level so a process stage can pickle it
+    return [(x, x * x)]
+
+
+def test_outputs_flow_through_the_stages():
+    collected = []
+    lock = threading.Lock()
+
+    def split(x):
+        yield (x,)
+        yield (x + 100,)
+
+    def collect(x, y):
+        with lock:
+            collected.append((x, y))
+
+    report = run_pipeline(
+        [(i,) for i in range(20)],
+        [
+            pipeline_stage("split", split, workers=2),
+            pipeline_stage("square", square, workers=3),
+            pipeline_stage("collect", collect),
+        ],
+        queue_size=2,
+    )
+
+    expected = [(x, x * x) for i in range(20) for x in [i, i + 100]]
+    assert sorted(collected) == sorted(expected)
+    assert report["stages"]["split"]["items"] == 20
+    assert report["stages"]["split"]["outputs"] == 40
+    assert report["stages"]["square"]["workers"] == 3
+    assert report["stages"]["collect"]["outputs"] == 0
+    for stage_report in report["stages"].values():
+        assert set(stage_report) == {
+            "workers",
+            "items",
+            "outputs",
+            "busy",
+            "starved",
+            "blocked",
+            "utilization",
+        }
+        assert 0 <= stage_report["utilization"] <= 1
+
+
+def test_process_stage():
+    collected = []
+    run_pipeline(
+        [(i,) for i in range(6)],
+        [
+            pipeline_stage("square", square, workers=2, processes=True),
+            pipeline_stage("collect", lambda x, y: collected.append(y)),
+        ],
+    )
+    assert sorted(collected) == [0, 1, 4, 9, 16, 25]
+
+
+def test_stops_on_the_first_error():
+    started = []
+    collected = []
+
+    def fail_on_three(x):
+        started.append(x)
+        if x == 3:
+            raise ValueError(x)
+        return [(x,)]
+
+    with pytest.raises(ValueError) as error:
+        run_pipeline(
+            [(i,) for i in range(1000)],
+            [
+                pipeline_stage("fail", fail_on_three),
+                pipeline_stage("collect", collected.append),
+            ],
+            queue_size=1,
+        )
+
+    assert error.value.args == (3,)
+    # only the items already queued run after the failure, and their outputs are kept
+    assert len(started) < 10
+    assert collected == [x for x in started if x != 3]
+
+
+def test_generator_error_drops_the_rest_of_the_item():
+    collected = []
+
+    def partial(x):
+        yield (x,)
+        raise RuntimeError(x)
+
+    with pytest.raises(RuntimeError):
+        run_pipeline(
+            [(0,)],
+            [
+                pipeline_stage("partial", partial),
+                pipeline_stage("collect", collected.append),
+            ],
+        )
+    assert collected == [0]
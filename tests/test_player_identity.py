@@ -0,0 +1,107 @@
+import json
+import os
+
+import player_identity
+from player_identity import (
+    empty_identity_index,
+    load_review_queue,
+    normalize_name,
+    resolve_player,
+    roster_key,
+)
+
+players = {
+    8478402: ("Connor McDavid", 97),
+    8477934: ("Leon Draisaitl", 29),
+    8476454: ("Ryan Nugent-Hopkins", 93),
+    8477021: ("Alexander Kerfoot", 15),
+    8475786: ("Zach Hyman", 18),
+}
+
+
+def identity_index():
+    index = empty_identity_index()
+    roster = {"names": {}, "numbers": {}}
+    for player_id, (full_name, number) in players.items():
+        index["players"][str(player_id)] = full_name
+        roster["names"][normalize_name(full_name)] = player_id
+        roster["numbers"].setdefault(str(number), []).append(player_id)
+    index["rosters"][roster_key(22, "20212022")] = roster
+    index["aliases"]["cj smith"] = 8480000
+    return index
+
+
+def test_normalize_name():
+    assert normalize_name("Montréal") == "montreal"
+    assert normalize_name("MONTREAL") == "montreal"
+    assert normalize_name("O'Reilly") == "oreilly"
+    assert normalize_name("Pierre-Luc  Dubois") == "pierre luc dubois"
+    assert normalize_name("T.J. Brodie") == "t j brodie"
+
+
+def test_resolve_player_match_order():
+    index = identity_index()
+
+    def resolve(first_name, last_name, number=None):
+        player_id, match, _ = resolve_player(
+            index, 22, "20212022", first_name, last_name, number
+        )
+        return player_id, match
+
+    assert resolve("CONNOR", "MCDAVID") == (8478402, "exact")
+    assert resolve("CJ", "Smith") == (8480000, "reviewed")
+    assert resolve("Alex", "Kerfoot") == (8477021, "alias")
+    assert resolve("R", "NUGENT-HOPKINS", 93) == (8476454, "number")
+    assert resolve("Leon", "Draisaitel") == (8477934, "fuzzy")
+    # the number belongs to a player with another last name
+    assert resolve("Zach", "Jones", 18) == (None, None)
+    assert resolve("John", "Smith", 99) == (None, None)
+
+
+def test_unresolved_names_list_the_closest_candidates():
+    _, _, candidates = resolve_player(
+        identity_index(), 22, "20212022", "Leon", "Draisait"
+    )
+    assert len(candidates) == 3
+    assert candidates[0][1:] == ("leon draisaitl", 8477934)
+    assert candidates[0][0] >= candidates[1][0] >= candidates[2][0]
+
+
+def test_review_queue_prefers_reviewed_lines(tmp_path, monkeypatch):
+    monkeypatch.setattr(player_identity, "identity_folder", lambda: str(tmp_path))
+    entries = [
+        {"name": "CJ SMITH", "team_id": 22, "season": "20212022", "player_id": None},
+        {"name": "CJ SMITH", "team_id": 22, "season": "20212022", "player_id": 1},
+        {"name": "CJ SMITH", "team_id": 22, "season": "20212022", "player_id": None},
+        {"name": "CJ SMITH", "team_id": 23, "season": "20212022", "player_id": None},
+    ]
+    with open(tmp_path / "identity_review.jsonl", "w") as wf:
+        wf.write("".join(json.dumps(entry) + "\n" for entry in entries) + "\n")
+
+    queue = load_review_queue()
+    assert len(queue) == 2
+    assert {(entry["team_id"], entry["player_id"]) for entry in queue} == {
+        (22, 1),
+        (23, None),
+    }
+
+
+def test_missing_review_queue(tmp_path, monkeypatch):
+    monkeypatch.setattr(player_identity, "identity_folder", lambda: str(tmp_path))
+    assert load_review_queue() == []
+
+
+def test_set_identity_folder(tmp_path, monkeypatch):
+    monkeypatch.setattr(
+        player_identity, "_identity_folder", player_identity._identity_folder
+    )
+    monkeypatch.setattr(player_identity, "_identity_index", identity_index())
+    monkeypatch.setenv("NHL_IDENTITY_FOLDER", "")
+    player_identity.set_identity_folder(str(tmp_path))
+
+    assert player_identity.identity_index_filename() == str(
+        tmp_path / "identity_index.json"
+    )
+    assert os.environ["NHL_IDENTITY_FOLDER"] == str(tmp_path)
+    # nothing saved in the new folder yet, so the cached index of the old one is not used
+    assert player_identity.load_identity_index() == empty_identity_index()
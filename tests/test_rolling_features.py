@@ -0,0 +1,73 @@
+import numpy as np
+import pandas as pd
+
+from rolling_features import rolling_form_features
+
+
+def naive_form_features(game_logs_df, columns, window):
+    # the previous `window` games of the player-season sliced one row at a time
+    rows = {}
+    for _, logs in game_logs_df.groupby(["player_id", "season"]):
+        logs = logs.sort_values("date", kind="stable")
+        for position, index in enumerate(logs.index):
+            previous = logs.iloc[max(position - window, 0) : position]
+            t = np.arange(position - len(previous), position, dtype=np.float64)
+            row = {}
+            for col in columns:
+                values = previous[col].to_numpy(dtype=np.float64)
+                row[f"{col}_sum_{window}"] = values.sum()
+                row[f"{col}_mean_{window}"] = values.sum() / window
+                row[f"{col}_slope_{window}"] = (
+                    np.polyfit(t, values, 1)[0] if len(values) >= 2 else 0.0
+                )
+            rows[index] = row
+    return pd.DataFrame.from_dict(rows, orient="index").reindex(game_logs_df.index)
+
+
+def random_game_logs(seed=0, num_rows=300):
+    rng = np.random.RandomState(seed)
+    return pd.DataFrame(
+        {
+            "player_id": rng.randint(0, 8, num_rows),
+            "season": rng.choice(["20202021", "20212022"], num_rows),
+            "date": pd.Timestamp("2021-01-01")
+            + pd.to_timedelta(rng.permutation(num_rows), unit="D"),
+            "goals": rng.randint(0, 3, num_rows),
+            "shots": rng.randint(0, 9, num_rows),
+            "toi": rng.randint(300, 1500, num_rows),
+        }
+    ).sample(frac=1, random_state=seed)
+
+
+def test_matches_sliced_windows():
+    game_logs_df = random_game_logs()
+    for window in [1, 2, 4, 10]:
+        features = rolling_form_features(
+            game_logs_df, ["goals", "shots", "toi"], windows=(window,)
+        )
+        expected = naive_form_features(game_logs_df, ["goals", "shots", "toi"], window)
+        pd.testing.assert_frame_equal(
+            features[expected.columns], expected, check_exact=False, atol=1e-8
+        )
+
+
+def test_aligned_with_input_index():
+    game_logs_df = random_game_logs(seed=1, num_rows=50)
+    features = rolling_form_features(game_logs_df, ["goals"], windows=(4,))
+    assert features.index.equals(game_logs_df.index)
+
+
+def test_first_game_of_a_season_has_no_form():
+    game_logs_df = pd.DataFrame(
+        {
+            "player_id": [1, 1, 1, 1],
+            "season": ["20202021", "20202021", "20212022", "20212022"],
+            "date": pd.to_datetime(
+                ["2021-01-01", "2021-01-03", "2021-10-12", "2021-10-14"]
+            ),
+            "goals": [2, 1, 3, 0],
+        }
+    )
+    features = rolling_form_features(game_logs_df, ["goals"], windows=(4,))
+    assert features["goals_sum_4"].tolist() == [0, 2, 0, 3]
+    assert features["goals_slope_4"].tolist() == [0, 0, 0, 0]
@@ -0,0 +1,77 @@
+import schedule_sync
+from schedule_sync import games_to_ingest, mark_ingested, sync_start_date
+
+
+def game(game_date, state, game_type="R", ingested=False, start_time="T00:00:00Z"):
+    return {
+        "gameType": game_type,
+        "gameDate": f"{game_date}{start_time}",
+        "date": game_date,
+        "status": {"abstractGameState": state, "detailedState": state},
+        "ingested": ingested,
+    }
+
+
+def test_sync_start_date_without_a_schedule():
+    assert sync_start_date(None) is None
+    assert sync_start_date({"games": {}}) is None
+
+
+def test_sync_start_date_from_the_earliest_open_game():
+    schedule = {
+        "games": {
+            "1": game("2021-10-12", "Final"),
+            "2": game("2021-10-14", "Live"),
+            "3": game("2021-10-13", "Preview"),
+            "4": game("2021-10-20", "Preview"),
+        }
+    }
+    assert sync_start_date(schedule) == "2021-10-13"
+
+
+def test_sync_start_date_after_the_last_game():
+    schedule = {
+        "games": {
+            "1": game("2022-04-29", "Final"),
+            "2": game("2022-06-30", "Final"),
+        }
+    }
+    assert sync_start_date(schedule) == "2022-07-01"
+
+
+def test_games_to_ingest():
+    schedule = {
+        "games": {
+            "2021020003": game("2021-10-13", "Final", start_time="T23:00:00Z"),
+            "2021020002": game("2021-10-13", "Final", start_time="T23:00:00Z"),
+            "2021020001": game("2021-10-13", "Final", start_time="T01:00:00Z"),
+            "2021010001": game("2021-09-25", "Final", game_type="PR"),
+            "2021020004": game("2021-10-12", "Final", ingested=True),
+            "2021020005": game("2021-10-14", "Preview"),
+            "2021030111": game("2022-05-02", "Final", game_type="P"),
+        }
+    }
+    assert [game_id for game_id, _ in games_to_ingest(schedule)] == [
+        "2021020001",
+        "2021020002",
+        "2021020003",
+        "2021030111",
+    ]
+    assert [game_id for game_id, _ in games_to_ingest(schedule, ("P",))] == [
+        "2021030111"
+    ]
+
+
+def test_mark_ingested_saves_once(tmp_path, monkeypatch):
+    filename = tmp_path / "schedule.json"
+    monkeypatch.setattr(schedule_sync, "schedule_filename", lambda _: str(filename))
+    schedule = {
+        "games": {
+            "2021020001": game("2021-10-13", "Final"),
+            "2021020002": game("2021-10-13", "Final"),
+        }
+    }
+    mark_ingested("20212022", schedule, [2021020001, "2021020002"])
+    assert games_to_ingest(schedule) == []
+    assert games_to_ingest(schedule_sync.load_schedule("20212022")) == []
+    assert [path.name for path in tmp_path.iterdir()] == ["schedule.json"]
@@ -0,0 +1,133 @@
+import numpy as np
+import pandas as pd
+from bs4 import BeautifulSoup
+
+import player_identity
+from nhl_requests import parse_nhl_shifts, shift_timestamps
+from player_identity import empty_identity_index, roster_key
+
+
+def row_by_row(line_info):
+    # the per row conversion parse_nhl_shifts did before shift_timestamps, line_info[2:7] are the shift cells
+    period = 4 if line_info[2] == "OT" else int(line_info[2])
+
+    def clock(text):
+        return 60 * int(text.split(":")[0]) + int(text.split(":")[1])
+
+    start_elapsed = 20 * 3 * 60 - (
+        20 * 60 * (period - 1) + clock(line_info[3].split("/")[0].strip())
+    )
+    start_left = 20 * (3 - period) * 60 + clock(line_info[3].split("/")[1].strip())
+    end_elapsed = 20 * 3 * 60 - (
+        20 * 60 * (period - 1) + clock(line_info[4].split("/")[0].strip())
+    )
+    end_left = 20 * (3 - period) * 60 + clock(line_info[4].split("/")[1].strip())
+    shift_length = clock(line_info[5])
+
+    if start_elapsed - end_elapsed == shift_length:
+        start, end = start_elapsed, end_elapsed
+    elif start_left - end_left == shift_length:
+        start, end = start_left, end_left
+    elif (
+        start_left - end_left == start_elapsed - end_elapsed
+        and start_left == start_elapsed
+    ):
+        start, end = start_left, end_left
+        shift_length = start_left - end_left
+    else:
+        start, end, shift_length = 0, 0, 0
+
+    event = line_info[6] if not line_info[6] == "\xa0" else "0"
+    return start, end, shift_length, event
+
+
+def mmss(seconds):
+    return f"{seconds // 60}:{seconds % 60:02}"
+
+
+def random_shift_cells(seed=0, num_shifts=500):
+    # mostly consistent rows, and rows where the elapsed clock, the clock left or the duration is off
+    rng = np.random.RandomState(seed)
+    cells = []
+    for _ in range(num_shifts):
+        period = rng.choice(["1", "2", "3", "OT"])
+        period_length = 300 if period == "OT" else 1200
+        start = rng.randint(0, period_length - 120)
+        end = start + rng.randint(1, 120)
+        start_left, end_left = period_length - start, period_length - end
+        duration = end - start
+        error = rng.randint(0, 5)
+        if error == 1:
+            start += rng.randint(1, 30)
+        elif error == 2:
+            start_left += rng.randint(1, 30)
+        elif error == 3:
+            duration += rng.randint(1, 30)
+        elif error == 4:
+            start += 7
+            end_left -= 3
+        cells.append(
+            [
+                period,
+                f"{mmss(start)} / {mmss(start_left)}",
+                f"{mmss(end)} / {mmss(end_left)}",
+                f"{duration // 60:02}:{duration % 60:02}",
+                rng.choice(["\xa0", "G", "P", "PG"]),
+            ]
+        )
+    return cells
+
+
+def test_shift_timestamps_match_row_by_row():
+    cells = random_shift_cells()
+    expected = pd.DataFrame(
+        [row_by_row(["", ""] + row) for row in cells],
+        columns=["start_shift", "end_shift", "shift_length", "event"],
+    )
+    pd.testing.assert_frame_equal(shift_timestamps(cells), expected)
+
+
+def shift_report(team_name, players):
+    rows = []
+    for heading, shifts in players:
+        rows.append(f'<tr><td class="playerHeading + border">{heading}</td></tr>')
+        rows.append('<tr class="heading"><td>Shift #</td><td>Per</td></tr>')
+        for i, cells in enumerate(shifts):
+            color = "oddColor" if i % 2 == 0 else "evenColor"
+            tds = "".join(f"\n<td>{cell}</td>" for cell in [i + 1] + cells)
+            rows.append(f'<tr class="{color}">{tds}\n</tr>')
+        rows.append("<tr><td>Totals</td></tr>")
+    return BeautifulSoup(
+        f'<html><body><table><tr><td class="teamHeading + border">{team_name}</td></tr>'
+        f'{"".join(rows)}</table></body></html>',
+        "html.parser",
+    )
+
+
+def test_parse_shifts_matches_row_by_row(tmp_path, monkeypatch):
+    index = empty_identity_index()
+    index["teams"]["st louis blues"] = 19
+    index["players"]["8476422"] = "Ryan O'Reilly"
+    index["rosters"][roster_key(19, "20212022")] = {
+        "names": {"ryan oreilly": 8476422},
+        "numbers": {"90": [8476422]},
+    }
+    index["seasons"] = ["20212022"]
+    monkeypatch.setattr(player_identity, "_identity_index", index)
+    monkeypatch.setattr(player_identity, "_queued_names", set())
+    monkeypatch.setattr(player_identity, "identity_folder", lambda: str(tmp_path))
+
+    cells = random_shift_cells(seed=1, num_shifts=30)
+    soup = shift_report(
+        "ST. LOUIS BLUES",
+        [("90 O'REILLY, RYAN", cells[:20]), ("11 UNKNOWN, SKATER", cells[20:])],
+    )
+    df = parse_nhl_shifts(soup, 2021020001)
+
+    expected = pd.DataFrame(
+        [row_by_row(["", ""] + row) for row in cells],
+        columns=["start_shift", "end_shift", "shift_length", "event"],
+    )
+    expected.insert(0, "playerId", [8476422] * 20 + ["skater.unknown"] * 10)
+    expected.insert(0, "gameId", 2021020001)
+    pd.testing.assert_frame_equal(df, expected)
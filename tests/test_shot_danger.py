@@ -0,0 +1,130 @@
+import numpy as np
+import pandas as pd
+
+from dangerous_shot import parse_nhl_live_shots
+from nhl_requests import parse_nhl_live_feed
+from shot_danger import (
+    build_shot_index,
+    indexed_shots,
+    normalize_shot_coordinates,
+    radius_goal_rate,
+    shot_danger_scorer,
+)
+
+
+def random_shots(seed=0, num_shots=600):
+    rng = np.random.RandomState(seed)
+    shots_df = pd.DataFrame(
+        {
+            "event": rng.choice(
+                ["Shot", "Missed Shot", "Goal", "Blocked Shot"], num_shots
+            ),
+            "shot_x": rng.randint(-99, 100, num_shots).astype(np.float64),
+            "shot_y": rng.randint(-42, 43, num_shots).astype(np.float64),
+            "strength": rng.choice(["ev5", "ev5", "pp4", "sh4"], num_shots),
+        }
+    )
+    shots_df["is_goal"] = (shots_df["event"] == "Goal").astype(np.int8)
+    shots_df.loc[rng.rand(num_shots) < 0.05, "shot_x"] = np.nan
+    return shots_df
+
+
+def test_indexed_shots_leave_out_blocked_and_missing_coordinates():
+    shots_df = random_shots()
+    indexed = indexed_shots(shots_df)
+    assert (shots_df.loc[indexed, "event"] != "Blocked Shot").all()
+    assert shots_df.loc[indexed, "shot_x"].notna().all()
+    assert (~indexed).sum() == (
+        (shots_df["event"] == "Blocked Shot") | shots_df["shot_x"].isna()
+    ).sum()
+
+
+def live_feed_play(event, play_id, team, coordinates, players=()):
+    return {
+        "result": {"event": event},
+        "about": {"eventIdx": play_id, "period": 1, "periodTime": f"00:{play_id:02}"},
+        "team": {"triCode": team},
+        "coordinates": coordinates,
+        "players": [
+            {"playerType": player_type, "player": {"id": player_id}}
+            for player_type, player_id in players
+        ],
+    }
+
+
+def live_feed():
+    shooter = [("Shooter", 8478402), ("Goalie", 8475683)]
+    plays = [
+        live_feed_play("Shot", 1, "EDM", {"x": 70.0, "y": 5.0}, shooter),
+        live_feed_play("Shot", 2, "EDM", {}, shooter),
+        live_feed_play("Missed Shot", 3, "VAN", {"x": -60.0}, shooter),
+        live_feed_play("Goal", 4, "EDM", {"x": 80.0, "y": -2.0}, shooter),
+        live_feed_play("Game End", 5, "EDM", {}),
+    ]
+    return {
+        "gameData": {
+            "game": {"pk": 2021020001},
+            "teams": {"away": {"triCode": "VAN"}, "home": {"triCode": "EDM"}},
+        },
+        "liveData": {
+            "plays": {"allPlays": plays},
+            "linescore": {"teams": {"home": {"goals": 1}, "away": {"goals": 0}}},
+        },
+    }
+
+
+def test_shots_without_coordinates_from_the_live_feed_are_not_indexed():
+    shots_df = pd.DataFrame(parse_nhl_live_shots(live_feed()))
+    shots_df["strength"] = "ev5"
+    shots_df["is_goal"] = (shots_df["event"] == "Goal").astype(np.int8)
+
+    assert shots_df["shot_x"].isna().tolist() == [False, True, False, False]
+    assert shots_df["shot_y"].isna().tolist() == [False, True, True, False]
+    assert indexed_shots(shots_df).tolist() == [True, False, False, True]
+    assert build_shot_index(shots_df, min_shots=1)["ev5"]["shots"].sum() == 2
+
+    # the play by play view keeps the gap too, and the scorer still answers those shots
+    live_df = parse_nhl_live_feed(live_feed())
+    assert live_df["shot_x"].isna().tolist() == [False, True, False, False, False]
+    rate = shot_danger_scorer(build_shot_index(shots_df, min_shots=1))(shots_df)
+    assert np.isfinite(rate).all()
+
+
+def test_index_ignores_blocked_and_missing_coordinates():
+    shots_df = random_shots()
+    shot_index = build_shot_index(shots_df, min_shots=100)
+    clean_index = build_shot_index(shots_df.loc[indexed_shots(shots_df)], 100)
+    assert set(shot_index) == set(clean_index)
+    for strength in shot_index:
+        assert (shot_index[strength]["shots"] == clean_index[strength]["shots"]).all()
+        assert (shot_index[strength]["goals"] == clean_index[strength]["goals"]).all()
+
+
+def test_radius_rate_matches_brute_force():
+    shots_df = random_shots(seed=1)
+    radius = 10.0
+    shot_index = build_shot_index(shots_df, min_shots=200)
+    queried = shots_df.loc[shots_df["shot_x"].notna()].reset_index(drop=True)
+    indexed = indexed_shots(queried)
+
+    shots, goals, rate = radius_goal_rate(
+        shot_index,
+        queried["shot_x"],
+        queried["shot_y"],
+        queried["strength"],
+        radius=radius,
+        is_goal=queried["is_goal"],
+        indexed=indexed,
+    )
+
+    xy = np.rint(normalize_shot_coordinates(queried["shot_x"], queried["shot_y"]))
+    strengths = queried["strength"].to_numpy()
+    is_goal = queried["is_goal"].to_numpy()
+    for i in range(len(queried)):
+        near = indexed & (((xy - xy[i]) ** 2).sum(axis=1) <= radius**2)
+        if strengths[i] in shot_index:
+            near &= strengths == strengths[i]
+        near[i] = False
+        assert shots[i] == near.sum()
+        assert goals[i] == is_goal[near].sum()
+        assert np.isclose(rate[i], goals[i] / shots[i] if shots[i] else 0.0)
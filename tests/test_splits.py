@@ -0,0 +1,73 @@
+import os
+
+import pytest
+
+import game_index
+import splits
+from game_index import update_game_index
+from splits import make_split
+
+
+@pytest.fixture
+def data_folder(tmp_path, monkeypatch):
+    monkeypatch.setattr(
+        game_index,
+        "game_index_filename",
+        lambda season_year: str(tmp_path / "data" / season_year / "game_index.json"),
+    )
+    monkeypatch.setattr(splits, "game_index_filename", game_index.game_index_filename)
+    monkeypatch.setattr(splits, "splits_folder", lambda: str(tmp_path / "splits"))
+    return tmp_path
+
+
+def index_games(season_year, game_ids, game_type="R"):
+    update_game_index(
+        season_year,
+        {
+            game_id: {
+                "game_type": game_type,
+                "date": None,
+                "home_team": "Edmonton Oilers",
+                "away_team": "Vancouver Canucks",
+            }
+            for game_id in game_ids
+        },
+    )
+
+
+def test_split_is_rebuilt_when_games_are_indexed(data_folder):
+    index_games("20212022", [f"20210200{i:02}" for i in range(1, 6)])
+    train_games, val_games = make_split("random", ["20212022"], train_ratio=0.6)
+    assert len(train_games) == 3 and len(val_games) == 2
+    assert make_split("random", ["20212022"], train_ratio=0.6) == (
+        train_games,
+        val_games,
+    )
+
+    index_games("20212022", [f"20210200{i:02}" for i in range(6, 11)])
+    train_games, val_games = make_split("random", ["20212022"], train_ratio=0.6)
+    assert len(train_games) == 6 and len(val_games) == 4
+
+
+def test_empty_split_is_not_saved(data_folder):
+    with pytest.raises(AssertionError, match="No games selected"):
+        make_split("random", ["20212022"], train_ratio=0.6)
+    assert not os.path.exists(data_folder / "splits" / "random.json")
+
+
+def test_missing_game_index_is_built(data_folder, monkeypatch):
+    os.makedirs(data_folder / "data" / "20212022")
+    built = []
+
+    def build_game_index(season_year):
+        built.append(season_year)
+        index_games(season_year, ["2021020001"])
+
+    monkeypatch.setattr(splits, "build_game_index", build_game_index)
+    assert make_split("random", ["20212022"], train_ratio=1.0) == (
+        [("20212022", "2021020001")],
+        [],
+    )
+    assert built == ["20212022"]
+    make_split("random", ["20212022"], train_ratio=1.0)
+    assert built == ["20212022"]
@@ -1,8 +1,14 @@
 import time
 from pathlib import Path
 from sklearn.ensemble import RandomForestClassifier
-from sklearn.metrics import accuracy_score, classification_report
-import csv
+from sklearn.metrics import (
+    accuracy_score,
+    brier_score_loss,
+    classification_report,
+    log_loss,
+)
+from concurrent.futures import ProcessPoolExecutor
+import json
 import os
 import numpy as np
 import glob
@@ -11,6 +17,18 @@ import joblib
 from datetime import datetime
 import matplotlib.pyplot as plt
 
+import instrumentation
+from instrumentation import count, progress, stage, timed
+from splits import make_split, game_folders, select_games
+from feature_schema import (
+    accumulated_data_filename,
+    fitted_columns,
+    has_accumulated_data,
+    model_columns,
+    model_matrix,
+    read_accumulated_data,
+)
+
 
 def load_model(filename: str = None, load_latest: bool = None):
     assert (filename is not None) ^ (load_latest is not None)
@@ -34,30 +52,20 @@ def load_model(filename: str = None, load_latest: bool = None):
     return model
 
 
+@timed("load.accumulated_data")
 def load_data(folders):
+    # columns of every game concatenated, each kept in its feature schema dtype
     update_every = 100
-    accumulated_dict = None
+    game_dfs = []
     for folder_ind, folder in enumerate(folders):
-        with open(os.path.join(folder, "accumulated_data.csv"), "r") as csv_file:
-            csv_reader = csv.reader(csv_file)
-            for line_ind, line in enumerate(csv_reader):
-                if line_ind == 0:
-                    if accumulated_dict is None:
-                        accumulated_dict = {k: [] for k in line}
-                    else:
-                        assert len(line) == len(accumulated_dict.keys())
-                        # reorder_keys = None if all(k1 == k2 for k1, k2 in zip(line, accumulated_dict.keys())) else {k2: k1_ind for (k1_ind, _), k2 in zip(enumerate(line), accumulated_dict.keys())}
-                        continue
-                else:
-                    assert len(accumulated_dict) == len(line)
-                    for k, item in zip(accumulated_dict.keys(), line):
-                        accumulated_dict[k].append(
-                            float(item) if k == "toi_skew_differential" else int(item)
-                        )
+        game_dfs.append(read_accumulated_data(folder))
+        assert list(game_dfs[-1].columns) == list(game_dfs[0].columns)
         if (folder_ind + 1) % update_every == 0:
-            print(f"{datetime.now()} Accumulated {folder_ind + 1} games.")
+            progress(f"Accumulated {folder_ind + 1} games.")
 
-    return accumulated_dict
+    accumulated_df = pd.concat(game_dfs, ignore_index=True)
+    count("rows.load_data", len(accumulated_df.index))
+    return {k: accumulated_df[k].to_numpy() for k in accumulated_df.columns}
 
 
 def validate(v_folders):
@@ -69,23 +77,11 @@ def validate(v_folders):
 
     # predict
     y_true = accumulated_dict["winner"]
-    X = np.vstack(
-        [
-            v
-            for k, v in accumulated_dict.items()
-            if k
-            not in [
-                "winner",
-                "gameId",
-                "playId",
-                "time_remaining",
-            ]
-        ],
-    ).T
+    X = model_matrix(accumulated_dict, fitted_columns(clf, accumulated_dict))
     y_predict = clf.predict(X)
 
     # report scores
-    print(
+    progress(
         classification_report(y_true, y_predict, target_names=["Away win", "Home win"])
     )
 
@@ -117,7 +113,7 @@ def validate(v_folders):
     avg_pred_prob = [sum(ell) / len(ell) for ell in bin_pred_prob]
 
     corr = np.corrcoef(avg_true, avg_pred_prob)
-    print(f"The correlation is {corr[0, 1]:.3f}")
+    progress(f"The correlation is {corr[0, 1]:.3f}")
     theta = np.polyfit(avg_true, avg_pred_prob, 1)
 
     plt.scatter(avg_true, avg_pred_prob, c="b")
@@ -131,36 +127,97 @@ def validate(v_folders):
     pass
 
 
-def train(t_folders):
+def _sample_per_key(keys, max_rows, seed):
+    # keeps at most max_rows random rows of every distinct combination of keys
+    priority = np.random.RandomState(seed).rand(len(keys[0]))
+    order = np.lexsort([priority] + list(keys))
+    new_key = np.ones(len(order), dtype=bool)
+    if len(order):
+        same_key = np.ones(len(order) - 1, dtype=bool)
+        for key in keys:
+            sorted_key = np.asarray(key)[order]
+            same_key &= sorted_key[1:] == sorted_key[:-1]
+        new_key[1:] = ~same_key
+    row = np.arange(len(order))
+    rank = row - np.maximum.accumulate(np.where(new_key, row, 0))
+    return np.sort(order[rank < max_rows])
+
+
+def per_game_sample(X, groups, columns, max_rows=100, seed=645):
+    # at most max_rows plays of every game
+    return _sample_per_key([groups], max_rows, seed)
+
+
+def time_bucket_sample(
+    X, groups, columns, bucket_seconds=120, rows_per_bucket=2, seed=645
+):
+    # at most rows_per_bucket plays of every game in every bucket_seconds of game time, so every part of a game is
+    #  still seen and stoppage heavy stretches do not dominate
+    buckets = np.floor_divide(X[:, columns.index("time_remaining_neg")], bucket_seconds)
+    return _sample_per_key([buckets, groups], rows_per_bucket, seed)
+
+
+def dedupe_sample(X, groups, columns, ignore_columns=()):
+    # drops plays whose features are identical to the previous play of the same game, ignore_columns are left out
+    #  of the comparison (e.g. "time_remaining_neg" to collapse everything between two state changes)
+    compare = [i for i, c in enumerate(columns) if c not in ignore_columns]
+    keep = np.ones(len(groups), dtype=bool)
+    keep[1:] = (groups[1:] != groups[:-1]) | np.any(
+        X[1:, compare] != X[:-1, compare], axis=1
+    )
+    return np.flatnonzero(keep)
+
+
+sampling_methods = {
+    "per_game": per_game_sample,
+    "time_bucket": time_bucket_sample,
+    "dedupe": dedupe_sample,
+}
+
+
+def sample_rows(X, groups, columns, sampling):
+    # sampling is {"method": name, **params} or None to keep every play
+    if sampling is None:
+        return np.arange(len(groups))
+    params = {k: v for k, v in sampling.items() if k != "method"}
+    indices = sampling_methods[sampling["method"]](
+        X, np.asarray(groups), columns, **params
+    )
+    progress(
+        f'Sampling {sampling["method"]} kept {len(indices)} of {len(groups)} rows ({len(indices) / max(len(groups), 1):.1%}).'
+    )
+    return indices
+
+
+def feature_arrays(accumulated_dict, columns=None):
+    # columns default to every registry column that was accumulated
+    if columns is None:
+        columns = model_columns(accumulated_dict)
+    X = model_matrix(accumulated_dict, columns)
+    y = np.asarray(accumulated_dict["winner"])
+    groups = np.asarray(accumulated_dict["gameId"])
+    return X, y, groups, columns
+
+
+def train(t_folders, sampling=None):
 
     # load and transform data appropriately
     accumulated_dict = load_data(t_folders)
+    X, y, groups, columns = feature_arrays(accumulated_dict)
+    if sampling is not None:
+        indices = sample_rows(X, groups, columns, sampling)
+        X, y = X[indices], y[indices]
 
     # train model
     train_start = time.time()
     clf = RandomForestClassifier(random_state=None)
-    y = accumulated_dict["winner"]
-    X = np.vstack(
-        [
-            v
-            for k, v in accumulated_dict.items()
-            # todo investigate further the difference in training between using time_remaining and time_remaining_neg,
-            #  I see some plots do not end at 100% or 0% and I believe because that is because there is data where
-            #  time_remaining=0 (overtime) and the game is still undecided. Would be better if there was a better way to
-            #  represent overtime and still know that it is sudden death.
-            if k
-            not in [
-                "winner",
-                "gameId",
-                "playId",
-                "time_remaining",
-            ]
-        ],
-    ).T
     assert clf is not None
     clf.fit(X, y)
+    # saved with the model so scoring builds its input in the same column order
+    clf.feature_columns = columns
     train_end = time.time()
-    print(f"Training took {train_end - train_start:.2f} seconds.")
+    instrumentation.add_time("fit.train", train_end - train_start)
+    progress(f"Training took {train_end - train_start:.2f} seconds.")
 
     # save model
     if not os.path.isdir("model"):
@@ -175,40 +232,285 @@ def train(t_folders):
     )
 
 
-def train_val_split(train_ratio, season_year):
-    season_year_folder = os.path.join("data", season_year)
-    game_folders = glob.glob(os.path.join(season_year_folder, "*"))
+def sampling_report(t_folders, v_folders, sampling, clf_params=None):
+    # fits on every training play and on the sampled plays, validates both on every validation play
+    X_train, y_train, groups_train, columns = feature_arrays(load_data(t_folders))
+    X_val, y_val, _, _ = feature_arrays(load_data(v_folders), columns)
+    indices = sample_rows(X_train, groups_train, columns, sampling)
+
+    report = {"sampling": sampling, "rows": int(len(y_train))}
+    for name, rows in [("full", slice(None)), ("sampled", indices)]:
+        start = time.time()
+        clf = RandomForestClassifier(random_state=645, **(clf_params or {}))
+        clf.fit(X_train[rows], y_train[rows])
+        end = time.time()
+        y_pred_prob = clf.predict_proba(X_val)[:, list(clf.classes_).index(1)]
+        report[name] = {
+            "log_loss": float(log_loss(y_val == 1, y_pred_prob, labels=[False, True])),
+            "brier": float(brier_score_loss(y_val == 1, y_pred_prob)),
+            "fit_seconds": end - start,
+        }
+    report["sampled_rows"] = int(len(indices))
+    report["reduction"] = 1 - len(indices) / max(len(y_train), 1)
+
+    progress(
+        f'{sampling["method"]}: {report["sampled_rows"]} of {report["rows"]} rows ({report["reduction"]:.1%} fewer), '
+        f'log loss {report["full"]["log_loss"]:.4f} -> {report["sampled"]["log_loss"]:.4f}, '
+        f'brier {report["full"]["brier"]:.4f} -> {report["sampled"]["brier"]:.4f}, '
+        f'fit {report["full"]["fit_seconds"]:.2f} -> {report["sampled"]["fit_seconds"]:.2f} seconds'
+    )
+    return report
 
+
+def train_val_split(train_ratio, season_year):
     # only keep the regular season games
-    game_folders = list(
-        filter(
-            lambda fol: len(glob.glob(os.path.join(fol, "*.txt")))
-            and Path(glob.glob(os.path.join(fol, "*.txt"))[0]).stem[0] == "R",
-            game_folders,
+    train_games, val_games = make_split(
+        f"random-{season_year}-{train_ratio}",
+        [season_year],
+        method="random",
+        selection={"game_types": ["R"]},
+        train_ratio=train_ratio,
+        seed=645,
+    )
+
+    return game_folders(train_games), game_folders(val_games)
+
+
+def feature_matrix_folder(season_year):
+    return os.path.join("data", season_year, "features")
+
+
+def accumulated_file_stamps(games):
+    # gameId -> [modification time, size] of its accumulated data, changes whenever a game is accumulated again
+    stamps = {}
+    for season_year, game_id in games:
+        stat = os.stat(
+            accumulated_data_filename(os.path.join("data", season_year, game_id))
         )
+        stamps[game_id] = [stat.st_mtime_ns, stat.st_size]
+    return stamps
+
+
+def cache_season_matrix(season_year, game_types=("R",)):
+    # model input of every accumulated game of a season saved as .npy so it is read (or memory mapped) instead of
+    #  parsed again, rebuilt when the games of the season or their accumulated data change
+    games = [
+        g
+        for g in select_games([season_year], game_types=game_types)
+        if has_accumulated_data(os.path.join("data", g[0], g[1]))
+    ]
+    stamps = accumulated_file_stamps(games)
+    folder = feature_matrix_folder(season_year)
+    meta_filename = os.path.join(folder, "meta.json")
+    if os.path.isfile(meta_filename):
+        with open(meta_filename, "r") as json_file:
+            meta = json.load(json_file)
+        # a cache written in another column order than the registry is rebuilt too
+        if (
+            meta["games"] == [g[1] for g in games]
+            and meta.get("stamps") == stamps
+            and meta["columns"] == model_columns(meta["columns"])
+        ):
+            return meta
+
+    X, y, groups, columns = feature_arrays(load_data(game_folders(games)))
+
+    meta = {"columns": columns, "games": [g[1] for g in games], "stamps": stamps}
+    save_matrix(folder, X, y, groups, meta)
+    progress(f"Cached {len(y)} rows from {len(games)} games for {season_year}.")
+    return meta
+
+
+def save_matrix(folder, X, y, groups, meta):
+    if not os.path.isdir(folder):
+        os.makedirs(folder)
+    # meta.json is written last, a matrix interrupted half way has none and is rebuilt
+    if os.path.isfile(os.path.join(folder, "meta.json")):
+        os.remove(os.path.join(folder, "meta.json"))
+    np.save(os.path.join(folder, "X.npy"), X)
+    np.save(os.path.join(folder, "y.npy"), y)
+    np.save(os.path.join(folder, "groups.npy"), groups)
+    with open(os.path.join(folder, "meta.json"), "w") as json_file:
+        json.dump(meta, json_file)
+
+
+def load_matrix(folder, mmap_mode="r"):
+    # X, y and gameId groups saved by save_matrix, memory mapped by default
+    with open(os.path.join(folder, "meta.json"), "r") as json_file:
+        meta = json.load(json_file)
+    return (
+        np.load(os.path.join(folder, "X.npy"), mmap_mode=mmap_mode),
+        np.load(os.path.join(folder, "y.npy"), mmap_mode=mmap_mode),
+        np.load(os.path.join(folder, "groups.npy"), mmap_mode=mmap_mode),
+        meta["columns"],
     )
 
-    np.random.seed(645)
-    perm = np.random.permutation(len(game_folders))
-    train_folders = [game_folders[i] for i in perm[: int(len(perm) * train_ratio)]]
-    val_folders = [game_folders[i] for i in perm[int(len(perm) * train_ratio) :]]
 
-    return train_folders, val_folders
+def load_season_matrices(season_years, mmap_mode="r"):
+    # X, y and gameId groups of several seasons stacked, one season is returned memory mapped without a copy
+    Xs, ys, groups = [], [], []
+    columns = None
+    for season_year in season_years:
+        X, season_y, season_groups, season_columns = load_matrix(
+            feature_matrix_folder(season_year), mmap_mode=mmap_mode
+        )
+        assert columns is None or columns == season_columns
+        columns = season_columns
+        Xs.append(X)
+        ys.append(season_y)
+        groups.append(season_groups)
+
+    if len(season_years) == 1:
+        return Xs[0], ys[0], groups[0], columns
+    return np.concatenate(Xs), np.concatenate(ys), np.concatenate(groups), columns
+
+
+def train_seasons(season_years, clf_params=None, sampling=None):
+    # train on any set of seasons from the cached matrices
+    for season_year in season_years:
+        cache_season_matrix(season_year)
+    X, y, groups, columns = load_season_matrices(season_years)
+    if sampling is not None:
+        indices = sample_rows(X, groups, columns, sampling)
+        X, y = X[indices], y[indices]
 
+    train_start = time.time()
+    clf = RandomForestClassifier(**(clf_params or {}))
+    clf.fit(X, y)
+    clf.feature_columns = columns
+    train_end = time.time()
+    instrumentation.add_time("fit.train", train_end - train_start)
+    progress(f"Training took {train_end - train_start:.2f} seconds.")
 
-def main():
-    season_year = "20202021"
-    train_ratio = 0.8
+    if not os.path.isdir("model"):
+        os.makedirs("model")
+    joblib.dump(
+        clf,
+        os.path.join(
+            "model",
+            f"{datetime.now().year}-{datetime.now().month}-{datetime.now().day}-{datetime.now().hour}-{datetime.now().minute}.joblib",
+        ),
+    )
+    return clf
+
+
+def evaluate_fold(train_season_years, val_season_year, clf_params=None):
+    start = time.time()
+    X_train, y_train, _, _ = load_season_matrices(train_season_years)
+    X_val, y_val, _, _ = load_season_matrices([val_season_year])
+
+    clf = RandomForestClassifier(**(clf_params or {}))
+    clf.fit(X_train, y_train)
+    y_pred_prob = clf.predict_proba(X_val)[:, list(clf.classes_).index(1)]
+    end = time.time()
+
+    return {
+        "train_seasons": list(train_season_years),
+        "val_season": val_season_year,
+        "train_rows": int(len(y_train)),
+        "val_rows": int(len(y_val)),
+        "log_loss": float(log_loss(y_val == 1, y_pred_prob, labels=[False, True])),
+        "brier": float(brier_score_loss(y_val == 1, y_pred_prob)),
+        "accuracy": float(accuracy_score(y_val == 1, y_pred_prob > 0.5)),
+        "seconds": end - start,
+    }
+
+
+def rolling_origin_evaluation(
+    season_years, min_train_seasons=1, window=None, clf_params=None, max_workers=None
+):
+    # train through season N and validate on season N + 1 for every N, expanding window unless window is given
+    season_years = sorted(season_years)
+    for season_year in season_years:
+        cache_season_matrix(season_year)
+
+    folds = []
+    for val_ind in range(min_train_seasons, len(season_years)):
+        first_ind = 0 if window is None else max(0, val_ind - window)
+        folds.append((season_years[first_ind:val_ind], season_years[val_ind]))
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        results = list(
+            executor.map(
+                evaluate_fold,
+                [f[0] for f in folds],
+                [f[1] for f in folds],
+                [clf_params] * len(folds),
+            )
+        )
 
-    # determine how training
-    train_folders, val_folders = train_val_split(train_ratio, season_year)
+    for result in results:
+        progress(
+            f'train {"+".join(result["train_seasons"])} ({result["train_rows"]} rows) -> {result["val_season"]}: '
+            f'log loss {result["log_loss"]:.4f} brier {result["brier"]:.4f} accuracy {result["accuracy"]:.3f} '
+            f'in {result["seconds"]:.2f} seconds'
+        )
 
-    # train model
-    # train(train_folders)
+    if not os.path.isdir(os.path.join("model", "evaluations")):
+        os.makedirs(os.path.join("model", "evaluations"))
+    with open(
+        os.path.join(
+            "model",
+            "evaluations",
+            f"rolling-origin-{season_years[0]}-{season_years[-1]}.json",
+        ),
+        "w",
+    ) as json_file:
+        json.dump(results, json_file, indent=1)
+
+    return results
+
+
+def main(args):
+    season_years = [f"{season}{int(season) + 1}" for season in args.seasons]
+    sampling = None if args.sampling is None else {"method": args.sampling}
+
+    if args.rolling_origin:
+        rolling_origin_evaluation(
+            season_years,
+            min_train_seasons=args.min_train_seasons,
+            window=args.window,
+            max_workers=args.workers,
+        )
+    elif len(season_years) > 1:
+        train_seasons(season_years, sampling=sampling)
+    else:
+        train_ratio = 0.8
 
-    # validate model
-    validate(val_folders)
+        # determine how training
+        train_folders, val_folders = train_val_split(train_ratio, season_years[0])
+
+        if args.compare_sampling:
+            sampling_report(
+                train_folders, val_folders, sampling or {"method": "per_game"}
+            )
+            return
+
+        # train model
+        # train(train_folders, sampling=sampling)
+
+        # validate model
+        validate(val_folders)
 
 
 if __name__ == "__main__":
-    main()
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seasons", nargs="+", default=["2020"])
+    parser.add_argument("--rolling-origin", action="store_true")
+    parser.add_argument("--min-train-seasons", type=int, default=1)
+    parser.add_argument("--window", type=int, default=None)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument(
+        "--sampling", choices=list(sampling_methods.keys()), default=None
+    )
+    parser.add_argument("--compare-sampling", action="store_true")
+    instrumentation.add_arguments(parser)
+
+    args = parser.parse_args()
+    instrumentation.setup_from_args(args)
+
+    with stage("train"):
+        main(args)
+    instrumentation.finish(args)
@@ -1,32 +1,28 @@
 import os
+import time
 import joblib
 import glob
 from pathlib import Path
-import csv
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import numpy as np
 import matplotlib.pyplot as plt
 
-# todo visualize single game prediction based on a trained model
+import instrumentation
+from instrumentation import count, progress, stage
+from game_index import get_game_info, load_game_index
+from feature_schema import (
+    fitted_columns,
+    has_accumulated_data,
+    model_matrix,
+    read_accumulated_data,
+)
 
+# todo visualize single game prediction based on a trained model
 
-def load_data(filename):
-    accumulated_dict = None
-    with open(filename, "r") as csv_file:
-        csv_reader = csv.reader(csv_file)
-        for line_ind, line in enumerate(csv_reader):
-            if line_ind == 0:
-                if accumulated_dict is None:
-                    accumulated_dict = {k: [] for k in line}
-                else:
-                    continue
-            else:
-                assert len(accumulated_dict) == len(line)
-                for k, item in zip(accumulated_dict.keys(), line):
-                    accumulated_dict[k].append(
-                        float(item) if k == "toi_skew_differential" else int(item)
-                    )
 
-    return accumulated_dict
+def load_data(game_folder):
+    accumulated_df = read_accumulated_data(game_folder)
+    return {k: accumulated_df[k].to_numpy() for k in accumulated_df.columns}
 
 
 def load_model(filename: str = None, load_latest: bool = None):
@@ -50,16 +46,10 @@ def load_model(filename: str = None, load_latest: bool = None):
 
 
 def predict_probabilities(clf, game_data):
-    X = np.vstack(
-        [
-            v
-            for k, v in game_data.items()
-            if k not in ["winner", "gameId", "playId", "time_remaining"]
-        ],
-    ).T
+    X = model_matrix(game_data, fitted_columns(clf, game_data))
 
     y_pred_prob = clf.predict_proba(X)
-    home_win_prob = y_pred_prob[:, 1]
+    home_win_prob = y_pred_prob[:, list(clf.classes_).index(1)]
 
     return home_win_prob
 
@@ -89,44 +79,79 @@ def plot_probabilities(
     pass
 
 
-def main(season, game_id):
-    assert isinstance(season, str)
-    season_year = f"{season}{int(season) + 1}"
-    assert isinstance(game_id, str)
-    full_game_id = season + game_id
+# figure and artists are created once per process and updated in place for every game rendered headlessly
+_chart = None
 
-    # load model
-    clf = load_model(load_latest=True)
 
-    # load game data
+def _init_chart():
+    global _chart
+
+    fig = plt.figure()
+    ax = fig.add_subplot(1, 1, 1)
+    (prob_line,) = ax.plot([], [], c="b")
+    ax.vlines([1200, 2400, 3600], colors="r", ymin=0, ymax=1, label="Period end")
+    home_goals = ax.vlines([], colors="g", ymin=0, ymax=1, label="Home goal")
+    away_goals = ax.vlines([], colors="y", ymin=0, ymax=1, label="Away goal")
+    ax.legend()
+    ax.set_ylim(0, 1)
+    title = fig.suptitle("")
+
+    _chart = {
+        "fig": fig,
+        "ax": ax,
+        "prob_line": prob_line,
+        "home_goals": home_goals,
+        "away_goals": away_goals,
+        "title": title,
+    }
+    return _chart
+
+
+def render_probabilities(
+    filenames,
+    probabilities,
+    time_remaining,
+    home_goal_times,
+    away_goal_times,
+    home_team_name,
+    away_team_name,
+    home_final_goals,
+    away_final_goals,
+):
+    # same chart as plot_probabilities but saved to each of filenames instead of shown, so no display is needed
+    assert len(probabilities) == len(time_remaining)
+    chart = _chart if _chart is not None else _init_chart()
+
+    timestamps = np.max(time_remaining) - np.asarray(time_remaining)
+    chart["prob_line"].set_data(timestamps, probabilities)
+    chart["home_goals"].set_segments([[(t, 0), (t, 1)] for t in home_goal_times])
+    chart["away_goals"].set_segments([[(t, 0), (t, 1)] for t in away_goal_times])
+    chart["title"].set_text(
+        f"{away_team_name} {away_final_goals} @ {home_team_name} {home_final_goals}"
+    )
+    chart["ax"].set_xlim(0, max(3600, timestamps.max()))
+
+    for filename in filenames:
+        chart["fig"].savefig(filename)
+
+
+def load_game_chart(season_year, full_game_id):
     game_directory_exists = os.path.isdir(
         os.path.join(os.path.dirname(__file__), "data", season_year, full_game_id)
     )
     if not game_directory_exists:
-        raise Exception(f"Game folder for {season_year} {game_id} does not exist.")
-    accumulated_data_exists = os.path.isfile(
-        os.path.join(
-            os.path.dirname(__file__),
-            "data",
-            season_year,
-            full_game_id,
-            "accumulated_data.csv",
-        )
+        raise Exception(f"Game folder for {season_year} {full_game_id} does not exist.")
+    accumulated_data_exists = has_accumulated_data(
+        os.path.join(os.path.dirname(__file__), "data", season_year, full_game_id)
     )
     if not accumulated_data_exists:
-        raise Exception(f"Accumulated data for {season_year} {game_id} does not exist.")
-    game_data = load_data(
-        filename=os.path.join(
-            os.path.dirname(__file__),
-            "data",
-            season_year,
-            full_game_id,
-            "accumulated_data.csv",
+        raise Exception(
+            f"Accumulated data for {season_year} {full_game_id} does not exist."
         )
+    game_data = load_data(
+        os.path.join(os.path.dirname(__file__), "data", season_year, full_game_id)
     )
 
-    probs = predict_probabilities(clf, game_data)
-
     if "time_remaining_neg" in game_data:
         time_remaining = game_data["time_remaining_neg"]
     elif "time_remaining" in game_data:
@@ -136,72 +161,158 @@ def main(season, game_id):
             "One of time_remaining_neg or time_remaining needs to be in game data."
         )
 
-    home_goal_times = [
-        3600 - t
-        for t, gd0, gd1 in zip(
-            game_data["time_remaining"][1:],
-            game_data["goal_differential"][:-1],
-            game_data["goal_differential"][1:],
-        )
-        if gd1 - gd0 == 1
-    ]
-    away_goal_times = [
-        3600 - t
-        for t, gd0, gd1 in zip(
-            game_data["time_remaining"][1:],
-            game_data["goal_differential"][:-1],
-            game_data["goal_differential"][1:],
-        )
-        if gd1 - gd0 == -1
-    ]
-
-    game_info_exists = bool(
-        len(
-            glob.glob(
-                os.path.join(
-                    os.path.dirname(__file__),
-                    "data",
-                    season_year,
-                    full_game_id,
-                    "*.txt",
-                )
-            )
-        )
+    game_info = get_game_info(season_year, full_game_id)
+    home_goal_times = [e for e, side in game_info["goals"] if side == "home"]
+    away_goal_times = [e for e, side in game_info["goals"] if side == "away"]
+
+    return {
+        "game_data": game_data,
+        "time_remaining": time_remaining,
+        "home_goal_times": home_goal_times,
+        "away_goal_times": away_goal_times,
+        "home_team_name": game_info["home_team"],
+        "away_team_name": game_info["away_team"],
+        "home_final_goals": game_info["home_goals"],
+        "away_final_goals": game_info["away_goals"],
+    }
+
+
+# model loaded once per worker process in _init_render_worker
+_worker_clf = None
+
+
+def _init_render_worker():
+    global _worker_clf
+
+    plt.switch_backend("Agg")
+    _worker_clf = load_model(load_latest=True)
+    _init_chart()
+
+
+def _render_game(season_year, full_game_id, output_folder, formats):
+    start = time.time()
+
+    chart_data = load_game_chart(season_year, full_game_id)
+    probs = predict_probabilities(_worker_clf, chart_data["game_data"])
+    render_probabilities(
+        [
+            os.path.join(output_folder, f"{full_game_id}.{file_format}")
+            for file_format in formats
+        ],
+        probs,
+        chart_data["time_remaining"],
+        chart_data["home_goal_times"],
+        chart_data["away_goal_times"],
+        chart_data["home_team_name"],
+        chart_data["away_team_name"],
+        chart_data["home_final_goals"],
+        chart_data["away_final_goals"],
     )
-    if not game_info_exists:
-        raise Exception("The info .txt file for this game does not exists")
-
-    game_info_filenames = glob.glob(
-        os.path.join(
-            os.path.dirname(__file__),
-            "data",
-            season_year,
-            full_game_id,
-            "*.txt",
+
+    end = time.time()
+    return full_game_id, end - start
+
+
+def render_season(season, output_folder=None, formats=("png",), max_workers=None):
+    # render every accumulated game of a season to files without a display, one figure reused per worker process
+    assert isinstance(season, str)
+    season_year = f"{season}{int(season) + 1}"
+    assert all(file_format in ["png", "svg"] for file_format in formats)
+
+    if output_folder is None:
+        output_folder = os.path.join(os.path.dirname(__file__), "charts", season_year)
+    if not os.path.isdir(output_folder):
+        os.makedirs(output_folder)
+
+    game_ids = sorted(
+        game_id
+        for game_id in load_game_index(season_year)
+        if has_accumulated_data(
+            os.path.join(os.path.dirname(__file__), "data", season_year, game_id)
         )
     )
-    assert (
-        len(game_info_filenames) == 1
-    ), "There should be only one .txt file in the folder"
-    game_info_filename = game_info_filenames[0]
-    game_info = Path(game_info_filename).stem
-    game_type, away_team_name, _, home_team_name = game_info.split("_")
-    home_team_name = home_team_name.replace("-", " ")
-    away_team_name = away_team_name.replace("-", " ")
+
+    start = time.time()
+    render_times = {}
+    with ProcessPoolExecutor(
+        max_workers=max_workers, initializer=_init_render_worker
+    ) as executor:
+        futures = [
+            executor.submit(
+                _render_game, season_year, game_id, output_folder, tuple(formats)
+            )
+            for game_id in game_ids
+        ]
+        for future in as_completed(futures):
+            game_id, render_time = future.result()
+            render_times[game_id] = render_time
+            instrumentation.add_time("game.render", render_time, game_id=game_id)
+            count("games.render")
+            progress(
+                f"Rendered gameId {game_id} in {render_time:.2f} seconds.",
+                game_id=game_id,
+            )
+    end = time.time()
+
+    progress(
+        f"Rendered {len(render_times)} games for {season_year} in {end - start:.2f} seconds."
+    )
+    return render_times
+
+
+def main(season, game_id):
+    assert isinstance(season, str)
+    season_year = f"{season}{int(season) + 1}"
+    assert isinstance(game_id, str)
+    full_game_id = season + game_id
+
+    # load model
+    clf = load_model(load_latest=True)
+
+    # load game data
+    chart_data = load_game_chart(season_year, full_game_id)
+
+    probs = predict_probabilities(clf, chart_data["game_data"])
 
     plot_probabilities(
         probs,
-        time_remaining,
-        home_goal_times,
-        away_goal_times,
-        home_team_name,
-        away_team_name,
-        len(home_goal_times),
-        len(away_goal_times),
+        chart_data["time_remaining"],
+        chart_data["home_goal_times"],
+        chart_data["away_goal_times"],
+        chart_data["home_team_name"],
+        chart_data["away_team_name"],
+        chart_data["home_final_goals"],
+        chart_data["away_final_goals"],
     )
 
 
 if __name__ == "__main__":
-    season = "2020"
-    game_id = "020088"
-    main(season, game_id)
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--season", type=str, default="2020")
+    parser.add_argument("--game-id", type=str, default="020088")
+    parser.add_argument(
+        "--render-season",
+        action="store_true",
+        help="save every game chart of the season without a display",
+    )
+    parser.add_argument("--output-folder", type=str, default=None)
+    parser.add_argument("--formats", nargs="+", default=["png"])
+    parser.add_argument("--workers", type=int, default=None)
+    instrumentation.add_arguments(parser)
+
+    args = parser.parse_args()
+    instrumentation.setup_from_args(args)
+
+    if args.render_season:
+        with stage("render", season=args.season):
+            render_season(
+                args.season,
+                output_folder=args.output_folder,
+                formats=args.formats,
+                max_workers=args.workers,
+            )
+        instrumentation.finish(args)
+    else:
+        main(args.season, args.game_id)